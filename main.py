@@ -1,9 +1,25 @@
-from typing import Any
+import json
+from functools import partial
+from typing import Any, Set, Union
 
-from server.middleware import MiddlewareHandler
+from server.middleware import (
+    MiddlewareHandler,
+    CoalescingMiddleware,
+    QueryStatsMiddleware,
+    RateLimitMiddleware,
+    UnitOfWorkMiddleware,
+)
 from server.response import Response, JSONResponse
 from server.request import Request
 from server.urlhandler import url_handler
+from server.metrics import metrics_handler
+from server.websocket import WebSocket, WebSocketHandler
+from server.sse import BroadcastHub, EventStreamResponse
+from server.batch import BatchHandler
+from server.cache import shared_cache
+from server.db.database import database
+from server.db.pagination import InvalidCursor, paginate_request
+from server.db.querycache import table_versions
 
 from models import ContactModel
 
@@ -23,7 +39,7 @@ def about_handler(request: Request) -> Response:
     return Response(body="<h1>About Us</h1><p>This is the about page.</p>", status=200)
 
 
-url_handler.get("/about", about_handler)
+url_handler.get("/about", about_handler, priority="high")
 
 
 def user_handler(request: Request, id: str) -> Response:
@@ -37,10 +53,50 @@ def user_handler(request: Request, id: str) -> Response:
 url_handler.get("/user/<id>", user_handler)
 
 
+# Clients subscribe here instead of polling /contacts
+contact_sockets: Set[WebSocket] = set()
+
+
+class ContactsSocket(WebSocketHandler):
+    def on_open(self, ws: WebSocket) -> None:
+        contact_sockets.add(ws)
+
+    def on_message(self, ws: WebSocket, message: Union[str, bytes]) -> None:
+        if message == "ping":
+            ws.send("pong")
+
+    def on_close(self, ws: WebSocket, code: int, reason: str) -> None:
+        contact_sockets.discard(ws)
+
+
+url_handler.websocket("/ws/contacts", ContactsSocket)
+
+
+# One-way alternative for browsers: text/event-stream subscribers
+contact_events: BroadcastHub = BroadcastHub("contacts")
+
+
+def contact_events_handler(request: Request) -> EventStreamResponse:
+    return EventStreamResponse(request, contact_events, retry=3000)
+
+
+url_handler.get("/events/contacts", contact_events_handler, priority="high")
+
+
+def notify_contacts(event: str, data: dict[str, Any]) -> None:
+    message = json.dumps({"event": event, **data})
+    for ws in list(contact_sockets):
+        ws.send(message)
+    contact_events.publish(data, event=event)
+
+
 # Contact CRUD Handlers
 def create_contact_handler(request: Request) -> JSONResponse:
     data: dict[str, Any] = request.data if request.data is not None else {}
     contact = ContactModel.objects.create(**data)
+    # Announce the contact only once it is committed
+    created = {"contact": contact.to_dict()}
+    database.on_commit(lambda: notify_contacts("created", created))
     return JSONResponse(
         data={"message": "Contact created successfully", "contact": contact.to_dict()},
         status=201,
@@ -51,14 +107,21 @@ def create_contact_handler(request: Request) -> JSONResponse:
 url_handler.post("/contact", create_contact_handler)
 
 
-def get_contact_handler(request: Request, id: int) -> JSONResponse:
+def get_contact_handler(request: Request, id: int) -> Union[Response, JSONResponse]:
+    # Serialized contacts are shared by all workers. The key carries the
+    # table version read before the query, so any committed write to the
+    # table (single-row, bulk or queryset) moves readers to fresh entries
+    version = table_versions.get(ContactModel.__tablename__)
+    key = f"contact:{version}:{id}"
+    cached = shared_cache.get(key)
+    if cached is not None:
+        return Response(body=cached.decode("utf-8"), status=200)
+
     contact = ContactModel.objects.get(id)
     if contact:
-        return JSONResponse(
-            data={"contact": contact.to_dict()},
-            status=200,
-            headers=[("Content-Type", "application/json")],
-        )
+        body = json.dumps({"contact": contact.to_dict()})
+        shared_cache.set(key, body.encode("utf-8"), ttl=60)
+        return Response(body=body, status=200)
     return JSONResponse(
         data={"error": "Contact not found"},
         status=404,
@@ -74,6 +137,8 @@ def update_contact_handler(request: Request, id: int) -> JSONResponse:
 
     contact = ContactModel.objects.update(id, **data)
     if contact:
+        updated = {"contact": contact.to_dict()}
+        database.on_commit(lambda: notify_contacts("updated", updated))
         return JSONResponse(
             data={
                 "message": "Contact updated successfully",
@@ -95,6 +160,7 @@ url_handler.put("/contact/<id>", update_contact_handler)
 def delete_contact_handler(request: Request, id: int) -> JSONResponse:
     deleted = ContactModel.objects.delete(id)
     if deleted:
+        database.on_commit(lambda: notify_contacts("deleted", {"id": id}))
         return JSONResponse(
             data={"message": "Contact deleted successfully"},
             status=200,
@@ -111,16 +177,24 @@ url_handler.delete("/contact/<id>", delete_contact_handler)
 
 
 def list_contacts_handler(request: Request) -> JSONResponse:
-    contacts = ContactModel.objects.all()
-    contacts_list = [contact.to_dict() for contact in contacts]
+    # One page per request (?limit=&cursor=), read with an index seek however
+    # deep it is; rows come back as dicts, no ORM instances
+    try:
+        page = paginate_request(request, ContactModel.objects.values().order_by("id"))
+    except InvalidCursor as e:
+        return JSONResponse(
+            data={"error": str(e)},
+            status=400,
+            headers=[("Content-Type", "application/json")],
+        )
     return JSONResponse(
-        data={"contacts": contacts_list},
+        data={"contacts": page.items, "next": page.next_cursor},
         status=200,
         headers=[("Content-Type", "application/json")],
     )
 
 
-url_handler.get("/contacts", list_contacts_handler)
+url_handler.get("/contacts", list_contacts_handler, priority="low", max_concurrency=4)
 
 
 def user_update_handler(request: Request, id: str) -> JSONResponse:
@@ -142,6 +216,10 @@ def user_update_handler(request: Request, id: str) -> JSONResponse:
 url_handler.put("/user/<id>/update", user_update_handler)
 
 
+# Many sub-requests in one round trip, see server.batch.BatchHandler
+url_handler.post("/batch", BatchHandler(url_handler, max_items=20, max_concurrency=8))
+
+
 def user_partial_update_handler(request: Request, id: str) -> JSONResponse:
 
     data = request.data
@@ -198,6 +276,8 @@ def get_double_param_check_handler(
 
 url_handler.get("/double/<number>/<name>", get_double_param_check_handler)
 
+url_handler.get("/metrics", metrics_handler, priority="high")
+
 
 class ResponseTimeMiddleware(MiddlewareHandler):
     def __init__(self, app: Any) -> None:
@@ -217,7 +297,106 @@ class ResponseTimeMiddleware(MiddlewareHandler):
 middlewares = [
     MiddlewareHandler,
     ResponseTimeMiddleware,
+    # Token buckets per client and per route, shared by all worker processes
+    partial(
+        RateLimitMiddleware,
+        rate=50.0,
+        burst=100,
+        routes={
+            "POST /contact": {"rate": 5.0, "burst": 10},
+            "/batch": {"rate": 5.0, "burst": 10},
+        },
+    ),
+    # Identical concurrent GETs share one execution of the handler
+    partial(CoalescingMiddleware, timeout=10.0),
+    # SQL statement count and time per request, outside the commit below
+    QueryStatsMiddleware,
+    # One database session and one commit per request
+    UnitOfWorkMiddleware,
 ]
 
 
 USE_SQLITE = True
+
+# SQLite tuning applied on every connection; unset keys keep the defaults in
+# server.db.database.DEFAULT_SQLITE_PROFILE
+SQLITE = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "mmap_size": 256 * 1024 * 1024,
+    "pool": "queue",
+    "pool_size": 16,
+    # True: writes go through one writer thread with group commit, reads use
+    # read-only pooled connections (each write commits on its own, outside
+    # the request's unit of work)
+    "single_writer": False,
+}
+
+# SQL instrumentation, see server.db.instrumentation.DEFAULT_QUERY_LOG: slow
+# statements are printed with their query plan, and a statement repeated
+# n_plus_one times in one request is flagged
+QUERY_LOG = {
+    "slow_query_ms": 100.0,
+    "n_plus_one": 5,
+}
+
+# Load shedding thresholds, see server.admission.AdmissionController
+ADMISSION = {
+    "max_in_flight": 64,
+    "max_queue": 128,
+    "target": 0.05,
+    "interval": 0.1,
+    "retry_after": 1,
+}
+
+# Worker slots shared by all routes, see server.scheduler.RequestScheduler
+SCHEDULER = {
+    "workers": 32,
+    "max_waiting": 256,
+}
+
+# Per-phase connection timeouts in seconds, see server.connection.ConnectionTimeouts
+TIMEOUTS = {
+    "handshake": 10.0,
+    "header": 10.0,
+    "body": 30.0,
+    "keepalive": 5.0,
+    "write": 30.0,
+    "min_body_rate": 1024,
+}
+
+# Worker processes, see server.supervisor.Supervisor. "workers": 0 runs the
+# server in this process without supervision.
+SUPERVISOR = {
+    "workers": 0,
+    "max_requests": 10000,
+    "max_requests_jitter": 1000,
+    "max_rss_mb": 512,
+    "hard_timeout": 60,
+}
+
+LISTENERS = {
+    # e.g. ["127.0.0.1:8000", "unix:/tmp/web-server.sock"]; defaults to host:port
+    "binds": None,
+    "options": {
+        "backlog": 128,
+        "nodelay": True,
+        "reuseport": False,
+        "defer_accept": 0,
+    },
+}
+
+# TLS termination, see server.tls.create_ssl_context. Enabled when certfile is set.
+TLS = {
+    "certfile": None,
+    "keyfile": None,
+    "minimum_version": "TLSv1.2",
+    "session_tickets": 2,
+}
+
+# Pipelined GET/HEAD/OPTIONS requests on one connection run concurrently, at
+# most max_pipeline at a time; responses are still sent in request order.
+PIPELINING = {
+    "max_pipeline": 8,
+}
@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+from typing import Callable, List, Tuple
+
+
+def measure(func: Callable[[int], None], repeat: int) -> float:
+    """Average seconds per call of func(i) over repeat calls"""
+    start = time.perf_counter()
+    for i in range(repeat):
+        func(i)
+    return (time.perf_counter() - start) / repeat
+
+
+def run_benchmark(rows: int, repeat: int) -> List[Tuple[str, float, float]]:
+    """
+    Time the ORM path against the Core fast path of ContactModel.objects on a
+    scratch SQLite database. Returns (operation, orm seconds, core seconds).
+    """
+    from server.db.database import Base, database
+    from models import ContactModel
+
+    manager = ContactModel.objects
+    # Measure the queries themselves, not query cache hits
+    manager.cache = None
+    Base.metadata.create_all(database.engine)
+    manager.bulk_create(
+        {"name": f"name {i}", "email": f"user{i}@example.com", "message": "hello"}
+        for i in range(rows)
+    )
+
+    def ids(i: int) -> int:
+        return i % rows + 1
+
+    fields = {"name": "bench", "email": "bench@example.com", "message": "hello"}
+    page = manager.all()[:100]
+    return [
+        (
+            "get by primary key",
+            measure(lambda i: manager.get(ids(i)).to_dict(), repeat),
+            measure(lambda i: manager.get_row(ids(i)), repeat),
+        ),
+        (
+            "insert one row",
+            measure(lambda i: manager.create(**fields).to_dict(), repeat),
+            measure(lambda i: manager.insert_returning(**fields), repeat),
+        ),
+        (
+            "list 100 rows",
+            measure(lambda i: [contact.to_dict() for contact in page._clone()], repeat),
+            measure(lambda i: list(page.values()), repeat),
+        ),
+    ]
+
+
+def benchmark():
+    """Compare ORM and Core fast-path latencies of common model operations"""
+    parser = argparse.ArgumentParser(prog=f"{sys.argv[0]} benchmark")
+    parser.add_argument("--rows", type=int, default=1000, help="rows to seed")
+    parser.add_argument("--repeat", type=int, default=2000, help="calls per operation")
+    options = parser.parse_args(sys.argv[2:])
+
+    from server.db.database import database
+
+    # A scratch database, so the benchmark never writes to the real one
+    directory = tempfile.mkdtemp(prefix="benchmark-")
+    database.use_sqlite = True
+    database.db_file = os.path.join(directory, "benchmark.db")
+    try:
+        results = run_benchmark(options.rows, options.repeat)
+    finally:
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+    print(f"{'operation':<22}{'orm (us)':>12}{'core (us)':>12}{'speedup':>10}")
+    for operation, orm, core in results:
+        print(f"{operation:<22}{orm * 1e6:>12.1f}{core * 1e6:>12.1f}{orm / core:>9.1f}x")
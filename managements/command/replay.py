@@ -0,0 +1,177 @@
+import sys
+import json
+import time
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from server.capture import load_capture
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Return the pct-th percentile of values (nearest-rank)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(latencies: Dict[str, List[float]]) -> Dict[str, Dict[str, float]]:
+    """Summarize per-route latencies (seconds) into count/p50/p95/p99/max"""
+    summary = {}
+    for route, values in sorted(latencies.items()):
+        summary[route] = {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": max(values) if values else 0.0,
+        }
+    return summary
+
+
+def send_record(host: str, port: int, record: Dict[str, Any], timeout: float):
+    """Send one captured request and return (status, latency in seconds)"""
+    target = record["path"]
+    if record.get("query"):
+        target += "?" + record["query"]
+
+    headers = {name: value for name, value in record.get("headers", [])}
+    headers.pop("Content-Length", None)
+    headers["Connection"] = "close"
+
+    conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    start = time.perf_counter()
+    try:
+        conn.request(record["method"], target, body=record["body"] or None, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status, time.perf_counter() - start
+    except (OSError, http.client.HTTPException):
+        return 0, time.perf_counter() - start
+    finally:
+        conn.close()
+
+
+def run_replay(
+    records: List[Dict[str, Any]],
+    host: str,
+    port: int,
+    speed: Optional[float],
+    concurrency: int,
+    timeout: float,
+) -> Dict[str, Any]:
+    """
+    Replay records against host:port.
+
+    With a speed factor the original inter-arrival gaps are divided by it (1.0 is
+    real time); with speed None requests are sent as fast as `concurrency` allows.
+    """
+    latencies: Dict[str, List[float]] = {}
+    errors = 0
+    mismatches = 0
+    lock = threading.Lock()
+
+    def worker(record: Dict[str, Any]) -> None:
+        nonlocal errors, mismatches
+        status, latency = send_record(host, port, record, timeout)
+        route = f"{record['method']} {record['path']}"
+        with lock:
+            latencies.setdefault(route, []).append(latency)
+            if status == 0:
+                errors += 1
+            elif record.get("status") and str(status) != record["status"]:
+                mismatches += 1
+
+    # The schedule below sends in list order, so it must be arrival order
+    records = sorted(records, key=lambda record: record.get("t", 0.0))
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for record in records:
+            if speed:
+                # Open-loop schedule: keep the captured arrival pattern
+                delay = record["t"] / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            pool.submit(worker, record)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(records),
+        "errors": errors,
+        "status_mismatches": mismatches,
+        "elapsed": elapsed,
+        "routes": summarize(latencies),
+    }
+
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    print(
+        f"Replayed {report['requests']} requests in {report['elapsed']:.2f}s "
+        f"({report['errors']} errors, {report['status_mismatches']} status mismatches)"
+    )
+    header = f"{'route':<40} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    if baseline:
+        header += f" {'Δp50':>9} {'Δp95':>9} {'Δp99':>9}"
+    print(header)
+
+    base_routes = baseline["routes"] if baseline else {}
+    for route, stats in report["routes"].items():
+        line = (
+            f"{route:<40} {stats['count']:>6} {stats['p50'] * 1000:>9.2f} "
+            f"{stats['p95'] * 1000:>9.2f} {stats['p99'] * 1000:>9.2f}"
+        )
+        if baseline:
+            before = base_routes.get(route)
+            for key in ("p50", "p95", "p99"):
+                if before and before[key]:
+                    change = (stats[key] - before[key]) / before[key] * 100
+                    line += f" {change:>+8.1f}%"
+                else:
+                    line += f" {'n/a':>9}"
+        print(line)
+
+
+def replay() -> None:
+    """Replay a traffic capture against a running server"""
+    parser = argparse.ArgumentParser(prog="manage.py replay")
+    parser.add_argument("capture", help="capture file written by CaptureMiddleware")
+    parser.add_argument("--target", default="http://127.0.0.1:8000")
+    parser.add_argument(
+        "--speed",
+        default="1",
+        help="time scale for the captured arrival gaps (e.g. 1, 2.5) or 'max'",
+    )
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="JSON report of a previous build to diff against")
+    args = parser.parse_args(sys.argv[2:])
+
+    target = urlsplit(args.target)
+    host = target.hostname or "127.0.0.1"
+    port = target.port or 80
+    speed = None if args.speed == "max" else float(args.speed)
+
+    records = list(load_capture(args.capture))
+    if not records:
+        print(f"No requests found in {args.capture}")
+        sys.exit(1)
+
+    report = run_replay(records, host, port, speed, args.concurrency, args.timeout)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
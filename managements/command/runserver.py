@@ -2,19 +2,91 @@ from server.server import Server
 from server.reloader import start_with_reloader
 from wsgi import app
 from server.middleware import apply_middlewares
+from server.admission import AdmissionController
+from server.scheduler import RequestScheduler
+from server.connection import ConnectionTimeouts
+from server.supervisor import Supervisor
+from server.listeners import SocketOptions
+from server.tls import create_ssl_context
+from typing import Any, List, Optional
 
 try:
     from main import middlewares
 except ImportError:
     middlewares = []
 
+try:
+    from main import ADMISSION
+except ImportError:
+    ADMISSION = {}
+
+try:
+    from main import SCHEDULER
+except ImportError:
+    SCHEDULER = {}
+
+try:
+    from main import TIMEOUTS
+except ImportError:
+    TIMEOUTS = {}
+
+try:
+    from main import SUPERVISOR
+except ImportError:
+    SUPERVISOR = {}
+
+try:
+    from main import LISTENERS
+except ImportError:
+    LISTENERS = {}
+
+try:
+    from main import TLS
+except ImportError:
+    TLS = {}
+
+try:
+    from main import PIPELINING
+except ImportError:
+    PIPELINING = {}
+
 
 @start_with_reloader
-def runserver(host: str = "127.0.0.1", port: int = 8000) -> None:
+def runserver(
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    binds: Optional[List[str]] = None,
+    certfile: Optional[str] = None,
+    keyfile: Optional[str] = None,
+    **socket_options: Any,
+) -> None:
     def wsgi_app(environ, start_response):
         def start_response_wrapper(status, headers, exc_info=None):
             return start_response(status, headers)
 
         return app(environ, start_response_wrapper)
 
-    Server(apply_middlewares(wsgi_app, middlewares), host=host, port=port).run()
+    tls: dict = dict(TLS)
+    if certfile:
+        tls.update(certfile=certfile, keyfile=keyfile)
+    ssl_context = create_ssl_context(**tls) if tls.get("certfile") else None
+
+    server = Server(
+        apply_middlewares(wsgi_app, middlewares),
+        host=host,
+        port=port,
+        admission=AdmissionController(**ADMISSION),
+        scheduler=RequestScheduler(**SCHEDULER),
+        timeouts=ConnectionTimeouts(**TIMEOUTS),
+        binds=binds or LISTENERS.get("binds"),
+        socket_options=SocketOptions(
+            **{**LISTENERS.get("options", {}), **socket_options}
+        ),
+        ssl_context=ssl_context,
+        max_pipeline=PIPELINING.get("max_pipeline", 8),
+    )
+
+    if SUPERVISOR.get("workers", 0) > 0:
+        Supervisor(server, **SUPERVISOR).run()
+    else:
+        server.run()
@@ -1,4 +1,5 @@
 import sys
+import argparse
 import importlib
 import pkgutil
 from typing import List, Callable, Dict
@@ -36,7 +37,8 @@ class ExecuteCommand:
 
         _run_server():
             Special handler for the 'runserver' command.
-            Dynamically imports and runs the server with optional host and port arguments.
+            Dynamically imports and runs the server with optional host and port arguments,
+            extra --bind listeners, listening socket options and TLS certificate.
             Prints an error and exits if the run_server function is not found or not callable.
     """
 
@@ -51,10 +53,44 @@ class ExecuteCommand:
         run_server = getattr(
             importlib.import_module("managements.command.runserver"), "runserver", None
         )
-        host: str = self.args[2] if len(self.args) > 2 else "127.0.0.1"
-        port: int = int(self.args[3]) if len(self.args) > 3 else 8000
+        parser = argparse.ArgumentParser(prog=f"{self.args[0]} runserver")
+        parser.add_argument("host", nargs="?", default="127.0.0.1")
+        parser.add_argument("port", nargs="?", type=int, default=8000)
+        parser.add_argument(
+            "--bind",
+            action="append",
+            dest="binds",
+            help='listener to serve on: "host:port", "unix:/path" or "fd://N" (repeatable)',
+        )
+        parser.add_argument("--backlog", type=int, help="kernel accept queue length")
+        parser.add_argument(
+            "--nodelay",
+            action=argparse.BooleanOptionalAction,
+            default=None,
+            help="set TCP_NODELAY on accepted connections",
+        )
+        parser.add_argument(
+            "--reuseport", action="store_true", default=None, help="set SO_REUSEPORT"
+        )
+        parser.add_argument(
+            "--defer-accept", type=int, help="TCP_DEFER_ACCEPT seconds (Linux)"
+        )
+        parser.add_argument("--rcvbuf", type=int, help="SO_RCVBUF in bytes")
+        parser.add_argument("--sndbuf", type=int, help="SO_SNDBUF in bytes")
+        parser.add_argument(
+            "--unix-mode",
+            type=lambda value: int(value, 8),
+            help="octal permissions of Unix socket files, e.g. 660",
+        )
+        parser.add_argument("--certfile", help="PEM certificate chain; enables TLS")
+        parser.add_argument("--keyfile", help="PEM private key for --certfile")
+        options = vars(parser.parse_args(self.args[2:]))
+        host: str = options.pop("host")
+        port: int = options.pop("port")
+        # Only pass what was given so main.py settings keep their effect
+        options = {key: value for key, value in options.items() if value is not None}
         if callable(run_server):
-            run_server(host, port)
+            run_server(host, port, **options)
         else:
             print("Error: run_server is not defined or not callable.")
             sys.exit(1)
@@ -5,6 +5,8 @@ from sqlalchemy import Column, String
 class ContactModel(Model):
 
     __tablename__ = "contacts"
+    # Cache up to 1024 query results, invalidated by writes to contacts
+    __query_cache__ = 1024
 
     name = Column(String, nullable=False)
     email = Column(String, nullable=False)
@@ -0,0 +1,115 @@
+import threading
+import time
+from typing import Optional
+
+from server.metrics import metrics
+
+
+class AdmissionController:
+    """
+    AdmissionController decides whether the server takes on a new connection or
+    sheds it with a fast `503 Service Unavailable`.
+
+    Two checks are applied:
+        - Capacity: on accept, a connection is rejected when the number of
+          in-flight requests or queued connections is already at its limit.
+        - Queueing delay (CoDel-style): when a worker picks a connection up, the
+          time it spent waiting is compared with `target`. If waiting times have
+          not dropped below `target` during the last `interval`, the server is
+          considered overloaded and anything that waited longer than `target`
+          is shed; otherwise up to `interval` of waiting is tolerated.
+
+    Shedding happens before the request body is parsed or the WSGI app is
+    called, using a response encoded once at construction time.
+
+    Attributes:
+        max_in_flight (int): Maximum number of requests being processed at once.
+        max_queue (int): Maximum number of accepted connections waiting for a worker.
+        target (float): Acceptable queueing delay in seconds.
+        interval (float): Window in seconds used to detect a standing queue.
+        retry_after (int): Value of the `Retry-After` header in seconds.
+        in_flight (int): Requests currently being processed.
+        queued (int): Connections accepted but not yet picked up.
+        shed_response (bytes): Pre-encoded 503 response.
+
+    Methods:
+        try_enqueue() -> Optional[float]:
+            Called on accept. Returns the enqueue timestamp, or None to shed.
+
+        start(enqueued_at) -> bool:
+            Called when a worker picks the connection up. Returns False to shed.
+
+        finish():
+            Called when the request has been answered.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 64,
+        max_queue: int = 128,
+        target: float = 0.05,
+        interval: float = 0.1,
+        retry_after: int = 1,
+    ) -> None:
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.target = target
+        self.interval = interval
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.queued = 0
+        self._last_below_target = time.monotonic()
+        self._lock = threading.Lock()
+        self.shed_response: bytes = (
+            "HTTP/1.1 503 Service Unavailable\r\n"
+            f"Retry-After: {retry_after}\r\n"
+            "Content-Type: text/plain\r\n"
+            "Content-Length: 0\r\n"
+            "Connection: close\r\n"
+            "\r\n"
+        ).encode("ascii")
+
+        metrics.gauge("admission.in_flight", lambda: self.in_flight)
+        metrics.gauge("admission.queued", lambda: self.queued)
+
+    def try_enqueue(self) -> Optional[float]:
+        with self._lock:
+            if (
+                self.queued >= self.max_queue
+                or self.in_flight + self.queued >= self.max_in_flight + self.max_queue
+            ):
+                over_capacity = True
+            else:
+                over_capacity = False
+                self.queued += 1
+        if over_capacity:
+            metrics.incr("admission.shed.capacity")
+            return None
+        return time.monotonic()
+
+    def start(self, enqueued_at: float) -> bool:
+        now = time.monotonic()
+        sojourn = now - enqueued_at
+        with self._lock:
+            self.queued -= 1
+            if sojourn < self.target:
+                self._last_below_target = now
+            overloaded = now - self._last_below_target > self.interval
+            max_wait = self.target if overloaded else self.interval
+            if sojourn > max_wait:
+                reason = "queue_delay"
+            elif self.in_flight >= self.max_in_flight:
+                reason = "capacity"
+            else:
+                reason = None
+                self.in_flight += 1
+        metrics.observe("admission.queue_delay", sojourn)
+        if reason is not None:
+            metrics.incr(f"admission.shed.{reason}")
+            return False
+        metrics.incr("admission.admitted")
+        return True
+
+    def finish(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
@@ -0,0 +1,210 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
+
+from server.metrics import metrics
+from server.request import Request
+from server.response import JSONResponse
+from server.urlhandler import UrlHandler, url_handler as default_url_handler
+
+
+# Sub-requests with these methods may run in parallel with each other
+PARALLEL_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class BatchHandler:
+    """
+    BatchHandler serves many sub-requests in one HTTP round trip.
+
+    The request body is a JSON array of sub-requests, or an object with a
+    "requests" array:
+
+        [{"method": "GET", "path": "/contact/1"},
+         {"method": "PUT", "path": "/contact/2", "body": {"name": "Ann"},
+          "headers": {"Content-Type": "application/json"}}]
+
+    Each sub-request is routed through UrlHandler.handle_request and answered
+    with its own status, headers and body, in the same order:
+
+        {"responses": [{"status": 200, "headers": {...}, "body": {...}}, ...]}
+
+    Consecutive GET/HEAD/OPTIONS items run in parallel on a shared thread pool;
+    any other method is a barrier that runs alone, after everything before it
+    and before everything after it, so writes keep their order. Sub-requests do
+    not go through the server's RequestScheduler again: the batch already holds
+    a worker slot and waiting for more from inside it could deadlock.
+
+    Attributes:
+        url_handler (UrlHandler): Router used for sub-requests.
+        max_items (int): Largest number of sub-requests per batch.
+        max_request_bytes (int): Largest accepted batch body.
+        max_response_bytes (int): Budget for the combined sub-response bodies.
+        max_concurrency (int): Sub-requests of one batch running at once.
+        timeout (float): Seconds a batch may take; unfinished items get 504.
+
+    Methods:
+        __call__(request) -> JSONResponse:
+            Route handler for the batch endpoint.
+
+        run(items) -> List[Dict[str, Any]]:
+            Executes parsed sub-requests and returns their results in order.
+    """
+
+    def __init__(
+        self,
+        url_handler: Optional[UrlHandler] = None,
+        path: str = "/batch",
+        max_items: int = 20,
+        max_request_bytes: int = 256 * 1024,
+        max_response_bytes: int = 4 * 1024 * 1024,
+        max_concurrency: int = 8,
+        workers: int = 32,
+        timeout: float = 30.0,
+    ) -> None:
+        self.url_handler = url_handler or default_url_handler
+        self.path = path
+        self.max_items = max_items
+        self.max_request_bytes = max_request_bytes
+        self.max_response_bytes = max_response_bytes
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="batch"
+        )
+
+    def __call__(self, request: Request) -> JSONResponse:
+        if len(request.body or b"") > self.max_request_bytes:
+            return self._error(413, f"Batch body exceeds {self.max_request_bytes} bytes")
+        try:
+            payload = json.loads(request.body or b"null")
+        except ValueError:
+            return self._error(400, "Batch body must be JSON")
+
+        items = payload.get("requests") if isinstance(payload, dict) else payload
+        if not isinstance(items, list) or not items:
+            return self._error(400, "Expected a non-empty array of requests")
+        if len(items) > self.max_items:
+            return self._error(413, f"At most {self.max_items} requests per batch")
+
+        metrics.incr("batch.requests")
+        metrics.incr("batch.items", len(items))
+        return JSONResponse(data={"responses": self.run(items)}, status=200)
+
+    def run(self, items: List[Any]) -> List[Dict[str, Any]]:
+        results: List[Dict[str, Any]] = [{}] * len(items)
+        budget = [self.max_response_bytes]
+        deadline = time.monotonic() + self.timeout
+
+        # Runs of parallel-safe items form one group; every other item is alone
+        groups: List[Tuple[bool, List[int]]] = []
+        for index, item in enumerate(items):
+            parallel = self._method(item) in PARALLEL_METHODS
+            if parallel and groups and groups[-1][0]:
+                groups[-1][1].append(index)
+            else:
+                groups.append((parallel, [index]))
+
+        for _, group in groups:
+            for start in range(0, len(group), self.max_concurrency):
+                chunk = group[start : start + self.max_concurrency]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    for index in chunk:
+                        results[index] = self._item_error(504, "Batch timed out")
+                    continue
+                if len(chunk) == 1:
+                    results[chunk[0]] = self._run_item(items[chunk[0]], budget)
+                    continue
+                futures = {
+                    self._executor.submit(self._run_item, items[index], budget): index
+                    for index in chunk
+                }
+                done, pending = wait(futures, timeout=remaining)
+                for future in done:
+                    results[futures[future]] = future.result()
+                for future in pending:
+                    future.cancel()
+                    results[futures[future]] = self._item_error(504, "Batch timed out")
+
+        return results
+
+    def _method(self, item: Any) -> str:
+        return str(item.get("method", "GET")).upper() if isinstance(item, dict) else ""
+
+    def _run_item(self, item: Any, budget: List[int]) -> Dict[str, Any]:
+        if not isinstance(item, dict) or not isinstance(item.get("path"), str):
+            return self._item_error(400, "Each request needs a path")
+
+        method = self._method(item)
+        full_path: str = item["path"]
+        path = full_path.split("?", 1)[0]
+        if path == self.path:
+            return self._item_error(400, "Batches cannot be nested")
+
+        headers: List[Tuple[str, str]] = [
+            (str(name).upper().replace("-", "_"), str(value))
+            for name, value in (item.get("headers") or {}).items()
+        ]
+        body = item.get("body")
+        data = body if isinstance(body, dict) else None
+        if body is None:
+            raw = b""
+        elif isinstance(body, str):
+            raw = body.encode("utf-8")
+        else:
+            raw = json.dumps(body).encode("utf-8")
+
+        sub_request = Request(method=method, path=full_path, headers=headers, body=raw, data=data)
+        response = self.url_handler.handle_request(path, sub_request, method)
+        if hasattr(response, "upgrade"):
+            return self._item_error(400, "Streaming endpoints cannot be batched")
+        status, response_headers, content = self._render(response)
+
+        # Budget shared by the whole batch; the check is approximate under parallelism
+        budget[0] -= len(content)
+        if budget[0] < 0:
+            return self._item_error(507, "Batch response size limit exceeded")
+
+        content_type = dict((name.lower(), value) for name, value in response_headers).get(
+            "content-type", ""
+        )
+        decoded: Any = content.decode("utf-8", errors="replace")
+        if "application/json" in content_type and decoded:
+            try:
+                decoded = json.loads(decoded)
+            except ValueError:
+                pass
+        return {
+            "status": status,
+            "headers": {
+                name: value
+                for name, value in response_headers
+                if name.lower() not in ("content-length", "connection")
+            },
+            "body": decoded,
+        }
+
+    def _render(self, response: Any) -> Tuple[int, List[Tuple[str, str]], bytes]:
+        """Run a response object through its WSGI conversion and collect the result"""
+        captured: List[Any] = []
+
+        def start_response(status: Any, headers: List[Tuple[str, str]], exc_info: Any = None) -> None:
+            captured.extend([status, headers])
+
+        if hasattr(response, "to_wsgi_response"):
+            chunks = response.to_wsgi_response(start_response)
+        else:
+            chunks = response.to_wsgi(start_response=start_response)
+        content = b"".join(
+            chunk if isinstance(chunk, (bytes, bytearray)) else str(chunk).encode("utf-8")
+            for chunk in chunks
+        )
+        status = int(str(captured[0]).split(" ", 1)[0]) if captured else 500
+        return status, list(captured[1]) if captured else [], content
+
+    def _item_error(self, status: int, message: str) -> Dict[str, Any]:
+        return {"status": status, "headers": {}, "body": {"error": message}}
+
+    def _error(self, status: int, message: str) -> JSONResponse:
+        return JSONResponse(data={"error": message}, status=status)
@@ -0,0 +1,135 @@
+import struct
+import time
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from server.metrics import metrics
+from server.shm import SharedTable, key_hash
+
+
+# (slot size in bytes, number of slots) per size class: about 22 MiB of
+# address space, only touched pages take memory
+DEFAULT_SIZE_CLASSES: Tuple[Tuple[int, int], ...] = (
+    (512, 4096),
+    (4096, 1024),
+    (32 * 1024, 256),
+    (256 * 1024, 32),
+)
+
+
+class SharedCache:
+    """
+    SharedCache is a key/value cache of bytes shared by all worker processes on a host.
+
+    Values are stored in shared-memory slabs: one SharedTable per size class,
+    each with fixed-size slots, and a value goes to the smallest class it fits.
+    Values larger than the biggest slot are not cached. Every entry has an
+    optional time to live; when a slot group is full the least recently read
+    or written entry is evicted, which approximates LRU without global state.
+
+    Locks are held only to find a slot and copy the bytes in or out. The cache
+    must be created before the supervisor forks (the module-level
+    `shared_cache` is, since main.py imports it), otherwise each worker gets a
+    private copy.
+
+    Attributes:
+        tables (List[Tuple[int, SharedTable]]): Slab tables by slot size, smallest first.
+        default_ttl (Optional[float]): Seconds an entry lives when set() gets no ttl.
+        max_value (int): Largest value that can be cached.
+
+    Methods:
+        get(key) -> Optional[bytes]:
+            Returns the cached value, or None if missing or expired.
+
+        set(key, value, ttl=None) -> bool:
+            Stores value. Returns False if it is too large to cache.
+
+        delete(key) -> bool:
+            Removes key. Returns False if it was not cached.
+
+        get_or_set(key, func, ttl=None) -> bytes:
+            Returns the cached value, computing and storing it with func() on a miss.
+    """
+
+    RECORD = struct.Struct("<dI")
+
+    def __init__(
+        self,
+        size_classes: Sequence[Tuple[int, int]] = DEFAULT_SIZE_CLASSES,
+        default_ttl: Optional[float] = None,
+        probes: int = 8,
+        stripes: int = 64,
+    ) -> None:
+        self.tables: List[Tuple[int, SharedTable]] = [
+            (size, SharedTable(slots, self.RECORD, probes, stripes, payload=size))
+            for size, slots in sorted(size_classes)
+        ]
+        self.default_ttl = default_ttl
+        self.max_value = self.tables[-1][0] if self.tables else 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        hashed = key_hash(key)
+        for _, table in self.tables:
+            value = self._get(table, hashed)
+            if value is not None:
+                metrics.incr("cache.hits")
+                return value
+        metrics.incr("cache.misses")
+        return None
+
+    def _get(self, table: SharedTable, hashed: int) -> Optional[bytes]:
+        now = time.monotonic()
+        with table._lock(hashed):
+            offset = table._find(hashed)
+            if offset < 0:
+                return None
+            start = offset + table.HEADER.size
+            expires, length = self.RECORD.unpack_from(table._memory, start)
+            if expires and expires <= now:
+                table.HEADER.pack_into(table._memory, offset, 0, 0.0)
+                return None
+            table.HEADER.pack_into(table._memory, offset, hashed, now)
+            start += self.RECORD.size
+            return table._memory[start : start + length]
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> bool:
+        size = len(value)
+        if size > self.max_value:
+            metrics.incr("cache.too_large")
+            return False
+
+        hashed = key_hash(key)
+        now = time.monotonic()
+        ttl = self.default_ttl if ttl is None else ttl
+        expires = now + ttl if ttl else 0.0
+        target = next(table for slot_size, table in self.tables if size <= slot_size)
+        with target._lock(hashed):
+            offset, _ = target._slot(hashed, now)
+            start = offset + target.HEADER.size
+            self.RECORD.pack_into(target._memory, start, expires, size)
+            start += self.RECORD.size
+            target._memory[start : start + size] = value
+        # A previous value of another size may sit in another class
+        for _, table in self.tables:
+            if table is not target:
+                table._free(hashed)
+        metrics.incr("cache.sets")
+        return True
+
+    def delete(self, key: str) -> bool:
+        hashed = key_hash(key)
+        deleted = False
+        for _, table in self.tables:
+            deleted = table._free(hashed) or deleted
+        return deleted
+
+    def get_or_set(
+        self, key: str, func: Callable[[], bytes], ttl: Optional[float] = None
+    ) -> bytes:
+        value = self.get(key)
+        if value is None:
+            value = func()
+            self.set(key, value, ttl)
+        return value
+
+
+shared_cache: SharedCache = SharedCache()
@@ -0,0 +1,164 @@
+import base64
+import json
+import queue
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+CAPTURE_FORMAT_VERSION = 1
+
+
+class CaptureMiddleware:
+    """
+    CaptureMiddleware records a sample of live requests to an NDJSON file so they
+    can be replayed later with `python manage.py replay`.
+
+    Each captured line holds the request method, path, query string, headers,
+    body (base64), response status, handler duration and the arrival offset
+    relative to the start of the capture. Records are handed to a background
+    writer thread through a bounded queue; when the queue is full the record is
+    dropped instead of slowing the request down.
+
+    Attributes:
+        app (Callable): The WSGI application to be wrapped.
+        path (str): File the capture is appended to.
+        sample_rate (float): Fraction of requests to record (0.0 - 1.0).
+        max_body (int): Bodies larger than this are truncated in the capture.
+        captured (int): Number of records written.
+        dropped (int): Number of sampled records dropped because the queue was full.
+
+    Methods:
+        __call__(environ, start_response):
+            Runs the wrapped app and enqueues a record for sampled requests.
+
+        close():
+            Flushes pending records and stops the writer thread.
+    """
+
+    def __init__(
+        self,
+        app: Callable,
+        path: str = "capture.ndjson",
+        sample_rate: float = 1.0,
+        max_body: int = 64 * 1024,
+        max_queue: int = 10000,
+    ) -> None:
+        self.app = app
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_body = max_body
+        self.captured = 0
+        self.dropped = 0
+        self._started = time.monotonic()
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(
+            maxsize=max_queue
+        )
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def __call__(self, environ: dict, start_response: Callable) -> Any:
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return self.app(environ, start_response)
+
+        arrived = time.monotonic()
+        status_holder = {}
+
+        def capture_start_response(status, headers, exc_info=None):
+            status_holder["status"] = status
+            return start_response(status, headers, exc_info)
+
+        body = self._read_body(environ)
+        response_body = self.app(environ, capture_start_response)
+
+        record = {
+            "t": round(arrived - self._started, 6),
+            "method": environ.get("REQUEST_METHOD", "GET"),
+            "path": environ.get("PATH_INFO", "/"),
+            "query": environ.get("QUERY_STRING", ""),
+            "headers": self._collect_headers(environ),
+            "body": base64.b64encode(body[: self.max_body]).decode("ascii"),
+            "status": str(status_holder.get("status", "")).split(" ", 1)[0],
+            "duration": round(time.monotonic() - arrived, 6),
+        }
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+        return response_body
+
+    def _read_body(self, environ: dict) -> bytes:
+        stream = environ.get("wsgi.input")
+        if stream is None or not hasattr(stream, "getvalue"):
+            return b""
+        body = stream.getvalue()
+        return body.encode("utf-8") if isinstance(body, str) else body
+
+    def _collect_headers(self, environ: dict) -> List[List[str]]:
+        headers = []
+        for key, value in environ.items():
+            if key.startswith("HTTP_"):
+                headers.append([key[5:].replace("_", "-").title(), value])
+            elif key in ("CONTENT_TYPE", "CONTENT_LENGTH") and value:
+                headers.append([key.replace("_", "-").title(), value])
+        return headers
+
+    def _write_loop(self) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(
+                json.dumps({"version": CAPTURE_FORMAT_VERSION, "started": time.time()})
+                + "\n"
+            )
+            f.flush()
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    break
+                lines = [json.dumps(record, separators=(",", ":"))]
+                # Drain whatever else is queued so a burst costs one write
+                while len(lines) < 512:
+                    try:
+                        record = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if record is None:
+                        self._queue.put(None)
+                        break
+                    lines.append(json.dumps(record, separators=(",", ":")))
+                f.write("\n".join(lines) + "\n")
+                f.flush()
+                self.captured += len(lines)
+
+    def close(self) -> None:
+        """Flush pending records and stop the writer thread"""
+        self._queue.put(None)
+        self._writer.join()
+
+
+def load_capture(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the request records of a capture file in arrival order. Records
+    are written when their response finishes, so the file is read whole and
+    sorted by arrival time.
+    """
+    records: List[Dict[str, Any]] = []
+    offset = 0.0
+    latest = 0.0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            # A header line starts a new segment whose offsets restart at zero,
+            # after the latest arrival of the previous segment
+            if "version" in record:
+                offset = latest
+                continue
+            record["t"] = offset + record.get("t", 0.0)
+            record["body"] = base64.b64decode(record.get("body", ""))
+            latest = max(latest, record["t"])
+            records.append(record)
+    records.sort(key=lambda record: record["t"])
+    yield from records
@@ -0,0 +1,338 @@
+import socket
+import ssl
+import threading
+import time
+from typing import Callable, Optional
+
+from server.metrics import metrics
+from server.timers import TimerWheel, Timer, timer_wheel
+
+
+REQUEST_TIMEOUT_RESPONSE: bytes = (
+    b"HTTP/1.1 408 Request Timeout\r\n"
+    b"Content-Type: text/plain\r\n"
+    b"Content-Length: 0\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+)
+
+HEADERS_TOO_LARGE_RESPONSE: bytes = (
+    b"HTTP/1.1 431 Request Header Fields Too Large\r\n"
+    b"Content-Type: text/plain\r\n"
+    b"Content-Length: 0\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+)
+
+BAD_REQUEST_RESPONSE: bytes = (
+    b"HTTP/1.1 400 Bad Request\r\n"
+    b"Content-Type: text/plain\r\n"
+    b"Content-Length: 0\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+)
+
+NOT_IMPLEMENTED_RESPONSE: bytes = (
+    b"HTTP/1.1 501 Not Implemented\r\n"
+    b"Content-Type: text/plain\r\n"
+    b"Content-Length: 0\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+)
+
+
+class ConnectionTimeouts:
+    """
+    Per-phase connection limits, in seconds unless noted.
+
+    Attributes:
+        handshake (float): Time allowed to complete the TLS handshake.
+        header (float): Time allowed to receive the complete request head.
+        body (float): Time allowed between two chunks of the request body.
+        keepalive (float): Time an idle persistent connection is kept open.
+        write (float): Time allowed to send a response.
+        min_body_rate (int): Minimum average body upload rate in bytes/second.
+        rate_grace (float): Seconds of body upload before the rate is enforced.
+        max_header_size (int): Largest accepted request head in bytes.
+    """
+
+    def __init__(
+        self,
+        handshake: float = 10.0,
+        header: float = 10.0,
+        body: float = 30.0,
+        keepalive: float = 5.0,
+        write: float = 30.0,
+        min_body_rate: int = 1024,
+        rate_grace: float = 2.0,
+        max_header_size: int = 64 * 1024,
+    ) -> None:
+        self.handshake = handshake
+        self.header = header
+        self.body = body
+        self.keepalive = keepalive
+        self.write = write
+        self.min_body_rate = min_body_rate
+        self.rate_grace = rate_grace
+        self.max_header_size = max_header_size
+
+
+class ConnectionTimeout(Exception):
+    """Raised when a connection phase ran out of time or the client is too slow"""
+
+    def __init__(self, phase: str) -> None:
+        super().__init__(f"{phase} timeout")
+        self.phase = phase
+
+
+class HeadersTooLarge(Exception):
+    """Raised when the request head exceeds max_header_size"""
+
+
+class BadRequest(Exception):
+    """
+    Raised when the request body cannot be framed safely. The response is
+    sent and the connection closed, since the next request's start is unknown.
+    """
+
+    def __init__(self, response: bytes = BAD_REQUEST_RESPONSE) -> None:
+        super().__init__(response.split(b"\r\n", 1)[0].decode("ascii"))
+        self.response = response
+
+
+class Connection:
+    """
+    Connection wraps a client socket with a read buffer and per-phase timeouts.
+
+    Blocking socket calls are used as before, but no socket timeout is set on
+    them. Instead each phase (handshake, header, body, keepalive, write) arms a timer on the
+    shared TimerWheel; when it fires the socket is shut down, which wakes the
+    worker thread blocked in recv/send so it can give the connection up.
+
+    Attributes:
+        sock (socket.socket): The client socket.
+        buffer (bytearray): Received bytes not consumed yet.
+        timeouts (ConnectionTimeouts): The limits applied to this connection.
+        expired (Optional[str]): Name of the phase whose timer fired, if any.
+        idle (bool): True while waiting for the next request on a kept-alive connection.
+        secure (bool): True if the socket is a TLS socket.
+        remote_addr (str): Peer IP address ("" for Unix sockets).
+        upgrade (Optional[Callable]): Takes over the socket after a 101 response.
+
+    Methods:
+        handshake():
+            Completes the TLS handshake of a TLS socket.
+
+        read_head(idle=False) -> Optional[bytes]:
+            Reads up to and including the blank line ending a request head.
+
+        next_buffered_method() -> Optional[str]:
+            Method of a pipelined request that is already fully buffered.
+
+        read_body(length) -> bytes:
+            Reads exactly length body bytes, enforcing the minimum upload rate.
+
+        sendall(data):
+            Sends data under the write timeout.
+
+        close_if_idle() -> bool:
+            Shuts the connection down if it is waiting between requests.
+
+        detach() -> socket.socket:
+            Cancels the pending timer and gives up the socket without closing it.
+
+        close():
+            Cancels the pending timer and closes the socket.
+    """
+
+    def __init__(
+        self,
+        sock: socket.socket,
+        timeouts: Optional[ConnectionTimeouts] = None,
+        wheel: Optional[TimerWheel] = None,
+    ) -> None:
+        self.sock = sock
+        self.buffer = bytearray()
+        self.timeouts = timeouts or ConnectionTimeouts()
+        self.wheel = wheel or timer_wheel
+        self.expired: Optional[str] = None
+        self.idle: bool = False
+        self.secure: bool = isinstance(sock, ssl.SSLSocket)
+        try:
+            peer = sock.getpeername()
+        except OSError:
+            peer = None
+        self.remote_addr: str = peer[0] if isinstance(peer, tuple) else ""
+        self.upgrade: Optional[Callable[[socket.socket, bytes], None]] = None
+        self._timer: Optional[Timer] = None
+        self._timer_lock = threading.Lock()
+
+    def _arm(self, phase: str, delay: float) -> None:
+        with self._timer_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            timer = self.wheel.schedule(delay, lambda: self._expire(phase, timer))
+            self._timer = timer
+
+    def _disarm(self) -> None:
+        with self._timer_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _expire(self, phase: str, timer: Timer) -> None:
+        with self._timer_lock:
+            # The wheel may call a timer that was disarmed or replaced while
+            # it was being collected: that phase is over, leave the socket be
+            if timer.cancelled or self._timer is not timer:
+                return
+            self._timer = None
+            self.expired = phase
+        metrics.incr(f"connection.timeout.{phase}")
+        # Shutting the read side wakes a blocked recv but still lets us answer
+        # with a 408; a stalled send or handshake needs both directions shut.
+        how = (
+            socket.SHUT_RDWR
+            if phase in ("write", "keepalive", "handshake")
+            else socket.SHUT_RD
+        )
+        self._shutdown(how)
+
+    def _shutdown(self, how: int) -> None:
+        # SSLSocket.shutdown drops the TLS state, which would make a later 408
+        # go out in plaintext; shut the underlying socket down instead
+        try:
+            socket.socket.shutdown(self.sock, how)
+        except OSError:
+            pass
+
+    def _recv(self) -> bytes:
+        try:
+            chunk = self.sock.recv(65536)
+        except OSError:
+            chunk = b""
+        if self.expired is not None:
+            raise ConnectionTimeout(self.expired)
+        return chunk
+
+    def handshake(self) -> None:
+        """Complete the TLS handshake; a no-op for plain connections"""
+        if not self.secure:
+            return
+
+        started = time.monotonic()
+        self._arm("handshake", self.timeouts.handshake)
+        try:
+            self.sock.do_handshake()  # type: ignore[attr-defined]
+        except OSError:
+            if self.expired is not None:
+                raise ConnectionTimeout(self.expired)
+            metrics.incr("tls.handshake_failed")
+            raise
+        finally:
+            self._disarm()
+
+        metrics.observe("tls.handshake", time.monotonic() - started)
+        if self.sock.session_reused:  # type: ignore[attr-defined]
+            metrics.incr("tls.resumed")
+        else:
+            metrics.incr("tls.full_handshake")
+
+    def read_head(self, idle: bool = False) -> Optional[bytes]:
+        """
+        Return the next request head, or None if the client closed the connection.
+
+        With idle=True the connection is between requests: the keep-alive timeout
+        applies until the first byte arrives, then the header timeout.
+        """
+        if idle and not self.buffer:
+            self._arm("keepalive", self.timeouts.keepalive)
+            self.idle = True
+            try:
+                chunk = self._recv()
+            finally:
+                self.idle = False
+            if not chunk:
+                self._disarm()
+                return None
+            self.buffer += chunk
+
+        self._arm("header", self.timeouts.header)
+        start = 0
+        while True:
+            end = self.buffer.find(b"\r\n\r\n", start)
+            if end != -1:
+                self._disarm()
+                head = bytes(self.buffer[: end + 4])
+                del self.buffer[: end + 4]
+                return head
+            if len(self.buffer) > self.timeouts.max_header_size:
+                self._disarm()
+                raise HeadersTooLarge()
+            start = max(0, len(self.buffer) - 3)
+            chunk = self._recv()
+            if not chunk:
+                self._disarm()
+                return None
+            self.buffer += chunk
+
+    def next_buffered_method(self) -> Optional[str]:
+        """Method of the next request if its complete head is already buffered"""
+        if self.buffer.find(b"\r\n\r\n") == -1:
+            return None
+        return bytes(self.buffer[: self.buffer.find(b" ")]).decode("latin-1")
+
+    def read_body(self, length: int) -> bytes:
+        if length <= 0:
+            return b""
+
+        started = time.monotonic()
+        grace = self.timeouts.rate_grace
+        min_rate = self.timeouts.min_body_rate
+        while len(self.buffer) < length:
+            self._arm("body", self.timeouts.body)
+            chunk = self._recv()
+            if not chunk:
+                self._disarm()
+                raise ConnectionError("client closed connection during body")
+            self.buffer += chunk
+            elapsed = time.monotonic() - started
+            if min_rate and elapsed > grace and len(self.buffer) < min_rate * (
+                elapsed - grace
+            ):
+                self._disarm()
+                metrics.incr("connection.timeout.min_rate")
+                raise ConnectionTimeout("min_rate")
+        self._disarm()
+
+        body = bytes(self.buffer[:length])
+        del self.buffer[:length]
+        return body
+
+    def sendall(self, data: bytes) -> None:
+        self._arm("write", self.timeouts.write)
+        try:
+            self.sock.sendall(data)
+        except OSError:
+            if self.expired is not None:
+                raise ConnectionTimeout(self.expired)
+            raise
+        finally:
+            self._disarm()
+
+    def close_if_idle(self) -> bool:
+        if not self.idle:
+            return False
+        self._shutdown(socket.SHUT_RDWR)
+        return True
+
+    def detach(self) -> socket.socket:
+        self._disarm()
+        return self.sock
+
+    def close(self) -> None:
+        self._disarm()
+        try:
+            self.sock.close()
+        except OSError:
+            pass
@@ -1,18 +1,284 @@
+import queue
 import sqlite3
 import os
-
-from typing import Optional
-from sqlalchemy import create_engine, Engine
+import threading
+import time
+
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+from sqlalchemy import create_engine, event, Connection, Engine
+from sqlalchemy.pool import NullPool, QueuePool, SingletonThreadPool, StaticPool
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.ext.declarative import declarative_base
 
+from server.db.instrumentation import QueryInstrumentation
+from server.db.querycache import table_versions
+from server.metrics import metrics
+
 
 Base = declarative_base()
 
 
+# Applied to every SQLite connection; override any key with SQLITE in main.py.
+# WAL lets readers and one writer work at the same time, NORMAL only fsyncs
+# at checkpoints (still safe against corruption), and busy_timeout makes a
+# writer wait for the lock instead of failing with "database is locked".
+DEFAULT_SQLITE_PROFILE: Dict[str, Any] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64000,
+    "temp_store": "MEMORY",
+    "foreign_keys": "ON",
+    # "queue": shared pool sized for the worker threads, "thread": one
+    # connection per thread, "null": a new connection every time
+    "pool": "queue",
+    "pool_size": 16,
+    "max_overflow": 16,
+    "pool_timeout": 30,
+    # BEGIN mode for transactions, e.g. "IMMEDIATE" to take the write lock up
+    # front; None keeps the driver's default behaviour
+    "begin": None,
+    # Send all writes through one writer thread (see SQLiteWriter) and make
+    # pooled connections read-only
+    "single_writer": False,
+    "writer_batch": 256,
+    # Seconds a caller waits for its write before giving up
+    "writer_timeout": 30.0,
+    # The writer fsyncs every group commit, so callers wait for durable data
+    "writer_synchronous": "FULL",
+}
+
+SQLITE_PRAGMAS = (
+    "journal_mode",
+    "synchronous",
+    "busy_timeout",
+    "mmap_size",
+    "cache_size",
+    "temp_store",
+    "foreign_keys",
+)
+
+
+def apply_sqlite_pragmas(conn: Any, profile: Dict[str, Any]) -> None:
+    """Run the profile's PRAGMA statements on a DB-API SQLite connection"""
+    cursor = conn.cursor()
+    try:
+        for name in SQLITE_PRAGMAS:
+            value = profile.get(name)
+            if value is not None:
+                cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+class UnitOfWork:
+    """
+    UnitOfWork is one request's database session and transaction.
+
+    The session is opened by the first database operation of the request, so
+    requests that never touch the database cost nothing. Every ModelManager
+    call in the request uses it; the request ends with a single commit, or a
+    rollback if it failed.
+
+    Attributes:
+        database (DatabaseConnection): Source of the session.
+        session (Optional[Session]): The request's session, once opened.
+        changed_tables (Set[str]): Tables written in this unit of work, by
+            Core statements or by flushing edited instances; their versions
+            are bumped when it commits.
+
+    Methods:
+        get_session() -> Session:
+            Returns the request's session, opening it on first use.
+
+        on_commit(callback):
+            Runs callback() once the writes are committed; dropped on rollback.
+
+        commit():
+            Commits everything the request wrote, then runs the on_commit callbacks.
+
+        rollback():
+            Discards everything the request wrote.
+
+        close():
+            Closes the session, returning its connection to the pool.
+    """
+
+    def __init__(self, database: "DatabaseConnection") -> None:
+        self.database = database
+        self.session: Optional[Session] = None
+        self.changed_tables: Set[str] = set()
+        self._callbacks: List[Callable[[], Any]] = []
+
+    def get_session(self) -> Session:
+        if self.session is None:
+            self.session = self.database.get_session()
+            event.listen(self.session, "after_flush", self._record_flush)
+        return self.session
+
+    def _record_flush(self, session: Session, flush_context: Any) -> None:
+        # Instances added, edited or deleted through the session change their
+        # tables just like Core statements do
+        for instance in session.new:
+            self.changed_tables.add(instance.__table__.name)
+        for instance in session.deleted:
+            self.changed_tables.add(instance.__table__.name)
+        for instance in session.dirty:
+            if session.is_modified(instance, include_collections=False):
+                self.changed_tables.add(instance.__table__.name)
+
+    def on_commit(self, callback: Callable[[], Any]) -> None:
+        self._callbacks.append(callback)
+
+    def commit(self) -> None:
+        if self.session is not None:
+            self.session.commit()
+        # Only now can other requests see the writes: invalidate their caches
+        for table in self.changed_tables:
+            table_versions.bump(table)
+        self.changed_tables.clear()
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                # The writes are committed; a failed side effect cannot undo them
+                print(f"Error in on_commit callback: {e}")
+
+    def rollback(self) -> None:
+        if self.session is not None:
+            self.session.rollback()
+        self.changed_tables.clear()
+        self._callbacks.clear()
+
+    def close(self) -> None:
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+        self._callbacks.clear()
+
+
+class SQLiteWriter:
+    """
+    SQLiteWriter runs every database write on one thread with its own connection.
+
+    SQLite allows one writer at a time; instead of request threads fighting
+    over the lock, they queue write jobs here. The writer takes all jobs
+    waiting (up to `max_batch`) and runs them in one transaction, each inside
+    its own savepoint so a failing job does not undo the others, then commits
+    once: one fsync for the whole group. Each caller's future resolves after
+    that commit, when its data is durable and visible to readers.
+
+    Attributes:
+        engine (Engine): Engine of the dedicated write connection.
+        max_batch (int): Most jobs committed together.
+
+    Methods:
+        submit(job) -> Future:
+            Queues job(connection); the future gets its return value or exception.
+
+        close():
+            Finishes queued jobs and stops the thread.
+    """
+
+    def __init__(self, engine: Engine, max_batch: int = 256) -> None:
+        self.engine = engine
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[Optional[Tuple[Callable[[Connection], Any], Future]]]" = (
+            queue.Queue()
+        )
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        metrics.gauge("db.writer.queued", self._queue.qsize)
+
+    def submit(self, job: Callable[[Connection], Any]) -> Future:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="sqlite-writer", daemon=True
+                    )
+                    self._thread.start()
+        future: Future = Future()
+        self._queue.put((job, future))
+        return future
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        with self.engine.connect() as connection:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                jobs = [item]
+                stop = False
+                while len(jobs) < self.max_batch:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True
+                        break
+                    jobs.append(item)
+                self._commit(connection, jobs)
+                if stop:
+                    return
+
+    def _commit(
+        self,
+        connection: Connection,
+        jobs: List[Tuple[Callable[[Connection], Any], Future]],
+    ) -> None:
+        started = time.monotonic()
+        outcomes: List[Tuple[Future, Any, Optional[BaseException]]] = []
+        try:
+            with connection.begin():
+                for job, future in jobs:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with connection.begin_nested():
+                            outcomes.append((future, job(connection), None))
+                    except Exception as e:
+                        outcomes.append((future, None, e))
+        except Exception as e:
+            # BEGIN or COMMIT failed: nothing in the group was written. Fail
+            # every caller, including jobs the batch never got to
+            print(f"Error committing write batch: {e}")
+            metrics.incr("db.writer.failed_commits")
+            for _, future in jobs:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        metrics.incr("db.writer.commits")
+        metrics.incr("db.writer.jobs", len(outcomes))
+        metrics.observe("db.writer.commit", time.monotonic() - started)
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
 class DatabaseConnection:
     """
     DatabaseConnection manages database connectivity for the application.
+    The backend is chosen and the engine created on first use, not at import:
+    main.py imports the models, which import this module, so main.USE_SQLITE
+    is only readable once main.py has finished loading.
+
     Attributes:
         db_file (str): The SQLite database file name.
 
@@ -22,6 +288,13 @@ class DatabaseConnection:
 
         SessionLocal: SQLAlchemy session factory for creating sessions.
 
+        profile (Dict[str, Any]): SQLite pragmas and pool settings, see DEFAULT_SQLITE_PROFILE.
+
+        writer (Optional[SQLiteWriter]): The write queue, in single-writer mode.
+
+        instrumentation (QueryInstrumentation): Times every statement of the
+            engines; configured from QUERY_LOG in main.py.
+
     Methods:
         __init__():
             Initializes the DatabaseConnection instance and determines the database backend.
@@ -49,30 +322,112 @@ class DatabaseConnection:
 
         get_session_factory():
             Returns the SQLAlchemy session factory for dependency injection.
+
+        unit_of_work() -> ContextManager[UnitOfWork]:
+            Makes every ModelManager call inside the block share one session.
+
+        current_unit_of_work() -> Optional[UnitOfWork]:
+            Returns the unit of work active in this thread, if any.
+
+        on_commit(callback):
+            Runs callback() once the current writes are committed: at the end
+            of the unit of work, or right away if they already are.
+
+        write(job) -> Future:
+            Queues job(connection) on the single writer.
     """
 
     def __init__(self) -> None:
         self.db_file: str = "default.db"
-        self.use_sqlite: bool = self._check_db()
-        self.engine: Optional[Engine] = None
-        self.SessionLocal = None
-
-        if self.use_sqlite:
-            self.engine = self._create_sqlalchemy_engine(self.db_file)
-            self.SessionLocal = sessionmaker(
-                autocommit=False, autoflush=False, bind=self.engine
-            )
+        self._use_sqlite: Optional[bool] = None
+        self._profile: Optional[Dict[str, Any]] = None
+        self._engine: Optional[Engine] = None
+        self._session_factory = None
+        self._writer: Optional[SQLiteWriter] = None
+        self._lock = threading.Lock()
+        self.instrumentation = QueryInstrumentation()
+        # Per thread (and per asyncio task), so concurrent requests never share one
+        self._unit_of_work: ContextVar[Optional[UnitOfWork]] = ContextVar(
+            "unit_of_work", default=None
+        )
 
-    def _check_db(self) -> bool:
+    @property
+    def use_sqlite(self) -> bool:
+        if self._use_sqlite is None:
+            self._use_sqlite = self._check_db()
+        return self._use_sqlite
+
+    @use_sqlite.setter
+    def use_sqlite(self, value: bool) -> None:
+        self._use_sqlite = value
+
+    @property
+    def profile(self) -> Dict[str, Any]:
+        if self._profile is None:
+            self._profile = {**DEFAULT_SQLITE_PROFILE, **self._main_setting("SQLITE", {})}
+        return self._profile
+
+    @profile.setter
+    def profile(self, value: Dict[str, Any]) -> None:
+        self._profile = {**DEFAULT_SQLITE_PROFILE, **value}
+
+    def _setup(self) -> None:
+        """Create the engine and session factory on first use"""
+        if self._engine is not None or not self.use_sqlite:
+            return
+        with self._lock:
+            if self._engine is None:
+                self.instrumentation.configure(**self._main_setting("QUERY_LOG", {}))
+                engine = self._create_sqlalchemy_engine(self.db_file)
+                self.instrumentation.attach(engine)
+                if self.profile.get("single_writer"):
+                    writer_engine = self._create_writer_engine(self.db_file)
+                    self.instrumentation.attach(writer_engine)
+                    self._writer = SQLiteWriter(
+                        writer_engine, max_batch=self.profile["writer_batch"]
+                    )
+                # Objects outlive their session, so keep them loaded after commit
+                self._session_factory = sessionmaker(
+                    autocommit=False,
+                    autoflush=False,
+                    expire_on_commit=False,
+                    bind=engine,
+                )
+                self._engine = engine
+
+    @property
+    def engine(self) -> Optional[Engine]:
+        self._setup()
+        return self._engine
+
+    @property
+    def SessionLocal(self):
+        self._setup()
+        return self._session_factory
+
+    @property
+    def writer(self) -> Optional[SQLiteWriter]:
+        self._setup()
+        return self._writer
+
+    def write(self, job: Callable[[Connection], Any]) -> Future:
+        writer = self.writer
+        if writer is None:
+            raise RuntimeError("single_writer is not enabled in the SQLite profile")
+        return writer.submit(job)
+
+    def _main_setting(self, name: str, default: Any) -> Any:
         try:
             import main
         except ImportError:
             main = None
 
-        if main is not None and hasattr(main, "USE_SQLITE"):
-            use_sqlite: bool = main.USE_SQLITE
-        else:
-            use_sqlite = False
+        if main is not None and hasattr(main, name):
+            return getattr(main, name)
+        return default
+
+    def _check_db(self) -> bool:
+        use_sqlite: bool = self._main_setting("USE_SQLITE", False)
         return use_sqlite
 
     def _create_sqlite_connection(self, db_file: str) -> sqlite3.Connection | None:
@@ -81,7 +436,8 @@ class DatabaseConnection:
 
         conn: sqlite3.Connection | None = None
         try:
-            conn = sqlite3.connect(db_file)
+            conn = sqlite3.connect(db_file, timeout=self.profile["busy_timeout"] / 1000)
+            apply_sqlite_pragmas(conn, self.profile)
             print("Connection established")
         except sqlite3.Error as e:
             print(e)
@@ -92,12 +448,70 @@ class DatabaseConnection:
             open(db_file, "w").close()
 
         db_url = f"sqlite:///{db_file}"
+        profile = self.profile
 
         engine = create_engine(
-            db_url, connect_args={"check_same_thread": False}, echo=False
+            db_url,
+            connect_args={"check_same_thread": False},
+            echo=False,
+            **self._pool_options(profile),
         )
+
+        @event.listens_for(engine, "connect")
+        def on_connect(dbapi_connection: Any, connection_record: Any) -> None:
+            apply_sqlite_pragmas(dbapi_connection, profile)
+            if profile.get("single_writer"):
+                # Writes belong to the writer thread; fail loudly anywhere else
+                dbapi_connection.execute("PRAGMA query_only=ON")
+            if profile.get("begin"):
+                # Let us emit BEGIN ourselves instead of the driver's implicit one
+                dbapi_connection.isolation_level = None
+
+        if profile.get("begin"):
+            begin = f"BEGIN {profile['begin']}"
+
+            @event.listens_for(engine, "begin")
+            def on_begin(connection: Any) -> None:
+                connection.exec_driver_sql(begin)
+
         return engine
 
+    def _create_writer_engine(self, db_file: str) -> Engine:
+        """Engine holding the single write connection, used by SQLiteWriter"""
+        profile = {**self.profile, "synchronous": self.profile["writer_synchronous"]}
+        engine = create_engine(
+            f"sqlite:///{db_file}",
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+        )
+
+        @event.listens_for(engine, "connect")
+        def on_connect(dbapi_connection: Any, connection_record: Any) -> None:
+            apply_sqlite_pragmas(dbapi_connection, profile)
+            # Explicit BEGIN IMMEDIATE below; also makes savepoints work
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(engine, "begin")
+        def on_begin(connection: Any) -> None:
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+        return engine
+
+    def _pool_options(self, profile: Dict[str, Any]) -> Dict[str, Any]:
+        pool = profile.get("pool", "queue")
+        if pool == "null":
+            return {"poolclass": NullPool}
+        if pool == "thread":
+            return {"poolclass": SingletonThreadPool, "pool_size": profile["pool_size"]}
+        if pool == "queue":
+            return {
+                "poolclass": QueuePool,
+                "pool_size": profile["pool_size"],
+                "max_overflow": profile["max_overflow"],
+                "pool_timeout": profile["pool_timeout"],
+            }
+        raise ValueError(f"Unknown SQLite pool strategy {pool!r}")
+
     def get_connection(self) -> sqlite3.Connection:
         if self.use_sqlite:
             conn = self._create_sqlite_connection("default.db")
@@ -131,5 +545,27 @@ class DatabaseConnection:
         """Get the session factory for dependency injection"""
         return self.SessionLocal
 
+    @contextmanager
+    def unit_of_work(self) -> Iterator[UnitOfWork]:
+        """Scope a unit of work; the caller commits or rolls it back, closing is automatic"""
+        work = UnitOfWork(self)
+        token = self._unit_of_work.set(work)
+        try:
+            yield work
+        finally:
+            self._unit_of_work.reset(token)
+            work.close()
+
+    def current_unit_of_work(self) -> Optional[UnitOfWork]:
+        return self._unit_of_work.get()
+
+    def on_commit(self, callback: Callable[[], Any]) -> None:
+        work = self.current_unit_of_work()
+        # The single writer has committed by the time a write returns
+        if work is None or self.writer is not None:
+            callback()
+        else:
+            work.on_commit(callback)
+
 
 database = DatabaseConnection()
@@ -0,0 +1,232 @@
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional, Set
+
+from sqlalchemy import Engine, event
+
+from server.metrics import metrics
+
+
+# Defaults of QueryInstrumentation; override any key with QUERY_LOG in main.py
+DEFAULT_QUERY_LOG: Dict[str, Any] = {
+    "enabled": True,
+    # Statements slower than this are printed with their query plan
+    "slow_query_ms": 100.0,
+    "explain": True,
+    # The same statement this many times in one request is flagged as N+1
+    "n_plus_one": 5,
+    # Slow queries kept for inspection (QueryInstrumentation.slow_queries)
+    "keep_slow": 50,
+}
+
+# Statements EXPLAIN QUERY PLAN accepts (not PRAGMA, BEGIN, DDL, ...)
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+# IN lists of different lengths are still the same query
+_IN_LIST = re.compile(r"\(\?(?:, \?)+\)")
+
+
+def normalize_statement(statement: str) -> str:
+    """Statement text with parameter lists collapsed, equal for same-shaped queries"""
+    return _IN_LIST.sub("(?)", statement)
+
+
+class QueryStats:
+    """
+    QueryStats collects the SQL statements run while handling one request.
+
+    Attributes:
+        count (int): Statements executed.
+        time (float): Seconds spent executing them.
+        statements (Counter): Executions per normalized statement.
+        repeated (Set[str]): Statements flagged as N+1 patterns.
+        slow (int): Statements over the slow query threshold.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.time = 0.0
+        self.statements: Counter = Counter()
+        self.repeated: Set[str] = set()
+        self.slow = 0
+
+
+class QueryInstrumentation:
+    """
+    QueryInstrumentation times every SQL statement through SQLAlchemy's
+    before/after_cursor_execute events.
+
+    Each statement is counted in `db.queries` and timed in `db.query`. Inside
+    track() (see QueryStatsMiddleware) it is also added to that request's
+    QueryStats. A statement slower than `slow_query_ms` is printed with its
+    EXPLAIN QUERY PLAN and counted in `db.slow_queries`. A statement whose
+    normalized text runs `n_plus_one` times in one request is flagged once,
+    since that usually means a query issued per row of an earlier result,
+    and counted in `db.n_plus_one`.
+
+    Statements run by the single writer thread are timed and logged, but
+    belong to no request.
+
+    Attributes:
+        settings (Dict[str, Any]): DEFAULT_QUERY_LOG merged with overrides.
+        slow_queries (Deque[Dict[str, Any]]): The most recent slow statements.
+
+    Methods:
+        configure(**settings):
+            Overrides settings. DatabaseConnection applies QUERY_LOG from
+            main.py this way when it creates the engine.
+
+        attach(engine):
+            Listens to the engine's cursor events (once per engine).
+
+        track() -> ContextManager[QueryStats]:
+            Collects the statements run in this thread until the block ends.
+
+        current() -> Optional[QueryStats]:
+            The stats being collected in this thread, if any.
+    """
+
+    def __init__(self, **settings: Any) -> None:
+        self.settings: Dict[str, Any] = {**DEFAULT_QUERY_LOG, **settings}
+        self.slow_queries: Deque[Dict[str, Any]] = deque(
+            maxlen=self.settings["keep_slow"]
+        )
+        self._engines: Set[int] = set()
+        self._lock = threading.Lock()
+        self._stats: ContextVar[Optional[QueryStats]] = ContextVar(
+            "query_stats", default=None
+        )
+
+    def configure(self, **settings: Any) -> None:
+        self.settings.update(settings)
+        if self.slow_queries.maxlen != self.settings["keep_slow"]:
+            self.slow_queries = deque(
+                self.slow_queries, maxlen=self.settings["keep_slow"]
+            )
+
+    def attach(self, engine: Engine) -> None:
+        with self._lock:
+            if not self.settings["enabled"] or id(engine) in self._engines:
+                return
+            self._engines.add(id(engine))
+        event.listen(engine, "before_cursor_execute", self._before)
+        event.listen(engine, "after_cursor_execute", self._after)
+
+    @contextmanager
+    def track(self) -> Iterator[QueryStats]:
+        stats = QueryStats()
+        token = self._stats.set(stats)
+        try:
+            yield stats
+        finally:
+            self._stats.reset(token)
+
+    def current(self) -> Optional[QueryStats]:
+        return self._stats.get()
+
+    def _before(
+        self,
+        conn: Any,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: Any,
+        executemany: bool,
+    ) -> None:
+        # On the execution context, not the connection: a statement that
+        # raises never reaches _after, and its context is simply dropped
+        if context is not None:
+            context._query_start = time.perf_counter()
+
+    def _after(
+        self,
+        conn: Any,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: Any,
+        executemany: bool,
+    ) -> None:
+        started = getattr(context, "_query_start", None)
+        if started is None:
+            return
+        duration = time.perf_counter() - started
+        metrics.incr("db.queries")
+        metrics.observe("db.query", duration)
+
+        stats = self._stats.get()
+        if stats is not None:
+            stats.count += 1
+            stats.time += duration
+            normalized = normalize_statement(statement)
+            stats.statements[normalized] += 1
+            threshold = self.settings["n_plus_one"]
+            if threshold and stats.statements[normalized] == threshold:
+                stats.repeated.add(normalized)
+                metrics.incr("db.n_plus_one")
+                print(
+                    f"[n+1] Same statement run {threshold} times in one request: "
+                    f"{normalized}"
+                )
+
+        if duration * 1000 >= self.settings["slow_query_ms"]:
+            if stats is not None:
+                stats.slow += 1
+            self._log_slow(conn, cursor, statement, parameters, executemany, duration)
+
+    def _log_slow(
+        self,
+        conn: Any,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        executemany: bool,
+        duration: float,
+    ) -> None:
+        metrics.incr("db.slow_queries")
+        plan = self._explain(conn, cursor, statement, parameters, executemany)
+        self.slow_queries.append(
+            {
+                "statement": statement,
+                "seconds": duration,
+                "plan": plan,
+                "at": time.time(),
+            }
+        )
+        print(f"[slow query] {duration * 1000:.1f} ms: {statement}")
+        for line in plan:
+            print(f"    {line}")
+
+    def _explain(
+        self,
+        conn: Any,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        executemany: bool,
+    ) -> List[str]:
+        if not self.settings["explain"] or conn.dialect.name != "sqlite":
+            return []
+        if not statement.lstrip().upper().startswith(_EXPLAINABLE):
+            return []
+        if executemany:
+            parameters = parameters[0] if parameters else ()
+        try:
+            # A separate cursor on the same connection, so the caller's
+            # results stay untouched
+            rows = cursor.connection.execute(
+                f"EXPLAIN QUERY PLAN {statement}", parameters
+            ).fetchall()
+        except Exception as e:
+            return [f"(no plan: {e})"]
+        # Rows are (id, parent, notused, detail); indent by nesting depth
+        depth: Dict[int, int] = {}
+        lines = []
+        for node, parent, _, detail in rows:
+            depth[node] = depth.get(parent, -1) + 1
+            lines.append("  " * depth[node] + detail)
+        return lines
@@ -1,33 +1,133 @@
+from concurrent.futures import Future, TimeoutError as FutureTimeout
 from contextlib import contextmanager
 from server.db.database import Base, database, DatabaseConnection
-from sqlalchemy import Column, Integer
-from typing import Any, List, Optional
+from server.db.querycache import QueryCache, table_versions
+from server.db.pagination import Page
+from server.db.queryset import QuerySet, detached_instance, freeze_instance
+from server.db.serializers import (
+    Include,
+    instance_serializer,
+    row_serializer,
+    serialized_fields,
+)
+from sqlalchemy import (
+    Column,
+    Connection,
+    Executable,
+    Integer,
+    bindparam,
+    delete,
+    event,
+    insert,
+    select,
+    update,
+)
+from sqlalchemy.orm import Mapper
+from sqlalchemy.orm.attributes import instance_state
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
 
 
 class ModelManager:
     """
     ModelManager is a utility class for managing database models.
+
+    Declared once on Model, it is a descriptor: `ContactModel.objects` returns a
+    manager bound to ContactModel, so every query targets the concrete table.
+    Queries return lazy QuerySets that run SQL only when consumed.
+
+    Models that set `__query_cache__` to a number of entries get a read-through
+    cache of query results (see QueryCache), invalidated by every committed
+    write made through the manager.
+
     Attributes:
         database: The database connection object used to interact with the database.
+        model (Optional[Type[Model]]): The model this manager is bound to.
+        cache (Optional[QueryCache]): Query result cache of the model, if enabled.
     Methods:
-        save(name, fields):
-            Creates and saves a new model instance with the specified name and fields.
+        get_queryset() -> QuerySet:
+            Returns a QuerySet over all rows of the model.
+        save(id, fields):
+            Creates and saves a new model instance with the given id and fields.
+        create(**fields):
+            Creates and saves a new model instance with the given fields.
         get(model_id):
             Retrieves a model instance by its unique identifier.
+        get_row(model_id, *fields) -> Optional[dict]:
+            Column values of one row by primary key, read with Core, no instance.
+        insert_returning(**fields) -> dict:
+            Inserts one row with Core and returns its stored values.
+        get_connection():
+            Context manager yielding a Core connection for reads.
         update(model_id, **kwargs):
             Updates the fields of an existing model instance identified by model_id.
         delete(model_id):
             Deletes the model instance with the specified model_id from the database.
-        filter(**kwargs):
-            Retrieves a list of model instances that match the given filter criteria.
+        execute_write(job) -> Any:
+            Runs job(connection) on the single writer, or in a session's transaction.
+        bulk_create(rows, batch_size=500) -> int:
+            Inserts many rows (dicts or instances) with multi-row INSERTs.
+        bulk_update(rows, fields=None, batch_size=500) -> int:
+            Updates many rows by primary key with one UPDATE run per batch.
+        bulk_delete(ids, batch_size=500) -> int:
+            Deletes many rows by primary key with one DELETE run per batch.
+        all(), filter(**lookups), exclude(**lookups), order_by(*fields),
+        only(*fields), values(*fields), serialize(*fields), count(), exists(),
+        paginate(size, cursor=None), iterator(chunk_size=1000):
+            Shortcuts for the same QuerySet methods.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, model: Optional[Type["Model"]] = None) -> None:
         self.database: DatabaseConnection = database
+        self.model = model
+        self.cache: Optional[QueryCache] = None
+        self._bound: Dict[type, "ModelManager"] = {}
+        # Core statements of the fast paths, built once per manager and field set
+        self._statements: Dict[Tuple[Any, ...], Executable] = {}
+        size = getattr(model, "__query_cache__", 0) if model is not None else 0
+        if size:
+            self.cache = QueryCache(model.__name__, model.__tablename__, size)
+
+    def __get__(
+        self, instance: Optional["Model"], owner: Type["Model"]
+    ) -> "ModelManager":
+        if self.model is not None:
+            return self
+        manager = self._bound.get(owner)
+        if manager is None:
+            manager = self._bound[owner] = type(self)(owner)
+        return manager
+
+    def _model(self) -> Type["Model"]:
+        if self.model is None:
+            raise TypeError("ModelManager is not bound to a model")
+        return self.model
 
     @contextmanager
     def get_session(self):
-        """Context manager for database sessions"""
+        """
+        Context manager for database sessions. Inside a unit of work (see
+        UnitOfWorkMiddleware) the request's session is used and changes are
+        only flushed; the unit of work commits once at the end. Otherwise each
+        call gets its own session and transaction.
+        """
+        work = self.database.current_unit_of_work()
+        if work is not None:
+            session = work.get_session()
+            yield session
+            session.flush()
+            return
+
         session = self.database.get_session()
         try:
             yield session
@@ -38,63 +138,364 @@ class ModelManager:
         finally:
             session.close()
 
-    def save(self, id: int, fields: Any) -> "Model":
+    @contextmanager
+    def get_connection(self) -> Iterator[Connection]:
+        """
+        Core connection for reads, without ORM session overhead: the unit of
+        work's connection inside one (so its pending writes are visible),
+        otherwise a pooled connection for the duration of the block.
+        """
+        work = self.database.current_unit_of_work()
+        if work is not None:
+            yield work.get_session().connection()
+            return
+        with self.database.engine.connect() as connection:
+            yield connection
 
-        model = Model(id=id, **fields)
-        with self.get_session() as session:
-            session.add(model)
-            session.commit()
-        return model
+    def _statement(
+        self, key: Tuple[Any, ...], build: Callable[[], Executable]
+    ) -> Executable:
+        # Reusing the statement object lets SQLAlchemy reuse its memoized
+        # cache key and compiled SQL; only the bound values change per call
+        stmt = self._statements.get(key)
+        if stmt is None:
+            stmt = self._statements[key] = build()
+        return stmt
+
+    def get_queryset(self) -> QuerySet:
+        return QuerySet(self._model(), self)
+
+    def execute_write(self, job: Callable[[Connection], Any]) -> Any:
+        """
+        Run job(connection) and return its result. In single-writer mode the
+        job is queued on the writer thread and this waits for its group
+        commit, at most writer_timeout seconds; a job still queued then is
+        cancelled. Otherwise it runs in the current session's transaction.
+        """
+        if self.database.writer is not None:
+            future = self.database.write(job)
+            try:
+                result = future.result(timeout=self.database.profile["writer_timeout"])
+            except FutureTimeout:
+                # Still queued: the writer skips cancelled jobs. Already
+                # running: it may yet commit, so invalidate caches when it does
+                if not future.cancel():
+                    future.add_done_callback(self._changed_if_written)
+                raise
+        else:
+            with self.get_session() as session:
+                result = job(session.connection())
+        self._changed()
+        return result
 
-    def create(self, fields: Any) -> "Model":
+    def _changed_if_written(self, future: Future) -> None:
+        if not future.cancelled() and future.exception() is None:
+            self._changed()
+
+    def _changed(self) -> None:
+        """Invalidate cached results of the table once the write is committed"""
+        table = self._model().__tablename__
+        work = self.database.current_unit_of_work()
+        if work is not None and self.database.writer is None:
+            work.changed_tables.add(table)
+        else:
+            table_versions.bump(table)
+
+    def uses_cache(self) -> bool:
+        """
+        Whether reads may use the query cache: not while the current unit of
+        work has uncommitted writes to the table, which only it can see.
+        """
+        if self.cache is None:
+            return False
+        work = self.database.current_unit_of_work()
+        return work is None or self._model().__tablename__ not in work.changed_tables
+
+    def _pk(self) -> Any:
+        return self._model().__table__.primary_key.columns.values()[0]
+
+    def save(self, id: int, fields: Any) -> "Model":
+        return self.create(id=id, **fields)
+
+    def create(self, **fields: Any) -> "Model":
         """Create a new model instance using SQLAlchemy and save it to the database"""
-        model = Model(**fields)
+        model = self._model()(**fields)
+        if self.database.writer is not None:
+            values = self._row_values(model)
+            table = self._model().__table__
+            key = self.execute_write(
+                lambda connection: connection.execute(
+                    insert(table).values(**values)
+                ).inserted_primary_key[0]
+            )
+            setattr(model, self._pk().key, key)
+            return model
         with self.get_session() as session:
             session.add(model)
-            session.commit()
-            session.refresh(model)
+            session.flush()
+        self._changed()
         return model
 
     def get(self, model_id: int) -> Optional["Model"]:
-        with self.get_session() as session:
-            model = session.query(Model).filter_by(id=model_id).first()
+        if self.cache is not None and self.uses_cache():
+            # Keyed by primary key directly: no statement to build for a hit
+            key = ("get", model_id)
+            cached = self.cache.get(key)
+            if cached is not None:
+                if not cached:
+                    return None
+                return self._attach(detached_instance(self._model(), cached[0]))
+            version = self.cache.version()
+            with self.get_session() as session:
+                model = session.get(self._model(), model_id)
+            # The flush may have written pending edits of this table
+            if self.uses_cache():
+                self.cache.put(key, version, [freeze_instance(model)] if model else [])
             return model
+        with self.get_session() as session:
+            return session.get(self._model(), model_id)
+
+    def _attach(self, instance: "Model") -> "Model":
+        """
+        A cached instance as part of the current unit of work, so edits to it
+        are flushed and committed with the request; outside one it stays detached.
+        """
+        work = self.database.current_unit_of_work()
+        if work is None:
+            return instance
+        session = work.get_session()
+        # The session's own copy wins: it may hold edits not yet flushed
+        current = session.identity_map.get(instance_state(instance).key)
+        if current is not None:
+            return current
+        return session.merge(instance, load=False)
+
+    def get_row(self, model_id: Any, *fields: str) -> Optional[Dict[str, Any]]:
+        """
+        Values of the row with primary key model_id (all columns, or fields),
+        as a dict built straight from the Core row; None if there is none.
+        """
+        if not fields and self.cache is not None and self.uses_cache():
+            # Same entries as get(), which also stores all column values
+            key = ("get", model_id)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return dict(cached[0]) if cached else None
+            version = self.cache.version()
+            row = self._get_row(model_id, fields)
+            self.cache.put(key, version, [dict(row)] if row else [])
+            return row
+        return self._get_row(model_id, fields)
+
+    def _get_row(self, model_id: Any, fields: Tuple[str, ...]) -> Optional[Dict[str, Any]]:
+        model = self._model()
+        names = serialized_fields(model, fields or None)
+        stmt = self._statement(
+            ("get_row", fields),
+            lambda: select(*(model.__mapper__.columns[name] for name in names)).where(
+                self._pk() == bindparam("_pk")
+            ),
+        )
+        with self.get_connection() as connection:
+            row = connection.execute(stmt, {"_pk": model_id}).first()
+        if row is None:
+            return None
+        return row_serializer(model, names, convert=False)(row)
+
+    def insert_returning(self, **fields: Any) -> Dict[str, Any]:
+        """
+        Insert one row with a Core INSERT ... RETURNING and return the stored
+        values (including defaults and the new primary key) as a dict.
+        """
+        model = self._model()
+        self._row_values(fields)
+        names = serialized_fields(model)
+        stmt = self._statement(
+            ("insert_returning",),
+            lambda: insert(model.__table__).returning(
+                *(model.__mapper__.columns[name] for name in names)
+            ),
+        )
+        serializer = row_serializer(model, names, convert=False)
+        return self.execute_write(
+            lambda connection: serializer(connection.execute(stmt, fields).one())
+        )
 
     def update(self, model_id: int, **kwargs: Any) -> Optional["Model"]:
+        if self.database.writer is not None:
+            stmt = update(self._model().__table__).where(self._pk() == model_id)
+            changed = self.execute_write(
+                lambda connection: connection.execute(stmt.values(**kwargs)).rowcount
+            )
+            if not changed:
+                return None
+            with self.get_session() as session:
+                return session.get(self._model(), model_id, populate_existing=True)
         with self.get_session() as session:
-            model = session.query(Model).filter_by(id=model_id).first()
+            model = session.get(self._model(), model_id)
             if model:
                 for key, value in kwargs.items():
                     setattr(model, key, value)
-                session.add(model)
-                session.commit()
-            return model
+        if model:
+            self._changed()
+        return model
 
     def delete(self, model_id: int) -> bool:
+        if self.database.writer is not None:
+            stmt = delete(self._model().__table__).where(self._pk() == model_id)
+            return bool(
+                self.execute_write(lambda connection: connection.execute(stmt).rowcount)
+            )
         with self.get_session() as session:
-            model = session.query(Model).filter_by(id=model_id).first()
+            model = session.get(self._model(), model_id)
             if model:
                 session.delete(model)
-                return True
-            return False
+        if model:
+            self._changed()
+        return model is not None
 
-    def filter(self, **kwargs: Any) -> List["Model"]:
-        with self.get_session() as session:
-            query = session.query(Model)
-            for key, value in kwargs.items():
-                query = query.filter(getattr(Model, key) == value)
-            results = query.all()
-            for result in results:
-                session.expunge(result)
-            return results
-
-    def all(self) -> List["Model"]:
-        """Retrieve all model instances"""
-        with self.get_session() as session:
-            results = session.query(Model).all()
-            for result in results:
-                session.expunge(result)
-            return results
+    def _row_values(self, row: Union[Dict[str, Any], "Model"]) -> Dict[str, Any]:
+        columns = self._model().__table__.columns
+        if isinstance(row, dict):
+            unknown = [key for key in row if key not in columns]
+            if unknown:
+                raise ValueError(
+                    f"{self._model().__name__} has no column(s) {', '.join(unknown)}"
+                )
+            return row
+        # Only attributes that were set, so column defaults still apply
+        return {
+            column.key: row.__dict__[column.key]
+            for column in columns
+            if column.key in row.__dict__
+        }
+
+    def _batches(
+        self, rows: Iterable[Dict[str, Any]], batch_size: int
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Group rows into batches of at most batch_size rows with the same keys,
+        since one executemany runs one statement for all of its parameter sets.
+        """
+        pending: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+        for row in rows:
+            keys = tuple(sorted(row))
+            batch = pending.setdefault(keys, [])
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield pending.pop(keys)
+        yield from pending.values()
+
+    def bulk_create(
+        self, rows: Iterable[Union[Dict[str, Any], "Model"]], batch_size: int = 500
+    ) -> int:
+        """Insert rows in one transaction, batch_size rows per executemany"""
+        table = self._model().__table__
+
+        def job(connection: Connection) -> int:
+            count = 0
+            values = (self._row_values(row) for row in rows)
+            for batch in self._batches(values, batch_size):
+                connection.execute(insert(table), batch)
+                count += len(batch)
+            return count
+
+        return self.execute_write(job)
+
+    def bulk_update(
+        self,
+        rows: Iterable[Union[Dict[str, Any], "Model"]],
+        fields: Optional[Iterable[str]] = None,
+        batch_size: int = 500,
+    ) -> int:
+        """
+        Update rows by primary key in one transaction. Each row carries its
+        primary key and new values; fields limits which columns are written.
+        Returns the number of rows changed.
+        """
+        table = self._model().__table__
+        pk = self._pk()
+        only = set(fields) if fields is not None else None
+
+        def parameters() -> Iterator[Dict[str, Any]]:
+            for row in rows:
+                values = self._row_values(row)
+                if values.get(pk.key) is None:
+                    raise ValueError(f"bulk_update rows need a {pk.key!r} value")
+                # Bind names are prefixed so they cannot clash with column names
+                params = {"_pk": values[pk.key]}
+                for key, value in values.items():
+                    if key != pk.key and (only is None or key in only):
+                        params[f"_{key}"] = value
+                yield params
+
+        def job(connection: Connection) -> int:
+            count = 0
+            for batch in self._batches(parameters(), batch_size):
+                columns = [key[1:] for key in batch[0] if key != "_pk"]
+                if not columns:
+                    continue
+                stmt = (
+                    update(table)
+                    .where(pk == bindparam("_pk"))
+                    .values({column: bindparam(f"_{column}") for column in columns})
+                )
+                count += connection.execute(stmt, batch).rowcount
+            return count
+
+        return self.execute_write(job)
+
+    def bulk_delete(self, ids: Iterable[Any], batch_size: int = 500) -> int:
+        """Delete rows by primary key in one transaction. Returns the number deleted."""
+        stmt = delete(self._model().__table__).where(self._pk() == bindparam("_pk"))
+
+        def job(connection: Connection) -> int:
+            count = 0
+            batch: List[Dict[str, Any]] = []
+            for id in ids:
+                batch.append({"_pk": id})
+                if len(batch) >= batch_size:
+                    count += connection.execute(stmt, batch).rowcount
+                    batch = []
+            if batch:
+                count += connection.execute(stmt, batch).rowcount
+            return count
+
+        return self.execute_write(job)
+
+    def all(self) -> QuerySet:
+        """All model instances, loaded when iterated"""
+        return self.get_queryset()
+
+    def filter(self, *expressions: Any, **lookups: Any) -> QuerySet:
+        return self.get_queryset().filter(*expressions, **lookups)
+
+    def exclude(self, **lookups: Any) -> QuerySet:
+        return self.get_queryset().exclude(**lookups)
+
+    def order_by(self, *fields: str) -> QuerySet:
+        return self.get_queryset().order_by(*fields)
+
+    def only(self, *fields: str) -> QuerySet:
+        return self.get_queryset().only(*fields)
+
+    def values(self, *fields: str) -> QuerySet:
+        return self.get_queryset().values(*fields)
+
+    def serialize(self, *fields: str, include: Include = None) -> List[Dict[str, Any]]:
+        return self.get_queryset().serialize(*fields, include=include)
+
+    def count(self) -> int:
+        return self.get_queryset().count()
+
+    def exists(self) -> bool:
+        return self.get_queryset().exists()
+
+    def paginate(self, size: int, cursor: Optional[str] = None) -> Page:
+        return self.get_queryset().paginate(size, cursor)
+
+    def iterator(self, chunk_size: int = 1000) -> Iterator["Model"]:
+        return self.get_queryset().iterator(chunk_size)
 
 
 class Model(Base):
@@ -103,29 +504,46 @@ class Model(Base):
 
     Attributes:
         id (int): Primary key for the model, indexed.
-        objects (ModelManager): Manager for model queries and operations.
-        name (str): Name of the model instance.
-        fields (Any): Fields associated with the model instance.
+        __query_cache__ (int): Query results to cache per process (0 disables).
+        __serializer__ (Callable): Generated to_dict() of all columns, built
+            when the concrete model class is mapped.
+        objects (ModelManager): Manager for model queries and operations,
+            bound to the concrete model class it is accessed from.
 
     Methods:
-        __init__(name, fields): Initializes the model with a name and fields.
+        __init__(**fields): Initializes the model from column values.
+        to_dict(fields=None, include=None) -> dict:
+            Returns the column values (or a subset, plus related models in
+            include) as a JSON-ready dict.
         __repr__(): Returns a string representation of the model instance.
         __str__(): Returns a human-readable string for the model instance.
     """
 
     __abstract__ = True
+    __query_cache__ = 0
 
     id = Column(Integer, primary_key=True, index=True)
 
-    def __init__(self, id: int, fields: Any) -> None:
-        super().__init__()
-        self.id = id
-        self.fields = fields
+    def __init__(self, **fields: Any) -> None:
+        super().__init__(**fields)
+
+    def to_dict(
+        self, fields: Optional[List[str]] = None, include: Include = None
+    ) -> Dict[str, Any]:
+        if fields is None and include is None:
+            return self.__serializer__(self)
+        return instance_serializer(type(self), fields, include)(self)
 
     def __repr__(self) -> str:
-        return f"Model(id={self.id}, fields={self.fields})"
+        return f"{type(self).__name__}(id={self.id})"
 
     def __str__(self) -> str:
-        return f"Model: {self.id} with fields"
+        return f"{type(self).__name__}: {self.id}"
 
     objects = ModelManager()
+
+
+@event.listens_for(Model, "after_mapper_constructed", propagate=True)
+def _build_serializer(mapper: Mapper, cls: Type[Model]) -> None:
+    # Generated once per model class, so to_dict() never walks the columns
+    cls.__serializer__ = staticmethod(instance_serializer(cls, mapper=mapper))
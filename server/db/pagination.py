@@ -0,0 +1,209 @@
+import base64
+import binascii
+import datetime
+import decimal
+import json
+from typing import TYPE_CHECKING, Any, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Column, and_, or_, tuple_
+from sqlalchemy.sql.elements import ColumnElement
+
+if TYPE_CHECKING:
+    from server.db.queryset import QuerySet
+    from server.request import Request
+
+
+class InvalidCursor(ValueError):
+    """A cursor token that is malformed or was made for another ordering"""
+
+
+class Page:
+    """
+    Page is one page of a keyset-paginated QuerySet.
+
+    Attributes:
+        items (List[Any]): The rows of this page (instances or dicts).
+        next_cursor (Optional[str]): Token for the following page, None on the last page.
+        has_more (bool): Whether another page follows.
+    """
+
+    def __init__(self, items: List[Any], next_cursor: Optional[str]) -> None:
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_more(self) -> bool:
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+def _is_indexed(column: Column) -> bool:
+    """Whether an index (or the primary key) starts with column"""
+    if column.primary_key or column.index or column.unique:
+        return True
+    for index in column.table.indexes:
+        if list(index.columns)[0] is column:
+            return True
+    return False
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    return value
+
+
+def _decode_value(column: Column, value: Any) -> Any:
+    if value is None:
+        return None
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if issubclass(python_type, (datetime.date, datetime.time)):
+        return python_type.fromisoformat(value)
+    if issubclass(python_type, decimal.Decimal):
+        return decimal.Decimal(value)
+    return value
+
+
+# What _encode_value produces; anything else in a cursor was not made by us
+_SCALARS = (str, int, float, bool)
+
+
+def encode_cursor(ordering: Sequence[str], values: Sequence[Any]) -> str:
+    """Opaque token holding the sort key of the last row of a page"""
+    payload = json.dumps(
+        {"o": list(ordering), "v": [_encode_value(value) for value in values]},
+        separators=(",", ":"),
+    )
+    # No "=" padding, so the token is safe as a bare query parameter
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str, ordering: Sequence[str]) -> List[Any]:
+    """Sort key stored in token. Raises InvalidCursor if it does not match ordering."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw.decode("utf-8"))
+        stored, values = payload["o"], payload["v"]
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, KeyError):
+        raise InvalidCursor("Malformed cursor")
+    if (
+        stored != list(ordering)
+        or not isinstance(values, list)
+        or len(values) != len(ordering)
+    ):
+        raise InvalidCursor("Cursor does not match the ordering of this query")
+    if not all(value is None or isinstance(value, _SCALARS) for value in values):
+        raise InvalidCursor("Malformed cursor")
+    return values
+
+
+def keyset_condition(
+    columns: Sequence[Tuple[Any, bool]], values: Sequence[Any]
+) -> ColumnElement:
+    """
+    WHERE clause selecting the rows after values in the order of columns,
+    given as (column, descending) pairs.
+    """
+    if len({descending for _, descending in columns}) == 1:
+        # One direction: a row-value comparison, which SQLite serves from the index
+        left = tuple_(*(column for column, _ in columns))
+        right = tuple_(*values)
+        return left < right if columns[0][1] else left > right
+
+    # Mixed directions: (a > x) OR (a = x AND b < y) OR ...
+    clauses = []
+    for position, (column, descending) in enumerate(columns):
+        equal = [columns[i][0] == values[i] for i in range(position)]
+        after = column < values[position] if descending else column > values[position]
+        clauses.append(and_(*equal, after))
+    return or_(*clauses)
+
+
+def paginate(queryset: "QuerySet", size: int, cursor: Optional[str] = None) -> Page:
+    """
+    One page of queryset by keyset (seek) pagination: the next page is the
+    rows after the last row's sort key, so every page costs one index seek
+    plus `size` rows, however deep it is. Ordered by the queryset's
+    order_by() fields, with the primary key appended to make the order total;
+    the leading field must be indexed.
+    """
+    if size <= 0:
+        raise ValueError("Page size must be positive")
+    model = queryset.model
+    pk = model.__mapper__.primary_key[0]
+    ordering = [field for field, _ in queryset._ordering]
+    if pk.key not in ordering:
+        ordering.append(pk.key)
+    directions = dict(queryset._ordering)
+    columns = [
+        (model.__table__.columns[field], directions.get(field, False))
+        for field in ordering
+    ]
+    if not _is_indexed(columns[0][0]):
+        raise ValueError(
+            f"Keyset pagination needs an index on {model.__name__}.{ordering[0]}"
+        )
+
+    order = [
+        f"-{field}" if descending else field
+        for field, (_, descending) in zip(ordering, columns)
+    ]
+    page = queryset.order_by(*order)
+    if cursor:
+        values = decode_cursor(cursor, order)
+        try:
+            values = [
+                _decode_value(column, value)
+                for (column, _), value in zip(columns, values)
+            ]
+        except (ValueError, TypeError, decimal.InvalidOperation):
+            raise InvalidCursor("Malformed cursor")
+        page = page.filter(keyset_condition(columns, values))
+    rows = list(page[: size + 1])
+
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        last = rows[-1]
+        if isinstance(last, dict):
+            missing = [field for field in ordering if field not in last]
+            if missing:
+                raise ValueError(
+                    f"values() must include the sort fields {', '.join(missing)}"
+                )
+            key = [last[field] for field in ordering]
+        else:
+            key = [getattr(last, field) for field in ordering]
+        next_cursor = encode_cursor(order, key)
+    return Page(rows, next_cursor)
+
+
+def paginate_request(
+    request: "Request",
+    queryset: "QuerySet",
+    default_size: int = 50,
+    max_size: int = 200,
+) -> Page:
+    """
+    paginate() with the page size and cursor taken from the request's
+    `limit` and `cursor` query parameters; a missing or invalid limit gets
+    default_size. Raises InvalidCursor for a bad cursor, which handlers
+    answer with 400.
+    """
+    params = request.query_params or {}
+    try:
+        size = int(params.get("limit") or default_size)
+    except ValueError:
+        size = default_size
+    size = max(1, min(size, max_size))
+    return paginate(queryset, size, params.get("cursor") or None)
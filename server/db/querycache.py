@@ -0,0 +1,142 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+from sqlalchemy import Select
+
+from server.metrics import metrics
+from server.shm import CounterTable
+
+
+class TableVersions:
+    """
+    TableVersions counts committed writes per table, across worker processes.
+
+    Every committed write to a table bumps its version. A cached query result
+    remembers the version it was read at and is only served while the version
+    is unchanged, so results are dropped exactly when their table changes. The
+    counters live in shared memory created before the workers fork, so a write
+    in one worker invalidates the caches of all of them.
+
+    Methods:
+        bump(table) -> int:
+            Records a committed write to table.
+
+        get(table) -> int:
+            Current version of table.
+    """
+
+    def __init__(self) -> None:
+        self._counters = CounterTable()
+
+    def bump(self, table: str) -> int:
+        return self._counters.incr(table)
+
+    def get(self, table: str) -> int:
+        return self._counters.value(table)
+
+
+table_versions: TableVersions = TableVersions()
+
+
+class QueryCache:
+    """
+    QueryCache is a read-through LRU of one model's query results.
+
+    Entries are keyed by the statement's SQL and parameters and tagged with
+    the table version they were read at; a lookup after a write to the table
+    misses and the stale entry is replaced. Results are stored as plain data
+    (column dicts, counts), never as ORM instances, so callers always get
+    objects of their own.
+
+    Attributes:
+        name (str): Model name, used for the metric names.
+        table (str): Table whose version guards the entries.
+        max_entries (int): Entries kept before the least recently used is dropped.
+        hits (int): Lookups answered from the cache.
+        misses (int): Lookups that went to the database.
+
+    Methods:
+        key(kind, stmt) -> Optional[Hashable]:
+            Cache key of a statement (None if uncacheable); kind tells result
+            shapes of the same SQL apart.
+
+        version() -> int:
+            Table version to read before running a query whose result is stored.
+
+        get(key) -> Optional[Any]:
+            Cached result, or None if missing or stale.
+
+        put(key, version, value):
+            Stores a result read at version.
+
+        clear():
+            Drops every entry.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        table: str,
+        max_entries: int = 1024,
+        versions: Optional[TableVersions] = None,
+    ) -> None:
+        self.name = name
+        self.table = table
+        self.max_entries = max_entries
+        self.versions = versions or table_versions
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[int, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        metrics.gauge(f"querycache.{name}.entries", lambda: len(self._entries))
+
+    def key(self, kind: str, stmt: Select) -> Optional[Hashable]:
+        # SQLAlchemy's structural key of the statement (what its compiled SQL
+        # cache uses) plus the bound values: equal keys mean equal SQL and
+        # parameters, without compiling the statement on every lookup
+        cache_key = stmt._generate_cache_key()
+        if cache_key is None:
+            return None
+        params = tuple(
+            tuple(value) if isinstance(value, list) else value
+            for value in (param.effective_value for param in cache_key.bindparams)
+        )
+        key = (kind, cache_key.key, params)
+        try:
+            hash(key)
+        except TypeError:
+            # Unhashable parameters: this query is simply not cached
+            return None
+        return key
+
+    def version(self) -> int:
+        return self.versions.get(self.table)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        version = self.version()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                value = entry[1]
+            else:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                value = None
+        metrics.incr(f"querycache.{self.name}.{'hits' if value is not None else 'misses'}")
+        return value
+
+    def put(self, key: Hashable, version: int, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
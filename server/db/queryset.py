@@ -0,0 +1,441 @@
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
+
+from sqlalchemy import Select, and_, delete, func, not_, select, update
+from sqlalchemy.orm import load_only
+from sqlalchemy.orm.attributes import instance_state
+from sqlalchemy.sql.elements import ColumnElement
+
+from server.db.pagination import Page, paginate
+from server.db.serializers import Include, instance_serializer, row_serializer
+
+if TYPE_CHECKING:
+    from server.db.models import Model, ModelManager
+
+
+# field__lookup=value filters, e.g. filter(name__startswith="A", id__gt=10)
+LOOKUPS: Dict[str, Callable[[Any, Any], ColumnElement]] = {
+    "exact": lambda column, value: (
+        column.is_(None) if value is None else column == value
+    ),
+    "ne": lambda column, value: (
+        column.isnot(None) if value is None else column != value
+    ),
+    "gt": lambda column, value: column > value,
+    "gte": lambda column, value: column >= value,
+    "lt": lambda column, value: column < value,
+    "lte": lambda column, value: column <= value,
+    "in": lambda column, value: column.in_(list(value)),
+    "contains": lambda column, value: column.contains(value, autoescape=True),
+    "icontains": lambda column, value: column.icontains(value, autoescape=True),
+    "startswith": lambda column, value: column.startswith(value, autoescape=True),
+    "endswith": lambda column, value: column.endswith(value, autoescape=True),
+    "isnull": lambda column, value: column.is_(None) if value else column.isnot(None),
+}
+
+
+def freeze_instance(instance: Any) -> Dict[str, Any]:
+    """Loaded column values of an instance, for the query cache"""
+    return {
+        column.key: instance.__dict__[column.key]
+        for column in instance.__table__.columns
+        if column.key in instance.__dict__
+    }
+
+
+def detached_instance(model: Type["Model"], values: Dict[str, Any]) -> Any:
+    """A detached instance built from cached column values, without a query"""
+    mapper = model.__mapper__
+    instance = mapper.class_manager.new_instance()
+    # Loaded state lives in __dict__, as the ORM's own row loader sets it; a
+    # fresh instance has no history, so only the identity key and unloaded
+    # columns are left of what make_transient_to_detached() does
+    instance.__dict__.update(values)
+    state = instance_state(instance)
+    state.key = mapper.identity_key_from_primary_key(
+        [values[mapper.get_property_by_column(column).key] for column in mapper.primary_key]
+    )
+    if len(values) < len(mapper.column_attrs):
+        state._expire_attributes(state.dict, state.unloaded)
+    return instance
+
+
+class QuerySet:
+    """
+    QuerySet is a lazy, chainable query over one model's table.
+
+    Building a QuerySet runs no SQL. filter(), exclude(), order_by(), only(),
+    values() and slicing each return a new QuerySet with one more clause; the
+    SELECT runs when the results are consumed (iteration, len(), bool(), list
+    indexing, first()), and the rows are then kept so iterating again does not
+    query again. count() and exists() run their own small queries. If the
+    model has a query cache, all three are answered from it when possible.
+
+        recent = ContactModel.objects.filter(name__startswith="A").order_by("-id")[:20]
+        for contact in recent:      # SELECT ... WHERE ... ORDER BY id DESC LIMIT 20
+            ...
+
+    Attributes:
+        model (Type[Model]): The model class queried.
+        manager (ModelManager): The manager providing sessions.
+
+    Methods:
+        filter(*expressions, **lookups) -> QuerySet:
+            Keeps rows matching all conditions.
+
+        exclude(**lookups) -> QuerySet:
+            Drops rows matching all conditions.
+
+        order_by(*fields) -> QuerySet:
+            Sorts by the fields; a leading "-" sorts descending.
+
+        only(*fields) -> QuerySet:
+            Loads just these columns (and the primary key) into model instances.
+
+        values(*fields) -> QuerySet:
+            Yields dicts of the fields (all columns if none are given).
+
+        serialize(*fields, include=None) -> List[dict]:
+            JSON-ready dicts of the matching rows, built straight from the
+            result rows unless related models are included.
+
+        count() -> int:
+            Number of matching rows, counted by the database.
+
+        exists() -> bool:
+            True if at least one row matches.
+
+        first() -> Optional[Model | dict]:
+            The first result, or None.
+
+        paginate(size, cursor=None) -> Page:
+            One page by keyset pagination; pass page.next_cursor for the next.
+
+        iterator(chunk_size=1000) -> Iterator[Model | dict]:
+            Streams the results, chunk_size rows in memory at a time.
+
+        update(**fields) -> int:
+            Sets fields on all matching rows with one UPDATE. Returns the row count.
+
+        delete() -> int:
+            Deletes all matching rows with one DELETE. Returns the row count.
+
+        statement() -> Select:
+            The SELECT this QuerySet runs.
+    """
+
+    def __init__(self, model: Type["Model"], manager: "ModelManager") -> None:
+        self.model = model
+        self.manager = manager
+        self._where: Tuple[ColumnElement, ...] = ()
+        self._order: Tuple[ColumnElement, ...] = ()
+        # order_by() fields as (name, descending), for keyset pagination
+        self._ordering: Tuple[Tuple[str, bool], ...] = ()
+        self._offset: int = 0
+        self._limit: Optional[int] = None
+        self._only: Optional[Tuple[str, ...]] = None
+        self._values: Optional[Tuple[str, ...]] = None
+        self._convert: bool = False
+        self._result_cache: Optional[List[Any]] = None
+
+    def _clone(self, **changes: Any) -> "QuerySet":
+        clone = QuerySet.__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        clone._result_cache = None
+        for name, value in changes.items():
+            setattr(clone, name, value)
+        return clone
+
+    def _column(self, field: str) -> Any:
+        column = self.model.__table__.columns.get(field)
+        if column is None:
+            raise AttributeError(f"{self.model.__name__} has no column {field!r}")
+        return getattr(self.model, column.key)
+
+    def _conditions(self, lookups: Dict[str, Any]) -> List[ColumnElement]:
+        conditions: List[ColumnElement] = []
+        for key, value in lookups.items():
+            field, _, lookup = key.partition("__")
+            if not lookup:
+                lookup = "exact"
+            if lookup not in LOOKUPS:
+                raise ValueError(f"Unsupported lookup {lookup!r} in {key!r}")
+            conditions.append(LOOKUPS[lookup](self._column(field), value))
+        return conditions
+
+    def filter(self, *expressions: ColumnElement, **lookups: Any) -> "QuerySet":
+        self._check_unsliced("filter")
+        conditions = list(expressions) + self._conditions(lookups)
+        return self._clone(_where=self._where + tuple(conditions))
+
+    def exclude(self, **lookups: Any) -> "QuerySet":
+        self._check_unsliced("exclude")
+        conditions = self._conditions(lookups)
+        if not conditions:
+            return self._clone()
+        return self._clone(_where=self._where + (not_(and_(*conditions)),))
+
+    def order_by(self, *fields: str) -> "QuerySet":
+        self._check_unsliced("order_by")
+        order: List[ColumnElement] = []
+        ordering: List[Tuple[str, bool]] = []
+        for field in fields:
+            descending = field.startswith("-")
+            name = field[1:] if descending else field
+            column = self._column(name)
+            order.append(column.desc() if descending else column.asc())
+            ordering.append((name, descending))
+        return self._clone(_order=tuple(order), _ordering=tuple(ordering))
+
+    def only(self, *fields: str) -> "QuerySet":
+        for field in fields:
+            self._column(field)
+        return self._clone(_only=fields, _values=None)
+
+    def values(self, *fields: str) -> "QuerySet":
+        for field in fields:
+            self._column(field)
+        names = fields or tuple(column.key for column in self.model.__table__.columns)
+        return self._clone(_values=names, _only=None, _convert=False)
+
+    def serialize(self, *fields: str, include: Include = None) -> List[Dict[str, Any]]:
+        if include:
+            # Relations need instances to load them from
+            serializer = instance_serializer(self.model, fields or None, include)
+            queryset = self.only(*fields) if fields else self
+            return [serializer(instance) for instance in queryset]
+        queryset = self.values(*fields)
+        queryset._convert = True
+        return list(queryset)
+
+    def _check_unsliced(self, operation: str) -> None:
+        if self._limit is not None or self._offset:
+            raise TypeError(f"Cannot {operation} a sliced QuerySet")
+
+    def __getitem__(self, key: Union[int, slice]) -> Any:
+        if isinstance(key, int):
+            if key < 0:
+                raise ValueError("Negative indexing is not supported")
+            if self._result_cache is not None:
+                return self._result_cache[key]
+            results = list(self[key : key + 1])
+            if not results:
+                raise IndexError("QuerySet index out of range")
+            return results[0]
+
+        if not isinstance(key, slice):
+            raise TypeError("QuerySet indices must be integers or slices")
+        if (key.start or 0) < 0 or (key.stop or 0) < 0 or key.step not in (None, 1):
+            raise ValueError("Only non-negative slices without a step are supported")
+        if self._result_cache is not None:
+            return self._result_cache[key]
+
+        # Slices compose: offsets add up, limits can only shrink
+        offset = self._offset + (key.start or 0)
+        limit = self._limit
+        if key.stop is not None:
+            stop = self._offset + key.stop
+            if limit is not None:
+                stop = min(stop, self._offset + limit)
+            limit = max(0, stop - offset)
+        elif limit is not None:
+            limit = max(0, limit - (key.start or 0))
+        return self._clone(_offset=offset, _limit=limit)
+
+    def statement(self) -> Select:
+        if self._values is not None:
+            stmt = select(*(self._column(field) for field in self._values))
+        else:
+            stmt = select(self.model)
+            if self._only is not None:
+                stmt = stmt.options(
+                    load_only(*(self._column(field) for field in self._only))
+                )
+        if self._where:
+            stmt = stmt.where(*self._where)
+        if self._order:
+            stmt = stmt.order_by(*self._order)
+        if self._offset:
+            stmt = stmt.offset(self._offset)
+        if self._limit is not None:
+            stmt = stmt.limit(self._limit)
+        return stmt
+
+    def _fetch(self) -> List[Any]:
+        if self._result_cache is None:
+            if self._limit == 0:
+                self._result_cache = []
+                return self._result_cache
+            if self._values is not None:
+                self._result_cache = self._cached(
+                    "serialized" if self._convert else "values",
+                    self.statement(),
+                    self._load_values,
+                    freeze=lambda rows: [row.copy() for row in rows],
+                    thaw=lambda rows: [row.copy() for row in rows],
+                )
+            else:
+                self._result_cache = self._cached(
+                    "instances",
+                    self.statement(),
+                    self._load_instances,
+                    freeze=self._freeze_instances,
+                    thaw=lambda rows: [self._detached(row) for row in rows],
+                )
+        return self._result_cache
+
+    def _load_values(self) -> List[Dict[str, Any]]:
+        # Plain tuples from Core, turned into dicts by a generated function
+        serializer = row_serializer(self.model, self._values, self._convert)
+        with self.manager.get_connection() as connection:
+            result = connection.execute(self.statement())
+            return [serializer(row) for row in result]
+
+    def _load_instances(self) -> List[Any]:
+        with self.manager.get_session() as session:
+            return list(session.scalars(self.statement()))
+
+    def _freeze_instances(self, instances: List[Any]) -> List[Dict[str, Any]]:
+        return [freeze_instance(instance) for instance in instances]
+
+    def _detached(self, values: Dict[str, Any]) -> Any:
+        # Attached to the current unit of work, if any, so edits are committed
+        return self.manager._attach(detached_instance(self.model, values))
+
+    def _cached(
+        self,
+        kind: str,
+        stmt: Select,
+        load: Callable[[], Any],
+        freeze: Callable[[Any], Any] = lambda value: value,
+        thaw: Callable[[Any], Any] = lambda value: value,
+    ) -> Any:
+        """Run load() through the model's query cache, if it has one"""
+        cache = self.manager.cache
+        if cache is None or not self.manager.uses_cache():
+            return load()
+        key = cache.key(kind, stmt)
+        if key is None:
+            return load()
+        cached = cache.get(key)
+        if cached is not None:
+            return thaw(cached)
+        # Read the version first: a write committed meanwhile makes this stale
+        version = cache.version()
+        value = load()
+        # Inside a unit of work the load may have flushed pending edits of
+        # this table; what it read is then uncommitted and not for sharing
+        if self.manager.uses_cache():
+            cache.put(key, version, freeze(value))
+        return value
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._fetch())
+
+    def __len__(self) -> int:
+        return len(self._fetch())
+
+    def __bool__(self) -> bool:
+        return bool(self._fetch())
+
+    def __repr__(self) -> str:
+        return f"<QuerySet {self.model.__name__}: {self.statement()}>"
+
+    def count(self) -> int:
+        if self._result_cache is not None:
+            return len(self._result_cache)
+        if self._limit is None and not self._offset:
+            stmt = select(func.count()).select_from(self.model)
+            if self._where:
+                stmt = stmt.where(*self._where)
+        else:
+            # Count what the slice would return, not the whole table
+            inner = self._clone(_values=(), _only=None).statement()
+            stmt = select(func.count()).select_from(
+                inner.add_columns(self._primary_key()).subquery()
+            )
+        return self._cached("count", stmt, lambda: self._scalar(stmt, int))
+
+    def _scalar(self, stmt: Select, convert: Callable[[Any], Any]) -> Any:
+        with self.manager.get_connection() as connection:
+            return convert(connection.execute(stmt).scalar())
+
+    def exists(self) -> bool:
+        if self._result_cache is not None:
+            return bool(self._result_cache)
+        stmt = self._clone(_values=(), _only=None)[:1].statement()
+        stmt = select(stmt.add_columns(self._primary_key()).exists())
+        return self._cached("exists", stmt, lambda: self._scalar(stmt, bool))
+
+    def _primary_key(self) -> Any:
+        return getattr(self.model, self.model.__mapper__.primary_key[0].key)
+
+    def first(self) -> Any:
+        results = self._result_cache if self._result_cache is not None else list(self[:1])
+        return results[0] if results else None
+
+    def paginate(self, size: int, cursor: Optional[str] = None) -> Page:
+        return paginate(self, size, cursor)
+
+    def iterator(self, chunk_size: int = 1000) -> Iterator[Any]:
+        """
+        Stream the results with yield_per: rows are fetched and turned into
+        objects chunk_size at a time instead of all at once, and nothing is
+        kept in the result or query cache. The connection is held until the
+        iterator is exhausted or closed.
+        """
+        if self._result_cache is not None:
+            yield from self._result_cache
+            return
+        if self._limit == 0:
+            return
+        stmt = self.statement().execution_options(yield_per=chunk_size)
+        if self._values is not None:
+            serializer = row_serializer(self.model, self._values, self._convert)
+            with self.manager.get_connection() as connection:
+                for row in connection.execute(stmt):
+                    yield serializer(row)
+            return
+        with self.manager.get_session() as session:
+            yield from session.scalars(stmt)
+
+    def _write_condition(self) -> Tuple[ColumnElement, ...]:
+        """WHERE clause selecting the rows of this QuerySet for an UPDATE or DELETE"""
+        if self._limit is None and not self._offset:
+            return self._where
+        # UPDATE/DELETE take no LIMIT/OFFSET: select the slice's keys instead
+        keys = self._clone(_values=(), _only=None).statement()
+        keys = keys.add_columns(self._primary_key())
+        return (self._primary_key().in_(keys.scalar_subquery()),)
+
+    def update(self, **fields: Any) -> int:
+        for field in fields:
+            self._column(field)
+        if not fields:
+            return 0
+        table = self.model.__table__
+        stmt = update(table).where(*self._write_condition()).values(**fields)
+        count = self.manager.execute_write(
+            lambda connection: connection.execute(stmt).rowcount
+        )
+        self._result_cache = None
+        return count
+
+    def delete(self) -> int:
+        table = self.model.__table__
+        stmt = delete(table).where(*self._write_condition())
+        count = self.manager.execute_write(
+            lambda connection: connection.execute(stmt).rowcount
+        )
+        self._result_cache = None
+        return count
@@ -0,0 +1,174 @@
+import datetime
+import decimal
+import threading
+import uuid
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple, Type
+
+from sqlalchemy import Column
+from sqlalchemy.orm import Mapper
+
+if TYPE_CHECKING:
+    from server.db.models import Model
+
+
+# include={"relation": None} serializes all columns of the related model,
+# {"relation": ("id", "name")} a subset, {"relation": {"fields": ..., "include": ...}}
+# nests further
+Include = Optional[Dict[str, Any]]
+
+_serializers: Dict[Tuple[Any, ...], Callable[[Any], Dict[str, Any]]] = {}
+_lock = threading.Lock()
+
+
+def _iso(value: Any) -> Any:
+    return value.isoformat() if value is not None else None
+
+
+def _text(value: Any) -> Any:
+    return str(value) if value is not None else None
+
+
+# Values json.dumps cannot encode, converted the same way for instances and rows
+_CONVERTERS: Dict[type, Callable[[Any], Any]] = {
+    datetime.datetime: _iso,
+    datetime.date: _iso,
+    datetime.time: _iso,
+    decimal.Decimal: _text,
+    uuid.UUID: _text,
+}
+
+
+def _converter(column: Column) -> Optional[Callable[[Any], Any]]:
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return None
+    for kind, convert in _CONVERTERS.items():
+        if issubclass(python_type, kind):
+            return convert
+    return None
+
+
+def _columns(mapper: Mapper, fields: Optional[Sequence[str]]) -> List[Tuple[str, Column]]:
+    """(attribute key, column) pairs to serialize, in mapping order unless fields are given"""
+    # mapper.columns is filled when the mapper is constructed, so this works
+    # before the other models (and relationships) are configured
+    by_key = dict(mapper.columns.items())
+    if fields is None:
+        return list(by_key.items())
+    unknown = [field for field in fields if field not in by_key]
+    if unknown:
+        raise AttributeError(
+            f"{mapper.class_.__name__} has no column(s) {', '.join(unknown)}"
+        )
+    return [(field, by_key[field]) for field in fields]
+
+
+def _one(serializer: Callable[[Any], Dict[str, Any]], value: Any) -> Optional[Dict[str, Any]]:
+    return serializer(value) if value is not None else None
+
+
+def _compile(name: str, items: List[str], namespace: Dict[str, Any]) -> Callable[[Any], Dict[str, Any]]:
+    """Build `def name(obj): return {...}` from "key: expression" items"""
+    source = f"def {name}(obj):\n    return {{{', '.join(items)}}}\n"
+    exec(compile(source, f"<serializer {name}>", "exec"), namespace)
+    return namespace[name]
+
+
+def _freeze(fields: Optional[Sequence[str]], include: Include) -> Tuple[Any, ...]:
+    def freeze_include(value: Any) -> Any:
+        if isinstance(value, dict):
+            return tuple(sorted((key, freeze_include(item)) for key, item in value.items()))
+        if isinstance(value, (list, tuple)):
+            return tuple(value)
+        return value
+
+    return (tuple(fields) if fields is not None else None, freeze_include(include))
+
+
+def instance_serializer(
+    model: Type["Model"],
+    fields: Optional[Sequence[str]] = None,
+    include: Include = None,
+    mapper: Optional[Mapper] = None,
+) -> Callable[["Model"], Dict[str, Any]]:
+    """
+    Generated function turning an instance of model into a dict of its columns
+    (or `fields`), plus the relations named in `include`, serialized with
+    their own generated functions. Built once per model and field set; mapper
+    is passed while the class is still being mapped.
+    """
+    mapper = mapper or model.__mapper__
+    key = ("instance", model) + _freeze(fields, include)
+    serializer = _serializers.get(key)
+    if serializer is not None:
+        return serializer
+
+    namespace: Dict[str, Any] = {}
+    items: List[str] = []
+    for index, (attr, column) in enumerate(_columns(mapper, fields)):
+        access = f"obj.{attr}" if attr.isidentifier() else f"getattr(obj, {attr!r})"
+        convert = _converter(column)
+        if convert is not None:
+            namespace[f"convert_{index}"] = convert
+            access = f"convert_{index}({access})"
+        items.append(f"{attr!r}: {access}")
+
+    # Only looked up when asked for: reading them configures every mapper
+    relationships = mapper.relationships if include else {}
+    for index, (name, spec) in enumerate((include or {}).items()):
+        if name not in relationships:
+            raise AttributeError(f"{model.__name__} has no relationship {name!r}")
+        relation = relationships[name]
+        if isinstance(spec, dict):
+            nested = instance_serializer(
+                relation.mapper.class_, spec.get("fields"), spec.get("include")
+            )
+        else:
+            nested = instance_serializer(relation.mapper.class_, spec)
+        namespace[f"nested_{index}"] = nested
+        access = f"obj.{name}" if name.isidentifier() else f"getattr(obj, {name!r})"
+        if relation.uselist:
+            items.append(f"{name!r}: [nested_{index}(item) for item in {access}]")
+        else:
+            namespace["_one"] = _one
+            items.append(f"{name!r}: _one(nested_{index}, {access})")
+
+    serializer = _compile(f"{model.__name__.lower()}_to_dict", items, namespace)
+    with _lock:
+        _serializers[key] = serializer
+    return serializer
+
+
+def row_serializer(
+    model: Type["Model"], fields: Optional[Sequence[str]] = None, convert: bool = True
+) -> Callable[[Any], Dict[str, Any]]:
+    """
+    Generated function turning a Core result row, whose columns are `fields`
+    in that order, into the same dict instance_serializer() makes, without
+    building ORM instances. With convert=False values are left as loaded.
+    """
+    key = ("row", model, convert) + _freeze(fields, None)
+    serializer = _serializers.get(key)
+    if serializer is not None:
+        return serializer
+
+    namespace: Dict[str, Any] = {}
+    items: List[str] = []
+    for index, (attr, column) in enumerate(_columns(model.__mapper__, fields)):
+        access = f"obj[{index}]"
+        converter = _converter(column) if convert else None
+        if converter is not None:
+            namespace[f"convert_{index}"] = converter
+            access = f"convert_{index}({access})"
+        items.append(f"{attr!r}: {access}")
+
+    serializer = _compile(f"{model.__name__.lower()}_row_to_dict", items, namespace)
+    with _lock:
+        _serializers[key] = serializer
+    return serializer
+
+
+def serialized_fields(model: Type["Model"], fields: Optional[Sequence[str]] = None) -> List[str]:
+    """Attribute keys row_serializer(model, fields) expects, in row order"""
+    return [attr for attr, _ in _columns(model.__mapper__, fields)]
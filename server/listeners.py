@@ -0,0 +1,143 @@
+import os
+import socket
+from typing import List, Optional, Tuple
+
+
+# Environment variable used to hand the listening sockets to a new process
+LISTEN_FDS_ENV = "SERVER_LISTEN_FDS"
+
+# First file descriptor passed by systemd-style socket activation
+SD_LISTEN_FDS_START = 3
+
+
+class SocketOptions:
+    """
+    Options applied to listening sockets and the connections accepted from them.
+
+    Attributes:
+        backlog (int): Length of the kernel accept queue.
+        nodelay (bool): Set TCP_NODELAY on accepted TCP connections.
+        reuseport (bool): Set SO_REUSEPORT so several processes can bind the port.
+        defer_accept (int): TCP_DEFER_ACCEPT seconds; wake accept only once data arrived (Linux).
+        rcvbuf (int): SO_RCVBUF in bytes (0 keeps the system default).
+        sndbuf (int): SO_SNDBUF in bytes (0 keeps the system default).
+        unix_mode (Optional[int]): Permissions applied to Unix socket files.
+    """
+
+    def __init__(
+        self,
+        backlog: int = 128,
+        nodelay: bool = True,
+        reuseport: bool = False,
+        defer_accept: int = 0,
+        rcvbuf: int = 0,
+        sndbuf: int = 0,
+        unix_mode: Optional[int] = None,
+    ) -> None:
+        self.backlog = backlog
+        self.nodelay = nodelay
+        self.reuseport = reuseport
+        self.defer_accept = defer_accept
+        self.rcvbuf = rcvbuf
+        self.sndbuf = sndbuf
+        self.unix_mode = unix_mode
+
+
+def parse_bind(spec: str) -> Tuple[str, object]:
+    """
+    Parse a listener spec.
+
+    Accepted forms: "host:port", "[::1]:port", "unix:/path/to.sock" and "fd://N".
+    Returns ("tcp", (host, port)), ("unix", path) or ("fd", N).
+    """
+    if spec.startswith("unix:"):
+        return "unix", spec[len("unix:") :]
+    if spec.startswith("fd://"):
+        return "fd", int(spec[len("fd://") :])
+    host, _, port = spec.rpartition(":")
+    return "tcp", (host.strip("[]") or "0.0.0.0", int(port))
+
+
+def create_listener(spec: str, options: SocketOptions) -> socket.socket:
+    """Create, configure, bind and listen on a socket described by spec"""
+    kind, address = parse_bind(spec)
+
+    if kind == "fd":
+        sock = socket.socket(fileno=int(address))  # type: ignore[arg-type]
+        apply_listener_options(sock, options)
+        return sock
+
+    if kind == "unix":
+        path = str(address)
+        if os.path.exists(path):
+            # A socket file left behind by a previous run blocks bind()
+            os.unlink(path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        apply_listener_options(sock, options)
+        sock.bind(path)
+        if options.unix_mode is not None:
+            os.chmod(path, options.unix_mode)
+        sock.listen(options.backlog)
+        return sock
+
+    host, port = address  # type: ignore[misc]
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if options.reuseport and hasattr(socket, "SO_REUSEPORT"):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    apply_listener_options(sock, options)
+    sock.bind((host, port))
+    sock.listen(options.backlog)
+    return sock
+
+
+def apply_listener_options(sock: socket.socket, options: SocketOptions) -> None:
+    """Apply options that accepted connections inherit from the listening socket"""
+    if options.rcvbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, options.rcvbuf)
+    if options.sndbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, options.sndbuf)
+    if (
+        options.defer_accept
+        and sock.family in (socket.AF_INET, socket.AF_INET6)
+        and hasattr(socket, "TCP_DEFER_ACCEPT")
+    ):
+        sock.setsockopt(
+            socket.IPPROTO_TCP, socket.TCP_DEFER_ACCEPT, options.defer_accept
+        )
+
+
+def inherited_listeners() -> List[socket.socket]:
+    """
+    Return listening sockets passed in by a parent process.
+
+    Sockets handed over by a restarting server (SERVER_LISTEN_FDS) take
+    precedence; otherwise systemd-style socket activation (LISTEN_FDS, and
+    LISTEN_PID when set) is honoured. The variables are removed so they are
+    not passed on to unrelated children.
+    """
+    handed_over = os.environ.pop(LISTEN_FDS_ENV, None)
+    if handed_over:
+        return [socket.socket(fileno=int(fd)) for fd in handed_over.split(",")]
+
+    count = os.environ.get("LISTEN_FDS")
+    listen_pid = os.environ.get("LISTEN_PID")
+    if not count or (listen_pid and int(listen_pid) != os.getpid()):
+        return []
+    for name in ("LISTEN_FDS", "LISTEN_PID", "LISTEN_FDNAMES"):
+        os.environ.pop(name, None)
+    return [
+        socket.socket(fileno=fd)
+        for fd in range(SD_LISTEN_FDS_START, SD_LISTEN_FDS_START + int(count))
+    ]
+
+
+def describe(sock: socket.socket, scheme: str = "http") -> str:
+    """Human readable address of a listening socket"""
+    address = sock.getsockname()
+    if sock.family == socket.AF_UNIX:
+        return f"unix:{address}"
+    if sock.family == socket.AF_INET6:
+        return f"{scheme}://[{address[0]}]:{address[1]}"
+    return f"{scheme}://{address[0]}:{address[1]}"
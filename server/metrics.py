@@ -0,0 +1,67 @@
+import threading
+from typing import Callable, Dict, Any
+
+from server.request import Request
+from server.response import JSONResponse
+
+
+class Metrics:
+    """
+    Metrics is a small thread-safe registry of server counters, gauges and timings.
+
+    Attributes:
+        counters (Dict[str, int]): Monotonic counters, e.g. shed requests.
+        gauges (Dict[str, Callable[[], Any]]): Callables sampled on snapshot.
+        timings (Dict[str, Dict[str, float]]): count/total/max of observed durations.
+
+    Methods:
+        incr(name, amount=1):
+            Increments a counter.
+
+        gauge(name, func):
+            Registers a callable whose value is read on snapshot.
+
+        observe(name, seconds):
+            Records a duration.
+
+        snapshot() -> dict:
+            Returns a point-in-time copy of all metrics.
+    """
+
+    def __init__(self) -> None:
+        self.counters: Dict[str, int] = {}
+        self.gauges: Dict[str, Callable[[], Any]] = {}
+        self.timings: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name: str, func: Callable[[], Any]) -> None:
+        self.gauges[name] = func
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            timing = self.timings.get(name)
+            if timing is None:
+                timing = self.timings[name] = {"count": 0, "total": 0.0, "max": 0.0}
+            timing["count"] += 1
+            timing["total"] += seconds
+            if seconds > timing["max"]:
+                timing["max"] = seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+            timings = {name: dict(value) for name, value in self.timings.items()}
+        gauges = {name: func() for name, func in list(self.gauges.items())}
+        return {"counters": counters, "gauges": gauges, "timings": timings}
+
+
+metrics: Metrics = Metrics()
+
+
+def metrics_handler(request: Request) -> JSONResponse:
+    """Route handler exposing the server metrics as JSON"""
+    return JSONResponse(data=metrics.snapshot(), status=200)
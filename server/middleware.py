@@ -1,4 +1,12 @@
-from typing import Callable, Any
+import math
+import threading
+from typing import Callable, Any, Dict, List, Optional, Sequence, Tuple
+
+from server.db.database import DatabaseConnection, database as default_database
+from server.metrics import metrics
+from server.response import status_line
+from server.shm import TokenBucketTable
+from server.urlhandler import UrlHandler, url_handler as default_url_handler
 
 
 class MiddlewareHandler:
@@ -50,6 +58,372 @@ class MiddlewareHandler:
         print(f"Response Status: {status}")
 
 
+def default_coalescing_key(environ: dict) -> Optional[Tuple[str, ...]]:
+    """
+    Requests share a response only if they would get the same one: same method,
+    path and query, and same credentials and content negotiation headers.
+    """
+    return (
+        environ.get("REQUEST_METHOD", "GET"),
+        environ.get("PATH_INFO", "/"),
+        environ.get("QUERY_STRING", ""),
+        environ.get("HTTP_AUTHORIZATION", ""),
+        environ.get("HTTP_COOKIE", ""),
+        environ.get("HTTP_ACCEPT", ""),
+        environ.get("HTTP_ACCEPT_ENCODING", ""),
+    )
+
+
+class _Flight:
+    """One in-flight execution that identical requests wait on"""
+
+    __slots__ = ("event", "result", "waiters")
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.result: Optional[Tuple[Any, List[Tuple[str, str]], bytes]] = None
+        self.waiters = 0
+
+
+class CoalescingMiddleware:
+    """
+    CoalescingMiddleware collapses identical concurrent GETs into one call of the app.
+
+    The first request for a key runs the app; requests with the same key that
+    arrive while it is running wait for it and are answered with a copy of its
+    status, headers and body bytes. Nothing is kept once the leader finishes, so
+    this needs no response cache and never serves stale data: it only removes
+    duplicate work that was happening at the same moment.
+
+    If the leader fails, returns a streaming body, or does not finish within
+    `timeout`, the waiting requests run the app themselves.
+
+    Configure it in the middlewares list with functools.partial:
+
+        middlewares = [partial(CoalescingMiddleware, timeout=5.0)]
+
+    Attributes:
+        app (Callable): The wrapped WSGI application.
+        key_func (Callable[[dict], Optional[Hashable]]): Builds the coalescing key
+            from the environ; returning None disables coalescing for the request.
+        timeout (float): Seconds a follower waits for the leader.
+        methods (Sequence[str]): Request methods that may be coalesced.
+    """
+
+    def __init__(
+        self,
+        app: Callable,
+        key_func: Callable[[dict], Any] = default_coalescing_key,
+        timeout: float = 10.0,
+        methods: Sequence[str] = ("GET", "HEAD"),
+    ) -> None:
+        self.app = app
+        self.key_func = key_func
+        self.timeout = timeout
+        self.methods = tuple(methods)
+        self._flights: Dict[Any, _Flight] = {}
+        self._lock = threading.Lock()
+
+        metrics.gauge("coalesce.in_flight", lambda: len(self._flights))
+
+    def __call__(self, environ: dict, start_response: Callable) -> Any:
+        if environ.get("REQUEST_METHOD", "GET") not in self.methods:
+            return self.app(environ, start_response)
+        key = self.key_func(environ)
+        if key is None:
+            return self.app(environ, start_response)
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.waiters += 1
+
+        if leader:
+            return self._lead(key, flight, environ, start_response)
+
+        if flight.event.wait(self.timeout) and flight.result is not None:
+            metrics.incr("coalesce.shared")
+            status, headers, body = flight.result
+            start_response(status, list(headers))
+            return [body]
+
+        metrics.incr("coalesce.fallback")
+        return self.app(environ, start_response)
+
+    def _lead(
+        self, key: Any, flight: _Flight, environ: dict, start_response: Callable
+    ) -> Any:
+        captured: List[Any] = []
+
+        def capture_start_response(status, headers, exc_info=None):
+            # Apps may call this more than once; the server sends the first
+            # call's status, so followers get that one too, as a full line
+            if not captured or exc_info is not None:
+                captured[:] = [status_line(status), headers]
+            return start_response(status, headers, exc_info)
+
+        try:
+            response_body = self.app(environ, capture_start_response)
+            # Only plain byte bodies can be replayed; streams and handovers cannot
+            if not hasattr(response_body, "upgrade") and captured:
+                chunks = list(response_body)
+                if hasattr(response_body, "close"):
+                    response_body.close()
+                if all(isinstance(chunk, (bytes, bytearray)) for chunk in chunks):
+                    flight.result = (captured[0], list(captured[1]), b"".join(chunks))
+                response_body = chunks
+            return response_body
+        finally:
+            with self._lock:
+                del self._flights[key]
+            if flight.waiters:
+                metrics.incr("coalesce.leaders")
+            flight.event.set()
+
+
+def default_client_key(environ: dict) -> Optional[str]:
+    """Clients are told apart by peer address; behind a proxy, key on its header instead"""
+    return environ.get("REMOTE_ADDR") or "local"
+
+
+class RateLimitMiddleware:
+    """
+    RateLimitMiddleware enforces per-client and per-route request rates with token buckets.
+
+    Every client gets a bucket of `burst` tokens refilled at `rate` per second.
+    Routes listed in `routes` get an extra bucket per client with their own
+    limit, keyed by the pattern the route was registered with (so
+    "/contact/<int:id>" is one limit for all contacts). A route may also be
+    limited for one method only, e.g. "POST /contact". A request is served only
+    if every bucket that applies has a token.
+
+    The buckets live in a TokenBucketTable, a fixed-size hash table in shared
+    memory. The middleware is built before the supervisor forks, so all worker
+    processes update the same buckets and the limits hold for the whole server.
+    When the table is full the least recently used buckets are recycled, which
+    at worst gives a long idle client a fresh bucket.
+
+    Rejections skip the app entirely and answer a 429 built from pre-encoded
+    parts, with Retry-After set to the seconds until a token is available.
+
+    Configure it in the middlewares list with functools.partial:
+
+        middlewares = [partial(RateLimitMiddleware, rate=5, burst=10,
+                               routes={"POST /contact": {"rate": 1, "burst": 5}})]
+
+    Attributes:
+        app (Callable): The wrapped WSGI application.
+        rate (float): Requests per second allowed per client (0 disables the client limit).
+        burst (float): Requests a client may make at once.
+        routes (Dict[str, Dict[str, float]]): Route limits, "path" or "METHOD path"
+            mapped to {"rate": ..., "burst": ...}.
+        key_func (Callable[[dict], Optional[str]]): Identifies the client; returning
+            None exempts the request.
+        table (TokenBucketTable): The shared buckets.
+    """
+
+    STATUS = "429 Too Many Requests"
+    BODY = b'{"error": "Too Many Requests"}'
+
+    def __init__(
+        self,
+        app: Callable,
+        rate: float = 10.0,
+        burst: float = 20.0,
+        routes: Optional[Dict[str, Dict[str, float]]] = None,
+        key_func: Callable[[dict], Optional[str]] = default_client_key,
+        table_size: int = 65536,
+        url_handler: Optional[UrlHandler] = None,
+    ) -> None:
+        if rate < 0 or (rate and burst < 1):
+            raise ValueError("RateLimitMiddleware needs rate >= 0 and burst >= 1")
+        for name, limit in (routes or {}).items():
+            if limit.get("rate", 0) <= 0 or limit.get("burst", 0) < 1:
+                raise ValueError(
+                    f"Route limit {name!r} needs a positive rate and burst >= 1"
+                )
+        self.app = app
+        self.rate = rate
+        self.burst = burst
+        self.routes = routes or {}
+        self.key_func = key_func
+        self.url_handler = url_handler or default_url_handler
+        self.table = TokenBucketTable(slots=table_size)
+        self._headers: Dict[int, List[Tuple[str, str]]] = {}
+
+    def __call__(self, environ: dict, start_response: Callable) -> Any:
+        client = self.key_func(environ)
+        if client is None:
+            return self.app(environ, start_response)
+
+        # Route first: a request the route rejects costs no client token, and
+        # one the client bucket rejects gets its route token back
+        route = self._route_limit(environ) if self.routes else None
+        wait = 0.0
+        if route is not None:
+            name, limit = route
+            wait = self.table.take(f"{client}|{name}", limit["rate"], limit["burst"])
+        if not wait and self.rate:
+            wait = self.table.take(client, self.rate, self.burst)
+            if wait and route is not None:
+                self.table.refund(f"{client}|{name}", limit["rate"], limit["burst"])
+        if wait:
+            metrics.incr("ratelimit.rejected")
+            start_response(self.STATUS, self._rejection_headers(wait))
+            return [self.BODY]
+        return self.app(environ, start_response)
+
+    def _route_limit(self, environ: dict) -> Optional[Tuple[str, Dict[str, float]]]:
+        """The route limit that applies to the request, as (name, limit)"""
+        path = environ.get("PATH_INFO", "/")
+        route_info, _ = self.url_handler.resolve(path)
+        if route_info is None:
+            return None
+        route = route_info.get("original_path", path)
+        for name in (f"{environ.get('REQUEST_METHOD', 'GET')} {route}", route):
+            limit = self.routes.get(name)
+            if limit is not None:
+                return name, limit
+        return None
+
+    def _rejection_headers(self, wait: float) -> List[Tuple[str, str]]:
+        retry_after = max(1, math.ceil(wait))
+        headers = self._headers.get(retry_after)
+        if headers is None:
+            headers = self._headers[retry_after] = [
+                ("Content-Type", "application/json"),
+                ("Content-Length", str(len(self.BODY))),
+                ("Retry-After", str(retry_after)),
+            ]
+        return list(headers)
+
+
+class UnitOfWorkMiddleware:
+    """
+    UnitOfWorkMiddleware runs each request in one database transaction.
+
+    All ModelManager calls made while the request is handled share one
+    session. When the app has produced its response the transaction is
+    committed once, so a handler doing several writes pays for one commit and
+    one fsync, and objects returned by the manager stay attached (lazy loads
+    work) until the response is ready. A 5xx response or an exception rolls
+    everything back instead. If the commit fails the client gets a 500, not
+    the response of writes that never happened. Side effects registered with
+    database.on_commit() (broadcasts, cache invalidation) run after the commit
+    and are dropped on a rollback.
+
+    The response is held back until the commit, so start_response is called
+    afterwards and the body is materialized first (handed-over connections
+    such as WebSockets are passed through untouched).
+
+    Attributes:
+        app (Callable): The wrapped WSGI application.
+        database (DatabaseConnection): Database whose sessions are scoped.
+    """
+
+    ERROR_STATUS = "500 Internal Server Error"
+    ERROR_BODY = b'{"error": "Internal Server Error"}'
+
+    def __init__(self, app: Callable, database: Optional[DatabaseConnection] = None) -> None:
+        self.app = app
+        self.database = database or default_database
+
+    def __call__(self, environ: dict, start_response: Callable) -> Any:
+        captured: List[Any] = []
+
+        def deferred_start_response(status, headers, exc_info=None):
+            # Replayed once after the commit: keep the first call, as the
+            # server would, with a full status line
+            if not captured or exc_info is not None:
+                captured[:] = [status_line(status), headers, exc_info]
+
+        with self.database.unit_of_work() as work:
+            try:
+                response_body = self.app(environ, deferred_start_response)
+                if not hasattr(response_body, "upgrade"):
+                    chunks = list(response_body)
+                    if hasattr(response_body, "close"):
+                        response_body.close()
+                    response_body = chunks
+            except Exception:
+                if work.session is not None:
+                    work.rollback()
+                    metrics.incr("db.rollbacks")
+                raise
+
+            if not captured or str(captured[0]).startswith("5"):
+                if work.session is not None:
+                    metrics.incr("db.rollbacks")
+                work.rollback()
+            elif work.session is None:
+                # Nothing to commit, but on_commit callbacks still run
+                work.commit()
+            else:
+                try:
+                    work.commit()
+                    metrics.incr("db.commits")
+                except Exception as e:
+                    print(f"Error committing request transaction: {e}")
+                    work.rollback()
+                    metrics.incr("db.commit_failures")
+                    start_response(
+                        self.ERROR_STATUS,
+                        [
+                            ("Content-Type", "application/json"),
+                            ("Content-Length", str(len(self.ERROR_BODY))),
+                        ],
+                    )
+                    return [self.ERROR_BODY]
+
+        if captured:
+            start_response(*captured)
+        return response_body
+
+
+class QueryStatsMiddleware:
+    """
+    QueryStatsMiddleware reports the SQL each request runs.
+
+    The statements executed while the request is handled are collected by the
+    database's QueryInstrumentation. Their count and total time are added to
+    the response as `X-DB-Queries` and a `Server-Timing: db;dur=...` entry, and
+    recorded in the `db.request_queries` counter and `db.request` timing. Place
+    it before UnitOfWorkMiddleware so the final commit is counted too.
+    Statements run while a streamed body is iterated are not included.
+
+    Attributes:
+        app (Callable): The wrapped WSGI application.
+        database (DatabaseConnection): Database whose statements are counted.
+    """
+
+    def __init__(self, app: Callable, database: Optional[DatabaseConnection] = None) -> None:
+        self.app = app
+        self.database = database or default_database
+
+    def __call__(self, environ: dict, start_response: Callable) -> Any:
+        with self.database.instrumentation.track() as stats:
+
+            def timed_start_response(status, headers, exc_info=None):
+                headers = list(headers) + [
+                    ("X-DB-Queries", str(stats.count)),
+                    (
+                        "Server-Timing",
+                        f'db;dur={stats.time * 1000:.2f};desc="{stats.count} queries"',
+                    ),
+                ]
+                return start_response(status, headers, exc_info)
+
+            response_body = self.app(environ, timed_start_response)
+
+        if stats.count:
+            metrics.incr("db.request_queries", stats.count)
+            metrics.observe("db.request", stats.time)
+        return response_body
+
+
 def apply_middlewares(app, middlewares):
     for mw in reversed(middlewares):
         app = mw(app)
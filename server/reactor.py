@@ -0,0 +1,310 @@
+import os
+import selectors
+import socket
+import ssl
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from server.metrics import metrics
+
+
+class UpgradeBody(list):
+    """
+    Empty WSGI body telling the server to hand the connection over.
+
+    After sending the response head (no Content-Length is added) the server
+    detaches the socket from its worker thread and calls
+    `upgrade(sock, buffered)` with any bytes already read past the request.
+    Used for 101 protocol switches and for streams served from the reactor.
+    """
+
+    def __init__(self, upgrade: Callable[[socket.socket, bytes], None]) -> None:
+        super().__init__()
+        self.upgrade = upgrade
+
+
+class Channel:
+    """
+    A long-lived connection owned by the Reactor instead of a worker thread.
+
+    Writes may come from any thread. They are sent straight away while the
+    socket accepts them; the rest is buffered and flushed by the reactor when
+    the socket becomes writable. Once more than `max_buffer` bytes are waiting
+    the peer is too slow and the channel is closed; above `high_water` reading
+    from the peer is paused so it cannot make us produce more output. Every
+    socket call is made under the channel's lock: a TLS socket must never be
+    read and written by two threads at once.
+
+    Subclasses implement on_data() and may override on_register(), shutdown()
+    and on_close().
+
+    Attributes:
+        sock (socket.socket): The non-blocking client socket.
+        reactor (Reactor): The reactor driving this channel.
+        outbound (bytearray): Bytes waiting to be sent.
+        max_buffer (int): Largest amount of buffered output before the channel is dropped.
+        high_water (int): Buffered output above which reads are paused.
+        closed (bool): True once the channel has been closed.
+
+    Methods:
+        write(data) -> bool:
+            Sends or buffers data. Returns False if the channel is (now) closed.
+
+        close(after_flush=False):
+            Closes the channel, optionally once buffered output has been sent.
+
+        on_register():
+            Called on the reactor thread once the channel is watched.
+
+        on_data(data):
+            Called on the reactor thread with bytes received from the peer.
+
+        shutdown():
+            Closes the channel politely when the server drains.
+
+        on_close():
+            Called once when the channel is closed.
+    """
+
+    def __init__(
+        self,
+        sock: socket.socket,
+        loop: Optional["Reactor"] = None,
+        max_buffer: int = 1024 * 1024,
+        high_water: int = 256 * 1024,
+    ) -> None:
+        self.sock = sock
+        self.reactor: Reactor = loop or reactor
+        self.outbound = bytearray()
+        self.max_buffer = max_buffer
+        self.high_water = high_water
+        self.closed = False
+        self._closing = False
+        self._lock = threading.Lock()
+        sock.setblocking(False)
+
+    def fileno(self) -> int:
+        return self.sock.fileno()
+
+    def interest(self) -> int:
+        """Selector events this channel currently waits for"""
+        events = 0
+        if not self._closing and len(self.outbound) < self.high_water:
+            events |= selectors.EVENT_READ
+        if self.outbound:
+            events |= selectors.EVENT_WRITE
+        return events
+
+    def write(self, data: bytes) -> bool:
+        with self._lock:
+            if self.closed or self._closing:
+                return False
+            ok = len(self.outbound) + len(data) <= self.max_buffer
+            if ok:
+                was_empty = not self.outbound
+                self.outbound += data
+                if was_empty:
+                    # Nothing queued before us: try the socket right away
+                    ok = self._flush()
+                    if ok and self.outbound:
+                        self.reactor.update(self)
+            else:
+                metrics.incr("reactor.slow_consumer")
+        if not ok:
+            self.close()
+        return ok
+
+    def _flush(self) -> bool:
+        """Send as much buffered output as the socket takes. Caller holds the lock."""
+        while self.outbound:
+            try:
+                sent = self.sock.send(self.outbound)
+            except (BlockingIOError, ssl.SSLWantWriteError, ssl.SSLWantReadError):
+                return True
+            except OSError:
+                self.outbound.clear()
+                return False
+            del self.outbound[:sent]
+        return True
+
+    def on_writable(self) -> None:
+        with self._lock:
+            ok = self._flush()
+            done = self._closing and not self.outbound
+        if not ok or done:
+            self.close()
+        else:
+            self.reactor.update(self)
+
+    def on_readable(self) -> None:
+        # The socket is non-blocking, so writers wait at most one recv; the
+        # lock is released before on_data(), which may write
+        with self._lock:
+            if self.closed:
+                return
+            try:
+                data = self.sock.recv(65536)
+                # TLS may hold decrypted bytes the selector does not know about
+                while (
+                    data
+                    and isinstance(self.sock, ssl.SSLSocket)
+                    and self.sock.pending()
+                ):
+                    data += self.sock.recv(self.sock.pending())
+            except (BlockingIOError, ssl.SSLWantReadError, ssl.SSLWantWriteError):
+                return
+            except OSError:
+                data = b""
+        if not data:
+            self.close()
+            return
+        self.on_data(data)
+
+    def on_register(self) -> None:
+        pass
+
+    def on_data(self, data: bytes) -> None:
+        raise NotImplementedError
+
+    def shutdown(self) -> None:
+        self.close(after_flush=True)
+
+    def on_close(self) -> None:
+        pass
+
+    def close(self, after_flush: bool = False) -> None:
+        with self._lock:
+            if self.closed:
+                return
+            if after_flush and self.outbound:
+                self._closing = True
+                self.reactor.update(self)
+                return
+            self.closed = True
+        self.reactor.update(self, close=True)
+        try:
+            self.on_close()
+        except Exception as e:
+            print(f"Error closing channel: {e}")
+
+
+class Reactor:
+    """
+    Reactor multiplexes long-lived connections (WebSockets, event streams) on a
+    single selector thread, so idle connections cost no thread and no CPU.
+
+    Only the reactor thread touches the selector. Other threads ask for changes
+    through update(), which queues them and wakes the selector through a pipe.
+
+    Attributes:
+        channels (Dict[int, Channel]): Registered channels by file descriptor.
+
+    Methods:
+        register(channel):
+            Starts watching a channel (starts the thread on first use).
+
+        update(channel, close=False):
+            Re-evaluates the channel's interest, or closes and forgets it.
+
+        close_all(after_flush=True):
+            Closes every channel, e.g. when the server drains.
+    """
+
+    def __init__(self) -> None:
+        self.channels: Dict[int, Channel] = {}
+        self._selector: Optional[selectors.BaseSelector] = None
+        self._pending: Deque[Tuple[Channel, bool]] = deque()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._wakeup_r = -1
+        self._wakeup_w = -1
+
+        metrics.gauge("reactor.channels", lambda: len(self.channels))
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._selector = selectors.DefaultSelector()
+            self._wakeup_r, self._wakeup_w = os.pipe()
+            os.set_blocking(self._wakeup_r, False)
+            os.set_blocking(self._wakeup_w, False)
+            self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def register(self, channel: Channel) -> None:
+        if self._thread is None:
+            self.start()
+        self.update(channel)
+
+    def update(self, channel: Channel, close: bool = False) -> None:
+        self._pending.append((channel, close))
+        if threading.current_thread() is not self._thread:
+            try:
+                os.write(self._wakeup_w, b"x")
+            except OSError:
+                pass
+
+    def close_all(self, after_flush: bool = True) -> None:
+        for channel in list(self.channels.values()):
+            if after_flush:
+                channel.shutdown()
+            else:
+                channel.close()
+
+    def _apply_pending(self) -> None:
+        assert self._selector is not None
+        while self._pending:
+            channel, close = self._pending.popleft()
+            fd = channel.sock.fileno()
+            if fd == -1:
+                continue
+            if close or channel.closed:
+                if self.channels.pop(fd, None) is not None:
+                    self._selector.unregister(fd)
+                try:
+                    channel.sock.close()
+                except OSError:
+                    pass
+                continue
+            events = channel.interest()
+            if not events:
+                continue
+            if fd in self.channels:
+                self._selector.modify(fd, events, channel)
+            else:
+                self.channels[fd] = channel
+                self._selector.register(fd, events, channel)
+                try:
+                    channel.on_register()
+                except Exception as e:
+                    print(f"Error in reactor channel: {e}")
+                    channel.close()
+
+    def _run(self) -> None:
+        assert self._selector is not None
+        while True:
+            self._apply_pending()
+            events: List[Tuple[selectors.SelectorKey, int]] = self._selector.select()
+            for key, mask in events:
+                if key.fd == self._wakeup_r:
+                    try:
+                        while os.read(self._wakeup_r, 4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                channel: Channel = key.data
+                try:
+                    if mask & selectors.EVENT_WRITE:
+                        channel.on_writable()
+                    if mask & selectors.EVENT_READ and not channel.closed:
+                        channel.on_readable()
+                except Exception as e:
+                    print(f"Error in reactor channel: {e}")
+                    channel.close()
+
+
+reactor: Reactor = Reactor()
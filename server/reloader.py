@@ -1,6 +1,7 @@
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler, FileSystemEvent
 import os, sys
+import signal
 import functools
 from typing import Callable, Any
 
@@ -8,9 +9,15 @@ from typing import Callable, Any
 class ReloadHandler(FileSystemEventHandler):
     def __init__(self, restart_func: Callable[[], None]) -> None:
         self.restart_func: Callable[[], None] = restart_func
+        self.restarting: bool = False
 
     def on_any_event(self, event: FileSystemEvent) -> None:
-        if event.src_path.endswith(".py"):
+        # Reading a file (e.g. a replacement process importing it) is not a change
+        if event.event_type not in ("modified", "created", "moved", "deleted"):
+            return
+        # An editor save fires several events; restart once
+        if event.src_path.endswith(".py") and not self.restarting:
+            self.restarting = True
             print(f"Detected code change in {event.src_path}. Reloading server...")
             self.restart_func()
 
@@ -19,6 +26,11 @@ def start_with_reloader(func: Callable[..., Any]) -> Callable[..., Any]:
     @functools.wraps(func)
     def wrapper(*args: Any, **kwargs: Any) -> Any:
         def restart() -> None:
+            if signal.getsignal(signal.SIGUSR1) not in (signal.SIG_DFL, None):
+                # The server drains in-flight requests and re-executes itself,
+                # keeping its listening socket open across the restart
+                os.kill(os.getpid(), signal.SIGUSR1)
+                return
             print("Restarting server process...")
             os.execv(sys.executable, ["python"] + sys.argv)
 
@@ -1,4 +1,5 @@
 from typing import Optional
+from urllib.parse import parse_qsl
 import json
 
 
@@ -55,11 +56,7 @@ class Request:
         return None
 
     def get_query_param(self, name: str) -> Optional[str]:
-        if "?" in self.path:
-            query_string = self.path.split("?", 1)[1]
-            params = dict(param.split("=") for param in query_string.split("&"))
-            return params.get(name)
-        return None
+        return self.parse_query_params().get(name)
 
     def get_json_body(self) -> Optional[dict]:
         if self.get_header("Content-Type") == "application/json":
@@ -84,5 +81,6 @@ class Request:
         """Parse the query parameters from the request path."""
         if "?" in self.path:
             query_string = self.path.split("?", 1)[1]
-            return dict(param.split("=") for param in query_string.split("&"))
+            # Bare flags (?debug) get "", empty pairs are skipped
+            return dict(parse_qsl(query_string, keep_blank_values=True))
         return {}
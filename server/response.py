@@ -1,7 +1,19 @@
-from typing import Callable, Any, Optional, List, Tuple
+from http import HTTPStatus
+from typing import Callable, Any, Optional, List, Tuple, Union
 import json
 
 
+def status_line(status: Union[int, str]) -> str:
+    """Full "<code> <reason>" status for a bare code such as 200 or "200" """
+    text = str(status).strip()
+    if text.isdigit():
+        try:
+            return f"{text} {HTTPStatus(int(text)).phrase}"
+        except ValueError:
+            return f"{text} UNKNOWN"
+    return text
+
+
 class Response:
     """
     Represents an HTTP response for a WSGI web server.
@@ -0,0 +1,165 @@
+import heapq
+import itertools
+import threading
+import time
+from typing import Dict, List, Optional
+
+from server.metrics import metrics
+
+
+PRIORITIES: Dict[str, int] = {"high": 0, "normal": 1, "low": 2}
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request's client deadline passed before it could run"""
+
+
+class SchedulerOverflow(Exception):
+    """Raised when too many requests are already waiting for a worker slot"""
+
+
+class Ticket:
+    """A request waiting for, or holding, a worker slot"""
+
+    __slots__ = ("key", "priority", "deadline", "event", "granted", "expired", "cancelled")
+
+    def __init__(self, key: str, priority: int, deadline: Optional[float]) -> None:
+        self.key = key
+        self.priority = priority
+        self.deadline = deadline
+        self.event = threading.Event()
+        self.granted = False
+        self.expired = False
+        self.cancelled = False
+
+
+class RequestScheduler:
+    """
+    RequestScheduler limits how many requests run the WSGI app at once and decides
+    which waiting request runs next.
+
+    Waiting requests are served by priority class ("high" before "normal" before
+    "low"), then by earliest client deadline, then in arrival order. Each route
+    may also declare a bulkhead (`max_concurrency`): once that many requests for
+    the route are running, further ones wait while other routes keep using the
+    free slots. Requests whose client deadline passes while they wait are dropped
+    instead of being run.
+
+    Attributes:
+        workers (int): Number of requests allowed to run at once.
+        max_waiting (int): Maximum number of requests waiting for a slot.
+        active (int): Requests currently holding a slot.
+        running (Dict[str, int]): Running requests per bulkhead key.
+
+    Methods:
+        acquire(key, priority="normal", max_concurrency=None, deadline=None) -> Ticket:
+            Blocks until the request may run. Raises DeadlineExceeded or SchedulerOverflow.
+
+        release(ticket):
+            Frees the slot held by ticket and wakes the next eligible request.
+
+        waiting() -> int:
+            Number of requests currently waiting.
+    """
+
+    def __init__(self, workers: int = 32, max_waiting: int = 256) -> None:
+        self.workers = workers
+        self.max_waiting = max_waiting
+        self.active = 0
+        self.running: Dict[str, int] = {}
+        self._limits: Dict[str, Optional[int]] = {}
+        self._heap: List[tuple] = []
+        self._waiting = 0
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+        metrics.gauge("scheduler.active", lambda: self.active)
+        metrics.gauge("scheduler.waiting", self.waiting)
+
+    def waiting(self) -> int:
+        return self._waiting
+
+    def acquire(
+        self,
+        key: str,
+        priority: str = "normal",
+        max_concurrency: Optional[int] = None,
+        deadline: Optional[float] = None,
+    ) -> Ticket:
+        if deadline is not None and deadline <= time.time():
+            metrics.incr("scheduler.deadline_expired")
+            raise DeadlineExceeded(key)
+
+        ticket = Ticket(key, PRIORITIES.get(priority, PRIORITIES["normal"]), deadline)
+        with self._lock:
+            self._limits[key] = max_concurrency
+            if self._waiting >= self.max_waiting:
+                metrics.incr("scheduler.overflow")
+                raise SchedulerOverflow(key)
+            heapq.heappush(
+                self._heap,
+                (
+                    ticket.priority,
+                    deadline if deadline is not None else float("inf"),
+                    next(self._counter),
+                    ticket,
+                ),
+            )
+            self._waiting += 1
+            self._dispatch()
+            if ticket.granted:
+                return ticket
+
+        timeout = None if deadline is None else max(0.0, deadline - time.time())
+        ticket.event.wait(timeout)
+
+        with self._lock:
+            if ticket.granted:
+                return ticket
+            if not ticket.expired:
+                # Timed out while still queued: leave it for _dispatch to discard
+                ticket.cancelled = True
+                self._waiting -= 1
+        metrics.incr("scheduler.deadline_expired")
+        raise DeadlineExceeded(key)
+
+    def release(self, ticket: Ticket) -> None:
+        with self._lock:
+            self.active -= 1
+            self.running[ticket.key] -= 1
+            self._dispatch()
+
+    def _can_run(self, key: str) -> bool:
+        if self.active >= self.workers:
+            return False
+        limit = self._limits.get(key)
+        return limit is None or self.running.get(key, 0) < limit
+
+    def _grant(self, ticket: Ticket) -> None:
+        ticket.granted = True
+        self.active += 1
+        self.running[ticket.key] = self.running.get(ticket.key, 0) + 1
+        ticket.event.set()
+
+    def _dispatch(self) -> None:
+        """Hand free slots to the best eligible waiters. Caller holds the lock."""
+        blocked = []
+        now = time.time()
+        while self._heap and self.active < self.workers:
+            entry = heapq.heappop(self._heap)
+            ticket: Ticket = entry[3]
+            if ticket.cancelled:
+                continue
+            if ticket.deadline is not None and ticket.deadline <= now:
+                ticket.expired = True
+                self._waiting -= 1
+                ticket.event.set()
+                continue
+            if not self._can_run(ticket.key):
+                # Bulkhead is full; keep its place and try the next request
+                blocked.append(entry)
+                continue
+            self._waiting -= 1
+            self._grant(ticket)
+        for entry in blocked:
+            heapq.heappush(self._heap, entry)
@@ -1,12 +1,55 @@
 import json
+import os
+import select
 import socket
+import ssl
+import subprocess
 import threading
+import time
 from urllib.parse import parse_qs
-from io import StringIO
+from io import BytesIO
 import sys
 import signal
 from typing import Callable, Dict, Any, List, Tuple, Optional
 from server.request import Request
+from server.response import status_line
+from server.admission import AdmissionController
+from server.scheduler import RequestScheduler, DeadlineExceeded, SchedulerOverflow
+from server.urlhandler import url_handler
+from server.metrics import metrics
+from server.reactor import reactor
+from server.listeners import (
+    LISTEN_FDS_ENV,
+    SocketOptions,
+    create_listener,
+    inherited_listeners,
+    describe,
+)
+from server.connection import (
+    Connection,
+    ConnectionTimeouts,
+    ConnectionTimeout,
+    HeadersTooLarge,
+    BadRequest,
+    REQUEST_TIMEOUT_RESPONSE,
+    HEADERS_TOO_LARGE_RESPONSE,
+    NOT_IMPLEMENTED_RESPONSE,
+)
+
+
+DEADLINE_EXCEEDED_RESPONSE: bytes = (
+    b"HTTP/1.1 504 Gateway Timeout\r\n"
+    b"Content-Type: text/plain\r\n"
+    b"Content-Length: 0\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+)
+
+# Pipelined requests with these methods may run concurrently
+PIPELINE_SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# Environment variable a replacement process uses to signal it is ready
+READY_FD_ENV = "SERVER_READY_FD"
 
 
 class Server:
@@ -15,31 +58,101 @@ class Server:
 
     This Server class listens for incoming HTTP connections, parses requests,
     creates WSGI environ dictionaries, and delegates request handling to a WSGI app.
-    It supports graceful shutdown via SIGINT and handles each request in a separate thread.
+    It handles each connection in a separate thread.
+
+    On SIGINT or SIGTERM it drains: it stops accepting, closes idle keep-alive
+    connections, lets in-flight requests finish within `drain_timeout` and returns
+    from run(). On SIGHUP it starts a new copy of the process that inherits the
+    listening socket, waits until that copy is ready, then drains. On SIGUSR1
+    (sent by the reloader) it drains and re-executes itself in place with the
+    same socket. Since the socket is never closed in between, the port does not
+    refuse connections.
 
     Attributes:
         wsgi_app (Callable): The WSGI application callable.
         host (str): The hostname or IP address to bind the server to.
         port (int): The port number to listen on.
-        socket (Optional[socket.socket]): The server's listening socket.
+        binds (List[str]): Listener specs: "host:port", "unix:/path" or "fd://N".
+            Defaults to host:port.
+        socket_options (SocketOptions): Backlog, TCP_NODELAY, SO_REUSEPORT,
+            TCP_DEFER_ACCEPT and buffer sizes.
+        ssl_context (Optional[ssl.SSLContext]): Terminates TLS on TCP listeners when set.
+            Unix socket listeners stay plaintext.
+        max_pipeline (int): Pipelined requests per connection run at once (1 serves
+            them one by one).
+        sockets (List[socket.socket]): The listening sockets.
+        socket (Optional[socket.socket]): The first listening socket.
         running (bool): Indicates if the server is running.
+        admission (AdmissionController): Sheds load with a fast 503 when saturated.
+        scheduler (RequestScheduler): Orders requests by route priority and bulkheads.
+        timeouts (ConnectionTimeouts): Header, body, keep-alive and write limits.
+        drain_timeout (float): Seconds in-flight requests get to finish on shutdown.
+        connections (set): Connections currently being served.
+        requests_handled (int): Requests served by this process.
+        request_limit (int): Stop accepting after this many requests (0 disables).
+        on_request_limit (Optional[Callable[[], None]]): Called instead of
+            stop_accepting() when request_limit is reached; the Supervisor
+            uses it to retire the worker.
+        active_requests (Dict[int, float]): Start time of each running request by thread id.
 
     Methods:
         __init__(wsgi_app, host, port): Initializes the server and sets up signal handling.
         
-        _graceful_shutdown(signum, frame): Handles graceful shutdown on SIGINT.
+        _graceful_shutdown(signum, frame): Stops accepting on SIGINT/SIGTERM so run() drains.
+
+        _handoff(signum, frame): Starts a replacement process on SIGHUP.
+
+        stop_accepting(): Stops the accept loop without closing the listening socket.
+
+        drain(): Waits for in-flight requests to finish, up to drain_timeout.
+
+        reexec(): Drains, then re-executes the process in place keeping the socket.
+
+        spawn_replacement(): Starts a copy of the process on the same socket.
+
+        export_listeners(): Makes the listening sockets survive an exec.
+
+        after_fork(): Re-initializes per-process state in a forked worker.
+
+        serve(): Runs the accept loop on an already started socket, then drains.
         
         start_server(): Initializes and starts the server socket.
         
         accept_connections(): Accepts incoming connections and spawns threads for requests.
         
-        handle_request(client_socket): Handles an individual HTTP request.
+        handle_request(client_socket, enqueued_at): Serves requests on a connection until
+            it is closed, times out or keep-alive ends.
+
+        hand_over(connection): Passes an upgraded connection to its new protocol.
+
+        parse_request_head(head): Parses the request line and headers.
+
+        process_request(connection, head): Reads the body, runs the app and responds.
+
+        process_pipeline(connection, first): Runs buffered pipelined requests
+            concurrently and answers them in order.
+
+        read_request(connection, head): Parses a request head and reads its body.
+
+        content_length(headers): Body length of a request; raises BadRequest for
+            Transfer-Encoding or an invalid Content-Length.
+
+        respond(connection, method, path, query_string, headers, body, keep_alive):
+            Runs the app and returns the encoded response.
+
+        uses_tls(client_socket): Whether a connection accepted on client_socket's listener is TLS.
+
+        shed_connection(client_socket): Answers with the pre-encoded 503 and closes.
+
+        schedule(method, path, headers): Waits for a worker slot for the matched route.
         
-        create_wsgi_environ(method, path, query_string, headers, raw_request): Builds WSGI environ dict.
+        create_wsgi_environ(method, path, query_string, headers, body, url_scheme, remote_addr): Builds WSGI environ dict.
         
         parse_json(body, content_type): Parses JSON body if content type is application/json.
         
-        send_response(client_socket, response_data, response_body): Sends HTTP response to client.
+        send_response(connection, response_data, response_body, keep_alive): Sends HTTP response to client.
+
+        encode_response(response_data, response_body, keep_alive): Encodes an HTTP response.
         
         stop_server(): Stops the server and closes the socket.
         
@@ -56,6 +169,14 @@ class Server:
         ],
         host: str = "127.0.0.1",
         port: int = 8000,
+        admission: Optional[AdmissionController] = None,
+        scheduler: Optional[RequestScheduler] = None,
+        timeouts: Optional[ConnectionTimeouts] = None,
+        drain_timeout: float = 30.0,
+        binds: Optional[List[str]] = None,
+        socket_options: Optional[SocketOptions] = None,
+        ssl_context: Optional[ssl.SSLContext] = None,
+        max_pipeline: int = 8,
     ) -> None:
         self.wsgi_app: Callable[
             [
@@ -66,79 +187,464 @@ class Server:
         ] = wsgi_app
         self.host: str = host
         self.port: int = port
+        self.binds: List[str] = binds or [f"{host}:{port}"]
+        self.socket_options: SocketOptions = socket_options or SocketOptions()
+        self.ssl_context: Optional[ssl.SSLContext] = ssl_context
+        self.max_pipeline: int = max_pipeline
+        if ssl_context is not None:
+            metrics.gauge("tls.session_cache", ssl_context.session_stats)
+        self.sockets: List[socket.socket] = []
         self.socket: Optional[socket.socket] = None
+        self._handed_off: bool = False
         self.running: bool = False
+        self.admission: AdmissionController = admission or AdmissionController()
+        self.scheduler: RequestScheduler = scheduler or RequestScheduler()
+        self.timeouts: ConnectionTimeouts = timeouts or ConnectionTimeouts()
+        self.drain_timeout: float = drain_timeout
+        self.connections: set = set()
+        self._connections_lock = threading.Lock()
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        self._restart: Optional[str] = None
+        self._handoff_started: bool = False
+        self.multiprocess: bool = False
+        self.requests_handled: int = 0
+        self.request_limit: int = 0
+        self.on_request_limit: Optional[Callable[[], None]] = None
+        self.active_requests: Dict[int, float] = {}
+        self.install_signal_handlers()
+
+    def install_signal_handlers(self) -> None:
         signal.signal(signal.SIGINT, self._graceful_shutdown)
+        signal.signal(signal.SIGTERM, self._graceful_shutdown)
+        signal.signal(signal.SIGHUP, self._handoff)
+        signal.signal(signal.SIGUSR1, lambda signum, frame: self.reexec())
+
+    def after_fork(self) -> None:
+        """Prepare a forked worker process to serve from the inherited socket"""
+        os.close(self._wakeup_r)
+        os.close(self._wakeup_w)
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        self.multiprocess = True
+        self.install_signal_handlers()
 
     def _graceful_shutdown(self, signum: int, frame: Any) -> None:
         """Handle graceful shutdown on signal"""
+        if not self.running:
+            # Second signal while draining: give up on in-flight requests
+            print("Forcing shutdown...")
+            os._exit(1)
         print("Shutting down server gracefully...")
-        self.stop_server()
-        sys.exit(0)
+        self.stop_accepting()
+
+    def _handoff(self, signum: int, frame: Any) -> None:
+        """Start a replacement process that inherits the listening socket"""
+        if self._handoff_started or not self.running:
+            return
+        self._handoff_started = True
+
+        def handoff() -> None:
+            if self.spawn_replacement():
+                self.stop_accepting()
+            else:
+                self._handoff_started = False
+
+        threading.Thread(target=handoff, daemon=True).start()
+
+    def spawn_replacement(self, ready_timeout: float = 30.0) -> bool:
+        """Start a copy of this process on the same socket and wait until it is ready"""
+        if not self.sockets:
+            return False
+        fds: List[int] = [sock.fileno() for sock in self.sockets]
+        ready_r, ready_w = os.pipe()
+        env = dict(os.environ)
+        env[LISTEN_FDS_ENV] = ",".join(str(fd) for fd in fds)
+        env[READY_FD_ENV] = str(ready_w)
+
+        print("Starting replacement server process...")
+        child = subprocess.Popen(
+            [sys.executable] + sys.argv, env=env, pass_fds=(*fds, ready_w)
+        )
+        os.close(ready_w)
+
+        readable, _, _ = select.select([ready_r], [], [], ready_timeout)
+        ready = bool(readable) and os.read(ready_r, 1) == b"1"
+        os.close(ready_r)
+
+        if not ready:
+            print("Replacement process did not become ready; keeping this one.")
+            child.kill()
+            return False
+
+        print(f"Replacement process {child.pid} is ready, draining this one...")
+        self._handed_off = True
+        return True
+
+    def export_listeners(self) -> None:
+        """Mark the listening sockets inheritable across exec and advertise them"""
+        for sock in self.sockets:
+            os.set_inheritable(sock.fileno(), True)
+        os.environ[LISTEN_FDS_ENV] = ",".join(
+            str(sock.fileno()) for sock in self.sockets
+        )
 
     def start_server(self) -> None:
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.socket.bind((self.host, self.port))
-        self.socket.listen(5)
+        # Reuse sockets handed over by a previous process or socket activation
+        self.sockets = inherited_listeners()
+        if not self.sockets:
+            self.sockets = [
+                create_listener(spec, self.socket_options) for spec in self.binds
+            ]
+        self.socket = self.sockets[0]
+        for sock in self.sockets:
+            sock.setblocking(False)
+            scheme: str = "https" if self.uses_tls(sock) else "http"
+            print(f"Server running on {describe(sock, scheme)}")
         self.running = True
-        print(f"Server running on http://{self.host}:{self.port}")
         try:
             import main
         except ImportError:
             pass
 
+        ready_fd: Optional[str] = os.environ.pop(READY_FD_ENV, None)
+        if ready_fd:
+            os.write(int(ready_fd), b"1")
+            os.close(int(ready_fd))
+
     def accept_connections(self) -> None:
-        if self.socket is None:
+        if not self.sockets:
             raise RuntimeError(
                 "Server socket is not initialized. Call start_server() first."
             )
 
+        nodelay: bool = self.socket_options.nodelay
         while self.running:
             try:
-                client_socket, address = self.socket.accept()
-                # Handle each request in a separate thread
-                thread: threading.Thread = threading.Thread(
-                    target=self.handle_request, args=(client_socket,)
+                readable, _, _ = select.select(
+                    self.sockets + [self._wakeup_r], [], []
                 )
-                thread.daemon = True
-                thread.start()
             except OSError:
                 break
+            if self._wakeup_r in readable:
+                os.read(self._wakeup_r, 1)
+                continue
 
-    def handle_request(self, client_socket: socket.socket) -> None:
-        try:
-            # Receive HTTP request
-            request_data: str = client_socket.recv(1024).decode("utf-8")
+            for listener in readable:
+                self._accept_pending(listener, nodelay)
 
-            if not request_data:
+    def _accept_pending(self, listener: socket.socket, nodelay: bool) -> None:
+        """Accept everything pending on listener before waiting again"""
+        while self.running:
+            try:
+                client_socket, address = listener.accept()
+            except (BlockingIOError, InterruptedError):
                 return
+            except OSError:
+                return
+            if nodelay and client_socket.family != socket.AF_UNIX:
+                client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            enqueued_at: Optional[float] = self.admission.try_enqueue()
+            if enqueued_at is None:
+                self.shed_connection(client_socket)
+                continue
+            # Handle each request in a separate thread
+            thread: threading.Thread = threading.Thread(
+                target=self.handle_request, args=(client_socket, enqueued_at)
+            )
+            thread.daemon = True
+            thread.start()
+
+    def uses_tls(self, client_socket: socket.socket) -> bool:
+        return self.ssl_context is not None and client_socket.family != socket.AF_UNIX
+
+    def shed_connection(self, client_socket: socket.socket) -> None:
+        """Answer with the pre-encoded 503 without reading the request"""
+        try:
+            # A TLS client cannot read a plaintext 503 and the accept loop must
+            # not do a handshake, so TLS connections are just closed
+            if not self.uses_tls(client_socket):
+                client_socket.sendall(self.admission.shed_response)
+        except OSError:
+            pass
+        finally:
+            client_socket.close()
+
+    def schedule(self, method: str, path: str, headers: Dict[str, str]) -> Any:
+        """
+        Wait until the route matching path may run.
+
+        The client deadline is read from the `X-Request-Deadline` header as a Unix
+        timestamp in seconds. Raises DeadlineExceeded or SchedulerOverflow.
+        """
+        route_info, _ = url_handler.resolve(path)
+        if route_info is None:
+            key, priority, max_concurrency = "", "normal", None
+        else:
+            key = route_info.get("original_path", path)
+            priority = route_info.get("priority", "normal")
+            max_concurrency = route_info.get("max_concurrency")
+
+        deadline: Optional[float] = None
+        if "X_REQUEST_DEADLINE" in headers:
+            try:
+                deadline = float(headers["X_REQUEST_DEADLINE"])
+            except ValueError:
+                deadline = None
+
+        return self.scheduler.acquire(key, priority, max_concurrency, deadline)
 
-            # Parse HTTP request
-            lines: List[str] = request_data.split("\n")
-            request_line: str = lines[0]
-            method: str
-            path: str
-            version: str
-            method, path, version = request_line.split()
-
-            # Extract query string
-            query_string: str
-            if "?" in path:
-                path, query_string = path.split("?", 1)
+    def handle_request(
+        self, client_socket: socket.socket, enqueued_at: Optional[float] = None
+    ) -> None:
+        if enqueued_at is None:
+            enqueued_at = self.admission.try_enqueue()
+        if enqueued_at is None or not self.admission.start(enqueued_at):
+            self.shed_connection(client_socket)
+            return
+
+        if self.uses_tls(client_socket):
+            # Wrapping does no I/O; the handshake runs below in this thread
+            client_socket = self.ssl_context.wrap_socket(  # type: ignore[union-attr]
+                client_socket, server_side=True, do_handshake_on_connect=False
+            )
+        connection: Connection = Connection(client_socket, self.timeouts)
+        with self._connections_lock:
+            self.connections.add(connection)
+        upgraded: bool = False
+        # The slot taken at accept covers the handshake and first request;
+        # later keep-alive requests are admitted one by one, so an idle
+        # connection does not hold an in-flight slot while it waits
+        admitted: bool = True
+        try:
+            connection.handshake()
+            keep_alive: bool = True
+            idle: bool = False
+            while keep_alive:
+                head: Optional[bytes] = connection.read_head(idle=idle)
+                if head is None:
+                    break
+                if not admitted:
+                    enqueued_at = self.admission.try_enqueue()
+                    if enqueued_at is None or not self.admission.start(enqueued_at):
+                        self._send_quietly(connection, self.admission.shed_response)
+                        break
+                    admitted = True
+                idle = True
+                try:
+                    keep_alive = self.process_request(connection, head) and self.running
+                finally:
+                    self.admission.finish()
+                    admitted = False
+            # A 101 response went out: the socket now belongs to another protocol
+            upgraded = connection.upgrade is not None
+
+        except ConnectionTimeout as e:
+            if e.phase not in ("keepalive", "handshake"):
+                self._send_quietly(connection, REQUEST_TIMEOUT_RESPONSE)
+        except HeadersTooLarge:
+            self._send_quietly(connection, HEADERS_TOO_LARGE_RESPONSE)
+        except BadRequest as e:
+            metrics.incr("connection.bad_request")
+            self._send_quietly(connection, e.response)
+        except ssl.SSLError:
+            # Failed handshakes are counted in tls.handshake_failed
+            pass
+        except Exception as e:
+            print(f"Error handling request: {e}")
+        finally:
+            with self._connections_lock:
+                self.connections.discard(connection)
+            if admitted:
+                self.admission.finish()
+            if upgraded:
+                self.hand_over(connection)
             else:
-                query_string = ""
+                connection.close()
 
-            # Parse headers
-            headers: Dict[str, str] = {}
-            for line in lines[1:]:
-                if ":" in line:
-                    key, value = line.split(":", 1)
-                    headers[key.strip().upper().replace("-", "_")] = value.strip()
+    def hand_over(self, connection: Connection) -> None:
+        """Pass an upgraded connection's socket and unread bytes to its new owner"""
+        buffered: bytes = bytes(connection.buffer)
+        sock: socket.socket = connection.detach()
+        try:
+            connection.upgrade(sock, buffered)  # type: ignore[misc]
+        except Exception as e:
+            print(f"Error upgrading connection: {e}")
+            sock.close()
 
+    def _send_quietly(self, connection: Connection, data: bytes) -> None:
+        try:
+            connection.sendall(data)
+        except (OSError, ConnectionTimeout):
+            pass
+
+    def parse_request_head(
+        self, head: bytes
+    ) -> Tuple[str, str, str, str, Dict[str, str]]:
+        """Parse a request head into method, path, query string, version and headers"""
+        lines: List[str] = head.decode("utf-8", errors="replace").split("\r\n")
+        method, path, version = lines[0].split()
+
+        # Extract query string
+        query_string: str
+        if "?" in path:
+            path, query_string = path.split("?", 1)
+        else:
+            query_string = ""
+
+        # Parse headers
+        headers: Dict[str, str] = {}
+        for line in lines[1:]:
+            if ":" in line:
+                key, value = line.split(":", 1)
+                headers[key.strip().upper().replace("-", "_")] = value.strip()
+
+        return method, path, query_string, version, headers
+
+    def wants_keep_alive(self, version: str, headers: Dict[str, str]) -> bool:
+        connection_header = headers.get("CONNECTION", "").lower()
+        if version == "HTTP/1.0":
+            return "keep-alive" in connection_header
+        return "close" not in connection_header
+
+    def process_request(self, connection: Connection, head: bytes) -> bool:
+        """Read the body, run the WSGI app and send the response. Returns keep-alive."""
+        request: Tuple[Any, ...] = self.read_request(connection, head)
+        method: str = request[0]
+        keep_alive: bool = request[-1]
+        if (
+            keep_alive
+            and "UPGRADE" not in request[3]
+            and self.max_pipeline > 1
+            and method in PIPELINE_SAFE_METHODS
+            and connection.next_buffered_method() in PIPELINE_SAFE_METHODS
+        ):
+            return self.process_pipeline(connection, request)
+
+        response, keep_alive = self.respond(connection, *request)
+        connection.sendall(response)
+        return keep_alive
+
+    def process_pipeline(self, connection: Connection, first: Tuple[Any, ...]) -> bool:
+        """
+        Serve a run of pipelined safe requests concurrently.
+
+        Requests whose complete head is already buffered are read up to
+        max_pipeline at a time, run in parallel (still subject to the scheduler)
+        and answered strictly in the order they arrived.
+        """
+        batch: List[Tuple[Any, ...]] = [first]
+        # A bad request ends the batch; the ones before it are still answered
+        bad: Optional[BadRequest] = None
+        while (
+            len(batch) < self.max_pipeline
+            and batch[-1][-1]
+            and self.running
+            and connection.next_buffered_method() in PIPELINE_SAFE_METHODS
+        ):
+            head: Optional[bytes] = connection.read_head()
+            if head is None:
+                break
+            try:
+                batch.append(self.read_request(connection, head))
+            except BadRequest as e:
+                bad = e
+                break
+        metrics.incr("connection.pipelined", len(batch) - 1)
+
+        results: List[List[Any]] = [[threading.Event(), None, None] for _ in batch]
+
+        def run(index: int) -> None:
+            result = results[index]
+            try:
+                result[1] = self.respond(connection, *batch[index])
+            except Exception as e:
+                result[2] = e
+            finally:
+                result[0].set()
+
+        for index in range(1, len(batch)):
+            threading.Thread(target=run, args=(index,), daemon=True).start()
+        run(0)
+
+        keep_alive: bool = True
+        for result in results:
+            result[0].wait()
+            if result[2] is not None:
+                raise result[2]
+            data, keep_alive = result[1]
+            connection.sendall(data)
+            if not keep_alive:
+                break
+        if bad is not None and keep_alive:
+            raise bad
+        return keep_alive
+
+    def read_request(self, connection: Connection, head: bytes) -> Tuple[Any, ...]:
+        """
+        Parse a request head and read its body.
+
+        Returns (method, path, query_string, headers, body, keep_alive).
+        """
+        method, path, query_string, version, headers = self.parse_request_head(head)
+        keep_alive: bool = self.running and self.wants_keep_alive(version, headers)
+        body: bytes = connection.read_body(self.content_length(headers))
+        self.requests_handled += 1
+        if self.request_limit and self.requests_handled >= self.request_limit:
+            # Serve this one, then let the process be recycled
+            keep_alive = False
+            if self.running:
+                if self.on_request_limit is not None:
+                    self.on_request_limit()
+                else:
+                    self.stop_accepting()
+        return method, path, query_string, headers, body, keep_alive
+
+    def content_length(self, headers: Dict[str, str]) -> int:
+        """
+        Length of the request body. Bodies are only framed by Content-Length:
+        a chunked body left unread would be parsed as the next request on a
+        kept-alive connection, so Transfer-Encoding is refused outright.
+        """
+        if "TRANSFER_ENCODING" in headers:
+            raise BadRequest(NOT_IMPLEMENTED_RESPONSE)
+        value: str = headers.get("CONTENT_LENGTH", "")
+        if not value:
+            return 0
+        if not value.isdigit():
+            raise BadRequest()
+        return int(value)
+
+    def respond(
+        self,
+        connection: Connection,
+        method: str,
+        path: str,
+        query_string: str,
+        headers: Dict[str, str],
+        body: bytes,
+        keep_alive: bool,
+    ) -> Tuple[bytes, bool]:
+        """Run the WSGI app for one request. Returns the encoded response and keep-alive."""
+        # Wait for a worker slot according to the route's priority class
+        try:
+            ticket = self.schedule(method, path, headers)
+        except DeadlineExceeded:
+            return DEADLINE_EXCEEDED_RESPONSE, False
+        except SchedulerOverflow:
+            return self.admission.shed_response, False
+
+        # Start times of running requests, watched for hung handlers
+        ident: int = threading.get_ident()
+        self.active_requests[ident] = time.monotonic()
+        try:
             # Create WSGI environ
             environ: Dict[str, Any] = self.create_wsgi_environ(
-                method, path, query_string, headers, request_data
+                method,
+                path,
+                query_string,
+                headers,
+                body,
+                url_scheme="https" if connection.secure else "http",
+                remote_addr=connection.remote_addr,
             )
 
             response_data: List[Any] = []
@@ -153,13 +659,19 @@ class Server:
             # Get response from WSGI app
             response_body: List[Any] = self.wsgi_app(environ, start_response)
 
-            # Send HTTP response
-            self.send_response(client_socket, response_data, response_body)
+            upgrade = getattr(response_body, "upgrade", None)
+            if upgrade is not None:
+                # Protocol switch: nothing else may be sent on this connection
+                connection.upgrade = upgrade
+                keep_alive = False
 
-        except Exception as e:
-            print(f"Error handling request: {e}")
+            return (
+                self.encode_response(response_data, response_body, keep_alive),
+                keep_alive,
+            )
         finally:
-            client_socket.close()
+            self.active_requests.pop(ident, None)
+            self.scheduler.release(ticket)
 
     def create_wsgi_environ(
         self,
@@ -167,31 +679,21 @@ class Server:
         path: str,
         query_string: str,
         headers: Dict[str, str],
-        raw_request: str,
+        body: bytes,
+        url_scheme: str = "http",
+        remote_addr: str = "",
     ) -> Dict[str, Any]:
 
-        content_length = int(headers.get("CONTENT_LENGTH", "0"))
-
-        body = ""
-        if content_length > 0:
-            header_end = raw_request.find("\r\n\r\n")
-            if header_end != -1:
-                body = raw_request[header_end + 4 :]
-                # Ensure we have the full body
-                if self.socket and len(body.encode("utf-8")) < content_length:
-                    # Read additional data if needed
-                    remaining = content_length - len(body.encode("utf-8"))
-                    body += self.socket.recv(remaining).decode(
-                        "utf-8", errors="replace"
-                    )
-
-        data = self.parse_json(body, headers.get("CONTENT_TYPE", ""))
+        data = self.parse_json(
+            body.decode("utf-8", errors="replace"), headers.get("CONTENT_TYPE", "")
+        )
 
         request: Request = Request(
             method=method,
-            path=path,
+            # With the query string, which Request parses into query_params
+            path=f"{path}?{query_string}" if query_string else path,
             headers=list(headers.items()),
-            body=raw_request.encode("utf-8"),
+            body=body,
             data=data,
         )
 
@@ -205,15 +707,18 @@ class Server:
             "SERVER_NAME": self.host,
             "SERVER_PORT": str(self.port),
             "SERVER_PROTOCOL": "HTTP/1.1",
+            "REMOTE_ADDR": remote_addr,
             "wsgi.version": (1, 0),
-            "wsgi.url_scheme": "http",
-            "wsgi.input": StringIO(),  # For POST data
+            "wsgi.url_scheme": url_scheme,
+            "wsgi.input": BytesIO(body),
             "wsgi.errors": sys.stderr,
             "wsgi.multithread": True,
-            "wsgi.multiprocess": False,
+            "wsgi.multiprocess": self.multiprocess,
             "wsgi.run_once": False,
             "request": request,
         }
+        if url_scheme == "https":
+            environ["HTTPS"] = "on"
 
         # Add HTTP headers to environ
         for key, value in headers.items():
@@ -234,13 +739,25 @@ class Server:
 
     def send_response(
         self,
-        client_socket: socket.socket,
+        connection: Connection,
         response_data: List[Any],
         response_body: List[Any],
+        keep_alive: bool = False,
     ) -> None:
         """Send HTTP response back to client"""
-        status: str = response_data[0]
-        headers: List[Tuple[str, str]] = response_data[1]
+        connection.sendall(
+            self.encode_response(response_data, response_body, keep_alive)
+        )
+
+    def encode_response(
+        self,
+        response_data: List[Any],
+        response_body: List[Any],
+        keep_alive: bool = False,
+    ) -> bytes:
+        """Encode status, headers and body into a single HTTP response"""
+        status: str = status_line(response_data[0])
+        headers: List[Tuple[str, str]] = list(response_data[1])
 
         # Check if Content-Type is application/json
         is_json = any(
@@ -249,34 +766,107 @@ class Server:
             for header_name, header_value in headers
         )
 
+        # Encode the body up front so Content-Length is known
+        chunks: List[bytes] = []
+        for data in response_body:
+            if is_json and not isinstance(data, (bytes, bytearray)):
+                # Serialize to JSON if not already bytes
+                chunks.append(json.dumps(data).encode("utf-8"))
+            elif isinstance(data, str):
+                chunks.append(data.encode("utf-8"))
+            else:
+                chunks.append(data)
+        if hasattr(response_body, "close"):
+            response_body.close()
+        body: bytes = b"".join(chunks)
+
+        header_names = {header_name.lower() for header_name, _ in headers}
+        # Informational responses (101 Switching Protocols) carry no body and
+        # streams handed to the reactor end when the connection closes
+        streamed: bool = hasattr(response_body, "upgrade")
+        if (
+            "content-length" not in header_names
+            and not streamed
+            and not str(status).startswith("1")
+        ):
+            headers.append(("Content-Length", str(len(body))))
+        if not keep_alive and "connection" not in header_names:
+            headers.append(("Connection", "close"))
+
         # Build HTTP response
         response: str = f"HTTP/1.1 {status}\r\n"
         for header_name, header_value in headers:
             response += f"{header_name}: {header_value}\r\n"
         response += "\r\n"  # End of headers
 
-        # Send response headers
-        client_socket.send(response.encode("utf-8"))
+        # Headers and body go out in a single write
+        return response.encode("utf-8") + body
 
-        # Send response body
-        for data in response_body:
-            if is_json and not isinstance(data, (bytes, bytearray)):
-                # Serialize to JSON if not already bytes
-                client_socket.send(json.dumps(data).encode("utf-8"))
-            elif isinstance(data, str):
-                client_socket.send(data.encode("utf-8"))
-            else:
-                client_socket.send(data)
+    def stop_accepting(self) -> None:
+        """Stop the accept loop; the listening socket stays open until run() ends"""
+        self.running = False
+        try:
+            os.write(self._wakeup_w, b"x")
+        except OSError:
+            pass
+
+    def drain(self) -> bool:
+        """Wait for in-flight requests to finish. Returns False if the deadline passed."""
+        deadline: float = time.monotonic() + self.drain_timeout
+        # Long-lived connections on the reactor (WebSockets) are asked to go away
+        reactor.close_all()
+        while True:
+            with self._connections_lock:
+                connections = list(self.connections)
+            # Idle keep-alive connections have nothing in flight
+            busy = [c for c in connections if not c.close_if_idle()]
+            if not busy and not reactor.channels:
+                return True
+            if time.monotonic() >= deadline:
+                print(
+                    f"Drain timeout: abandoning "
+                    f"{len(busy) + len(reactor.channels)} connection(s)"
+                )
+                return False
+            time.sleep(0.05)
+
+    def reexec(self) -> None:
+        """Drain and re-execute this process in place, keeping the listening socket"""
+        self._restart = "exec"
+        self.stop_accepting()
 
     def stop_server(self) -> None:
         self.running = False
-        if self.socket:
-            self.socket.close()
+        # Unix socket files belong to whoever serves on them next after a
+        # handoff or re-exec, and to the master in multi-process mode
+        remove_files: bool = not (
+            self._handed_off or self._restart == "exec" or self.multiprocess
+        )
+        for sock in self.sockets:
+            path = sock.getsockname() if sock.family == socket.AF_UNIX else None
+            sock.close()
+            if remove_files and path and os.path.exists(path):
+                os.unlink(path)
         print("Server stopped")
 
     def run(self) -> None:
         self.start_server()
+        self.serve()
+
+    def serve(self) -> None:
+        """Accept connections until stopped, then drain (and re-exec if requested)"""
         try:
             self.accept_connections()
         except KeyboardInterrupt:
-            self.stop_server()
+            pass
+
+        self.running = False
+        print("Draining in-flight requests...")
+        self.drain()
+
+        if self._restart == "exec" and self.sockets:
+            self.export_listeners()
+            print("Restarting server process...")
+            os.execv(sys.executable, ["python"] + sys.argv)
+
+        self.stop_server()
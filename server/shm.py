@@ -0,0 +1,198 @@
+import hashlib
+import mmap
+import struct
+import time
+from multiprocessing import Lock
+from typing import Any, List, Optional, Tuple
+
+
+def key_hash(key: str) -> int:
+    """Stable, non-zero 64-bit hash of key (the same in every process)"""
+    value = int.from_bytes(
+        hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+    return value or 1
+
+
+class SharedTable:
+    """
+    SharedTable is a fixed-size hash table of fixed-size records in shared memory.
+
+    The table is an anonymous shared mmap: created before the server forks its
+    workers, every worker sees and updates the same records without a network
+    service. Each record starts with the 64-bit key hash and a last-used time,
+    followed by the subclass's fields.
+
+    The table is set-associative: a key hashes to one group of `probes`
+    consecutive slots and lives in one of them. When all slots of the group
+    belong to other keys the least recently used one is recycled, so the table
+    never grows and never fills up. Groups are guarded by `stripes`
+    process-shared locks (group index modulo stripes), so unrelated keys rarely
+    contend and never share a slot across locks.
+
+    Attributes:
+        slots (int): Number of records (rounded down to a multiple of probes).
+        record (struct.Struct): Layout of the fields after the record header.
+        payload (int): Raw bytes reserved after the fields of each record.
+        probes (int): Slots per group, i.e. examined per lookup.
+    """
+
+    HEADER = struct.Struct("<Qd")
+
+    def __init__(
+        self,
+        slots: int,
+        record: struct.Struct,
+        probes: int = 8,
+        stripes: int = 64,
+        payload: int = 0,
+    ) -> None:
+        self.groups = max(1, slots // probes)
+        self.slots = self.groups * probes
+        self.record = record
+        self.probes = probes
+        self.payload = payload
+        self.size = self.HEADER.size + record.size + payload
+        self._memory = mmap.mmap(-1, self.slots * self.size)
+        self._locks: List[Any] = [Lock() for _ in range(stripes)]
+
+    def _slot(self, hashed: int, now: float) -> Tuple[int, bool]:
+        """
+        Offset of the record for hashed, and whether it already existed.
+        A new record gets its header written. Caller holds the stripe lock.
+        """
+        start = (hashed % self.groups) * self.probes
+        victim, oldest = -1, float("inf")
+        for step in range(self.probes):
+            offset = (start + step) * self.size
+            stored, used = self.HEADER.unpack_from(self._memory, offset)
+            if stored == hashed:
+                return offset, True
+            # Free slots (hash 0, used 0.0) sort before any live record
+            if stored == 0:
+                used = -1.0
+            if used < oldest:
+                victim, oldest = offset, used
+        self.HEADER.pack_into(self._memory, victim, hashed, now)
+        return victim, False
+
+    def _find(self, hashed: int) -> int:
+        """Offset of the record for hashed, or -1. Caller holds the stripe lock."""
+        start = (hashed % self.groups) * self.probes
+        for step in range(self.probes):
+            offset = (start + step) * self.size
+            if self.HEADER.unpack_from(self._memory, offset)[0] == hashed:
+                return offset
+        return -1
+
+    def _lock(self, hashed: int) -> Any:
+        return self._locks[(hashed % self.groups) % len(self._locks)]
+
+    def read(self, key: str) -> Optional[Tuple[Any, ...]]:
+        """Fields stored for key, or None"""
+        hashed = key_hash(key)
+        with self._lock(hashed):
+            offset = self._find(hashed)
+            if offset < 0:
+                return None
+            return self.record.unpack_from(self._memory, offset + self.HEADER.size)
+
+    def delete(self, key: str) -> bool:
+        """Frees the record of key. Returns False if there was none."""
+        return self._free(key_hash(key))
+
+    def _free(self, hashed: int) -> bool:
+        with self._lock(hashed):
+            offset = self._find(hashed)
+            if offset < 0:
+                return False
+            self.HEADER.pack_into(self._memory, offset, 0, 0.0)
+        return True
+
+
+class TokenBucketTable(SharedTable):
+    """
+    Token buckets for rate limiting, shared by all worker processes.
+
+    Each bucket holds up to `burst` tokens and refills at `rate` tokens per
+    second; a request takes one token. Updates are O(1): one hash, at most
+    `probes` record reads and one write.
+
+    Methods:
+        take(key, rate, burst) -> float:
+            Takes a token. Returns 0.0 if allowed, else seconds until one is available.
+
+        refund(key, rate, burst):
+            Gives back a token taken for a request that was rejected elsewhere.
+    """
+
+    def __init__(self, slots: int = 65536, probes: int = 8, stripes: int = 64) -> None:
+        super().__init__(slots, struct.Struct("<d"), probes, stripes)
+
+    def take(self, key: str, rate: float, burst: float) -> float:
+        if rate <= 0:
+            raise ValueError("Token bucket rate must be positive")
+        hashed = key_hash(key)
+        now = time.monotonic()
+        with self._lock(hashed):
+            offset, existed = self._slot(hashed, now)
+            if existed:
+                _, updated = self.HEADER.unpack_from(self._memory, offset)
+                (tokens,) = self.record.unpack_from(
+                    self._memory, offset + self.HEADER.size
+                )
+                tokens = min(burst, tokens + (now - updated) * rate)
+            else:
+                tokens = burst
+
+            if tokens >= 1.0:
+                tokens -= 1.0
+                wait = 0.0
+            else:
+                wait = (1.0 - tokens) / rate
+            self.HEADER.pack_into(self._memory, offset, hashed, now)
+            self.record.pack_into(self._memory, offset + self.HEADER.size, tokens)
+        return wait
+
+    def refund(self, key: str, rate: float, burst: float) -> None:
+        hashed = key_hash(key)
+        now = time.monotonic()
+        with self._lock(hashed):
+            offset = self._find(hashed)
+            if offset < 0:
+                return
+            _, updated = self.HEADER.unpack_from(self._memory, offset)
+            (tokens,) = self.record.unpack_from(self._memory, offset + self.HEADER.size)
+            tokens = min(burst, tokens + (now - updated) * rate + 1.0)
+            self.HEADER.pack_into(self._memory, offset, hashed, now)
+            self.record.pack_into(self._memory, offset + self.HEADER.size, tokens)
+
+
+class CounterTable(SharedTable):
+    """
+    Named 64-bit counters shared by all worker processes.
+
+    Methods:
+        incr(key) -> int:
+            Adds one to the counter and returns the new value.
+
+        value(key) -> int:
+            Current value of the counter (0 if never incremented).
+    """
+
+    def __init__(self, slots: int = 4096, probes: int = 8, stripes: int = 16) -> None:
+        super().__init__(slots, struct.Struct("<Q"), probes, stripes)
+
+    def incr(self, key: str) -> int:
+        hashed = key_hash(key)
+        with self._lock(hashed):
+            offset, existed = self._slot(hashed, time.monotonic())
+            start = offset + self.HEADER.size
+            value = self.record.unpack_from(self._memory, start)[0] if existed else 0
+            value += 1
+            self.record.pack_into(self._memory, start, value)
+        return value
+
+    def value(self, key: str) -> int:
+        fields = self.read(key)
+        return fields[0] if fields is not None else 0
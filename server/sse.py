@@ -0,0 +1,202 @@
+import json
+import socket
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, List, Optional, Set, Tuple
+
+from server.metrics import metrics
+from server.reactor import Channel, Reactor, UpgradeBody
+from server.request import Request
+from server.timers import Timer, TimerWheel, timer_wheel
+
+
+KEEPALIVE_COMMENT: bytes = b": keepalive\n\n"
+
+
+def format_event(
+    data: Any,
+    event: Optional[str] = None,
+    id: Optional[str] = None,
+    retry: Optional[int] = None,
+) -> bytes:
+    """Encode one text/event-stream event; non-string data is sent as JSON"""
+    if not isinstance(data, str):
+        data = json.dumps(data)
+    lines: List[str] = []
+    if id is not None:
+        lines.append(f"id: {id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    if retry is not None:
+        lines.append(f"retry: {retry}")
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+class EventStream(Channel):
+    """
+    A text/event-stream connection on the Reactor.
+
+    The client sends nothing after its request, so incoming bytes are ignored
+    and only EOF matters. A comment line is written every `keepalive` seconds
+    so dead clients and idle-timeout proxies are noticed.
+
+    Attributes:
+        hub (BroadcastHub): The hub this stream is subscribed to.
+        keepalive (float): Seconds between keep-alive comments (0 disables).
+    """
+
+    def __init__(
+        self,
+        sock: socket.socket,
+        hub: "BroadcastHub",
+        last_event_id: Optional[str] = None,
+        keepalive: float = 15.0,
+        max_buffer: int = 256 * 1024,
+        loop: Optional[Reactor] = None,
+        wheel: Optional[TimerWheel] = None,
+    ) -> None:
+        super().__init__(sock, loop, max_buffer=max_buffer, high_water=max_buffer)
+        self.hub = hub
+        self.keepalive = keepalive
+        self._last_event_id = last_event_id
+        self._wheel = wheel or timer_wheel
+        self._timer: Optional[Timer] = None
+
+    def on_register(self) -> None:
+        self.hub.subscribe(self, self._last_event_id)
+        if self.keepalive:
+            self._timer = self._wheel.schedule(self.keepalive, self._ping)
+
+    def _ping(self) -> None:
+        if self.closed:
+            return
+        if not self.outbound:
+            self.write(KEEPALIVE_COMMENT)
+        self._timer = self._wheel.schedule(self.keepalive, self._ping)
+
+    def on_data(self, data: bytes) -> None:
+        pass
+
+    def on_close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self.hub.unsubscribe(self)
+
+
+class BroadcastHub:
+    """
+    BroadcastHub fans events out to every subscribed event stream.
+
+    publish() encodes an event once and writes the same bytes to each
+    subscriber. Writes never block the publisher: each client has a bounded
+    buffer and a client that falls `max_buffer` bytes behind is disconnected
+    (it reconnects and catches up from `history` using Last-Event-ID).
+
+    Attributes:
+        history (int): Number of recent events kept for reconnecting clients.
+        subscribers (Set[EventStream]): Connected streams.
+
+    Methods:
+        publish(data, event=None) -> int:
+            Sends an event to all subscribers. Returns how many received it.
+
+        subscribe(stream, last_event_id=None):
+            Adds a stream, replaying events it missed.
+
+        unsubscribe(stream):
+            Removes a stream.
+    """
+
+    def __init__(self, name: str = "default", history: int = 100) -> None:
+        self.name = name
+        self.history = history
+        self.subscribers: Set[EventStream] = set()
+        self._events: Deque[Tuple[int, bytes]] = deque(maxlen=history or None)
+        self._next_id = 1
+        # Re-entrant: dropping a slow subscriber mid-publish unsubscribes it
+        self._lock = threading.RLock()
+
+        metrics.gauge(f"sse.{name}.subscribers", lambda: len(self.subscribers))
+
+    def subscribe(self, stream: EventStream, last_event_id: Optional[str] = None) -> None:
+        with self._lock:
+            self.subscribers.add(stream)
+            if last_event_id is not None and last_event_id.isdigit():
+                seen = int(last_event_id)
+                for id, payload in self._events:
+                    if id > seen:
+                        stream.write(payload)
+
+    def unsubscribe(self, stream: EventStream) -> None:
+        with self._lock:
+            self.subscribers.discard(stream)
+
+    def publish(self, data: Any, event: Optional[str] = None) -> int:
+        delivered = 0
+        dropped = 0
+        # Writes never block, so fanning out under the lock keeps every
+        # subscriber's events in id order
+        with self._lock:
+            id = self._next_id
+            self._next_id += 1
+            payload = format_event(data, event=event, id=str(id))
+            if self.history:
+                self._events.append((id, payload))
+            for stream in list(self.subscribers):
+                if stream.write(payload):
+                    delivered += 1
+                else:
+                    dropped += 1
+        metrics.incr(f"sse.{self.name}.published")
+        if dropped:
+            metrics.incr(f"sse.{self.name}.dropped", dropped)
+        return delivered
+
+
+class EventStreamResponse:
+    """
+    Response subscribing the client to a BroadcastHub as a text/event-stream.
+
+    The response head is sent by the worker thread; the connection then moves
+    to the reactor, so subscribers hold no thread while they wait for events.
+
+    Attributes:
+        hub (BroadcastHub): Source of the events.
+        headers (List[Tuple[str, str]]): Headers of the stream response.
+        retry (Optional[int]): Reconnection delay in milliseconds sent to the client.
+
+    Methods:
+        to_wsgi_response(start_response):
+            Starts the stream and tells the server to hand the socket over.
+    """
+
+    def __init__(
+        self,
+        request: Request,
+        hub: BroadcastHub,
+        headers: Optional[List[Tuple[str, str]]] = None,
+        retry: Optional[int] = None,
+        **options: Any,
+    ) -> None:
+        self.status = 200
+        self.hub = hub
+        self.retry = retry
+        self.headers: List[Tuple[str, str]] = [
+            ("Content-Type", "text/event-stream"),
+            ("Cache-Control", "no-cache"),
+            ("X-Accel-Buffering", "no"),
+        ] + (headers or [])
+        last_event_id = request.get_header("LAST_EVENT_ID")
+
+        def upgrade(sock: socket.socket, buffered: bytes) -> None:
+            stream = EventStream(sock, hub, last_event_id, **options)
+            if self.retry is not None:
+                stream.write(f"retry: {self.retry}\n\n".encode("ascii"))
+            stream.reactor.register(stream)
+
+        self.upgrade: Callable[[socket.socket, bytes], None] = upgrade
+
+    def to_wsgi_response(self, start_response: Callable) -> UpgradeBody:
+        start_response("200 OK", self.headers)
+        return UpgradeBody(self.upgrade)
@@ -0,0 +1,291 @@
+import faulthandler
+import os
+import random
+import signal
+import sys
+import threading
+import time
+import traceback
+from multiprocessing import Array
+from typing import Any, Dict, Optional, Set
+
+from server.server import Server
+
+
+# Worker states shared with the master through shared memory
+SLOT_FREE = 0
+SLOT_RUNNING = 1
+SLOT_RETIRING = 2
+
+# Exit code of a worker that stopped because it reached its request limit
+EXIT_RECYCLE = 3
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes (0 if unknown)"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        return 0
+
+
+class Supervisor:
+    """
+    Supervisor runs a Server in several forked worker processes and keeps them healthy.
+
+    The master process binds the listening socket (or adopts an inherited one)
+    and forks `workers` processes that all accept from it. Each worker runs a
+    watchdog thread that retires the worker gracefully (stop accepting, drain,
+    exit) when:
+        - it has served `max_requests` requests, plus a random jitter of up to
+          `max_requests_jitter` so workers do not all recycle at once;
+        - its resident memory exceeds `max_rss_mb`;
+        - a request has been running longer than `hard_timeout`, after dumping
+          the stack of the stuck thread.
+
+    A retiring worker is replaced as soon as it stops accepting. The master also
+    watches a heartbeat each worker writes to shared memory; a worker whose
+    heartbeat is older than `hard_timeout` (e.g. stuck holding the GIL) gets its
+    stacks dumped with SIGUSR2 and is killed and replaced.
+
+    Signals to the master: SIGINT/SIGTERM stop all workers gracefully, SIGHUP
+    hands the socket to a new master, SIGUSR1 (reloader) re-executes in place.
+
+    Attributes:
+        server (Server): The configured server each worker runs.
+        workers (int): Number of worker processes.
+        max_requests (int): Requests before a worker is recycled (0 disables).
+        max_requests_jitter (int): Upper bound of the random extra requests.
+        max_rss_mb (int): Resident memory watermark in MiB (0 disables).
+        hard_timeout (float): Seconds after which a request counts as hung (0 disables).
+        check_interval (float): Seconds between health checks.
+        children (Dict[int, int]): Worker pid to slot index.
+
+    Methods:
+        run():
+            Starts the socket and workers and supervises them until stopped.
+    """
+
+    def __init__(
+        self,
+        server: Server,
+        workers: int = 2,
+        max_requests: int = 0,
+        max_requests_jitter: int = 0,
+        max_rss_mb: int = 0,
+        hard_timeout: float = 0,
+        check_interval: float = 1.0,
+    ) -> None:
+        self.server = server
+        self.workers = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.max_rss_mb = max_rss_mb
+        self.hard_timeout = hard_timeout
+        self.check_interval = check_interval
+        self.children: Dict[int, int] = {}
+        self.running = False
+        self._restart: Optional[str] = None
+        self._replaced: Set[int] = set()
+        self._slots_full = False
+        # Twice as many slots as workers so a retiring worker and its
+        # replacement can overlap
+        self._states = Array("b", workers * 2, lock=False)
+        self._heartbeats = Array("d", workers * 2, lock=False)
+
+    def _install_signal_handlers(self) -> None:
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGHUP, self._handoff)
+        signal.signal(signal.SIGUSR1, self._reexec)
+
+    def _stop(self, signum: int, frame: Any) -> None:
+        print("Stopping workers gracefully...")
+        self.running = False
+
+    def _reexec(self, signum: int, frame: Any) -> None:
+        self._restart = "exec"
+        self.running = False
+
+    def _handoff(self, signum: int, frame: Any) -> None:
+        def handoff() -> None:
+            if self.server.spawn_replacement():
+                self.running = False
+
+        threading.Thread(target=handoff, daemon=True).start()
+
+    def spawn(self) -> bool:
+        """Fork a worker into a free slot. Returns False if every slot is taken."""
+        slot = next(
+            (i for i, state in enumerate(self._states) if state == SLOT_FREE), None
+        )
+        if slot is None:
+            # Retiring workers still draining hold the spare slots; the next
+            # check retries once _reap() has freed one
+            if not self._slots_full:
+                print("No free worker slot, waiting for a retiring worker to exit")
+            self._slots_full = True
+            return False
+        self._slots_full = False
+        self._states[slot] = SLOT_RUNNING
+        self._heartbeats[slot] = time.monotonic()
+
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = self._run_worker(slot)
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(code)
+        self.children[pid] = slot
+        return True
+
+    def _run_worker(self, slot: int) -> int:
+        random.seed()
+        self.server.after_fork()
+        # Only the master reacts to terminal and restart signals
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+        faulthandler.register(signal.SIGUSR2, all_threads=True)
+
+        if self.max_requests:
+            limit = self.max_requests + random.randint(0, self.max_requests_jitter)
+            self.server.request_limit = limit
+            # Retire through the slot state so the master replaces it right away
+            self.server.on_request_limit = lambda: self._retire(
+                slot, f"served {limit} requests"
+            )
+
+        watchdog = threading.Thread(target=self._watch, args=(slot,), daemon=True)
+        watchdog.start()
+        print(f"Worker {os.getpid()} started")
+        self.server.serve()
+
+        limit = self.server.request_limit
+        if limit and self.server.requests_handled >= limit:
+            print(f"Worker {os.getpid()} recycled after {limit} requests")
+            return EXIT_RECYCLE
+        return 0
+
+    def _retire(self, slot: int, reason: str) -> None:
+        print(f"Worker {os.getpid()} retiring: {reason}")
+        self._states[slot] = SLOT_RETIRING
+        self.server.stop_accepting()
+
+    def _watch(self, slot: int) -> None:
+        """Worker-side health checks"""
+        while True:
+            now = time.monotonic()
+            self._heartbeats[slot] = now
+
+            if not self.server.running:
+                return
+
+            if self.max_rss_mb and current_rss() > self.max_rss_mb * 1024 * 1024:
+                self._retire(slot, f"RSS above {self.max_rss_mb} MiB")
+                return
+
+            if self.hard_timeout:
+                frames = sys._current_frames()
+                for ident, started in list(self.server.active_requests.items()):
+                    if now - started > self.hard_timeout and ident in frames:
+                        print(
+                            f"Worker {os.getpid()}: request running for "
+                            f"{now - started:.1f}s, stack of the stuck thread:",
+                            file=sys.stderr,
+                        )
+                        traceback.print_stack(frames[ident], file=sys.stderr)
+                        self._retire(slot, "hung request")
+                        return
+
+            time.sleep(self.check_interval)
+
+    def _reap(self) -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            slot = self.children.pop(pid, None)
+            if slot is None:
+                continue
+            state = self._states[slot]
+            self._states[slot] = SLOT_FREE
+            if pid in self._replaced:
+                self._replaced.discard(pid)
+            elif self.running:
+                code = os.waitstatus_to_exitcode(status)
+                if state != SLOT_RETIRING and code != EXIT_RECYCLE:
+                    print(f"Worker {pid} exited unexpectedly (code {code}), respawning")
+                self.spawn()
+
+    def _check_workers(self) -> None:
+        now = time.monotonic()
+        for pid, slot in list(self.children.items()):
+            if pid in self._replaced:
+                continue
+            if self._states[slot] == SLOT_RETIRING:
+                # Replace it right away; it finishes its in-flight requests alone
+                if self.spawn():
+                    self._replaced.add(pid)
+            elif self.hard_timeout and now - self._heartbeats[slot] > self.hard_timeout:
+                print(f"Worker {pid} stopped responding, dumping stacks and killing it")
+                try:
+                    os.kill(pid, signal.SIGUSR2)
+                    time.sleep(0.2)
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def _stop_workers(self) -> None:
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        deadline = time.monotonic() + self.server.drain_timeout + 5
+        while self.children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.05)
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            self.children.pop(pid, None)
+
+    def run(self) -> None:
+        self.server.start_server()
+        self._install_signal_handlers()
+        self.running = True
+        for _ in range(self.workers):
+            self.spawn()
+
+        while self.running:
+            self._reap()
+            self._check_workers()
+            time.sleep(self.check_interval / 4)
+
+        self._stop_workers()
+
+        if self._restart == "exec" and self.server.sockets:
+            self.server.export_listeners()
+            print("Restarting server process...")
+            os.execv(sys.executable, ["python"] + sys.argv)
+
+        self.server.stop_server()
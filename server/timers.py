@@ -0,0 +1,108 @@
+import threading
+import time
+from typing import Callable, List, Optional
+
+
+class Timer:
+    """A callback scheduled on a TimerWheel. Cancelling only flags it."""
+
+    __slots__ = ("callback", "rounds", "cancelled")
+
+    def __init__(self, callback: Callable[[], None], rounds: int) -> None:
+        self.callback = callback
+        self.rounds = rounds
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class TimerWheel:
+    """
+    TimerWheel is a hashed timing wheel driving all connection timeouts from a
+    single background thread.
+
+    Scheduling and cancelling a timer are O(1) list operations, so arming a new
+    timeout for every request phase costs no system call. Timers fire on the
+    first tick after they are due, i.e. with a resolution of `tick` seconds.
+
+    Attributes:
+        tick (float): Seconds between two advances of the wheel.
+        slots (List[List[Timer]]): Buckets of timers hashed by expiry tick.
+
+    Methods:
+        schedule(delay, callback) -> Timer:
+            Runs callback after delay seconds unless the returned Timer is cancelled.
+
+        start():
+            Starts the background thread (done automatically on first schedule).
+
+        stop():
+            Stops the background thread.
+    """
+
+    def __init__(self, tick: float = 0.1, size: int = 512) -> None:
+        self.tick = tick
+        self.slots: List[List[Timer]] = [[] for _ in range(size)]
+        self._cursor = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+    def schedule(self, delay: float, callback: Callable[[], None]) -> Timer:
+        if self._thread is None:
+            self.start()
+        ticks = max(1, int(delay / self.tick + 0.999999))
+        size = len(self.slots)
+        timer = Timer(callback, (ticks - 1) // size)
+        with self._lock:
+            self.slots[(self._cursor + ticks) % size].append(timer)
+        return timer
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._running = False
+
+    def _run(self) -> None:
+        next_tick = time.monotonic() + self.tick
+        while self._running:
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_tick += self.tick
+            self._advance()
+
+    def _advance(self) -> None:
+        due: List[Timer] = []
+        with self._lock:
+            self._cursor = (self._cursor + 1) % len(self.slots)
+            bucket = self.slots[self._cursor]
+            pending: List[Timer] = []
+            for timer in bucket:
+                if timer.cancelled:
+                    continue
+                if timer.rounds > 0:
+                    timer.rounds -= 1
+                    pending.append(timer)
+                else:
+                    due.append(timer)
+            self.slots[self._cursor] = pending
+
+        for timer in due:
+            # Cancelled after being collected: its owner has moved on
+            if timer.cancelled:
+                continue
+            try:
+                timer.callback()
+            except Exception as e:
+                print(f"Timer callback failed: {e}")
+
+
+timer_wheel: TimerWheel = TimerWheel()
@@ -0,0 +1,61 @@
+import ssl
+from typing import Optional, Sequence
+
+
+MINIMUM_VERSIONS = {
+    "TLSv1.2": ssl.TLSVersion.TLSv1_2,
+    "TLSv1.3": ssl.TLSVersion.TLSv1_3,
+}
+
+
+def create_ssl_context(
+    certfile: str,
+    keyfile: Optional[str] = None,
+    password: Optional[str] = None,
+    ca_certs: Optional[str] = None,
+    verify_client: bool = False,
+    ciphers: Optional[str] = None,
+    minimum_version: str = "TLSv1.2",
+    alpn_protocols: Sequence[str] = ("http/1.1",),
+    session_tickets: int = 2,
+) -> ssl.SSLContext:
+    """
+    Build the server-side SSLContext used to terminate TLS on the listeners.
+
+    Repeat clients resume their session instead of doing a full handshake:
+    TLS 1.3 clients through `session_tickets` tickets issued per handshake,
+    TLS 1.2 clients through tickets or OpenSSL's server session cache. Ticket
+    keys belong to the context, so worker processes forked after it is created
+    accept each other's tickets. `session_tickets=0` disables tickets.
+
+    Args:
+        certfile (str): PEM certificate chain.
+        keyfile (Optional[str]): PEM private key, if not included in certfile.
+        password (Optional[str]): Password of an encrypted private key.
+        ca_certs (Optional[str]): CA bundle used to verify client certificates.
+        verify_client (bool): Require a client certificate signed by ca_certs.
+        ciphers (Optional[str]): OpenSSL cipher string for TLS 1.2.
+        minimum_version (str): "TLSv1.2" or "TLSv1.3".
+        alpn_protocols (Sequence[str]): Protocols offered through ALPN.
+        session_tickets (int): Session tickets issued per TLS 1.3 handshake.
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = MINIMUM_VERSIONS[minimum_version]
+    context.load_cert_chain(certfile, keyfile, password)
+    if ca_certs:
+        context.load_verify_locations(ca_certs)
+    if verify_client:
+        context.verify_mode = ssl.CERT_REQUIRED
+    if ciphers:
+        context.set_ciphers(ciphers)
+    if alpn_protocols:
+        context.set_alpn_protocols(list(alpn_protocols))
+
+    context.options |= ssl.OP_NO_COMPRESSION | ssl.OP_CIPHER_SERVER_PREFERENCE
+    if session_tickets:
+        context.options &= ~ssl.OP_NO_TICKET
+        context.num_tickets = session_tickets
+    else:
+        context.options |= ssl.OP_NO_TICKET
+        context.num_tickets = 0
+    return context
@@ -1,5 +1,5 @@
 import re
-from typing import Callable, Dict, List, Optional, Any
+from typing import Callable, Dict, List, Optional, Any, Tuple, Type
 
 from server.response import Response, JSONResponse
 from server.request import Request
@@ -15,14 +15,20 @@ class UrlHandler:
         - Converts URL parameters to specified types (int, float, str).
         - Handles requests by matching paths and invoking corresponding handlers.
         - Returns appropriate HTTP responses for not found, method not allowed, and server errors.
+        - Lets routes declare a priority class ("high", "normal", "low") and a maximum
+          concurrency, used by the server's RequestScheduler.
 
     Attributes:
         routes (Dict[str, Dict[str, Any]]): Stores static routes.
         regex_routes (Dict[str, Dict[str, Any]]): Stores parameterized routes with regex patterns.
 
     Methods:
-        add_route(path, handler, methods=None):
-            Registers a route with the given path, handler, and allowed HTTP methods.
+        add_route(path, handler, methods=None, priority="normal", max_concurrency=None):
+            Registers a route with the given path, handler, allowed HTTP methods and
+            scheduling options.
+
+        resolve(path):
+            Returns the route info and raw URL parameters matching path.
 
         get(path, handler):
             Registers a GET route.
@@ -39,6 +45,9 @@ class UrlHandler:
         delete(path, handler):
             Registers a DELETE route.
 
+        websocket(path, handler, **options):
+            Registers a WebSocket endpoint served by a WebSocketHandler subclass.
+
         handle_request(path, request, method="GET"):
             Handles an incoming request, matches the path, and invokes the appropriate handler.
 
@@ -74,6 +83,8 @@ class UrlHandler:
         path: str,
         handler: Callable[..., Any],
         methods: Optional[List[str]] = None,
+        priority: str = "normal",
+        max_concurrency: Optional[int] = None,
     ) -> None:
 
         if methods is None:
@@ -81,15 +92,41 @@ class UrlHandler:
 
         if "<" in path and ">" in path:
             # Handle both <param> and <type:param> syntax
-            regex_path: str = self._convert_path_to_regex(path)
-            self.regex_routes[regex_path] = {
-                "handler": handler,
-                "methods": methods,
+            table = self.regex_routes
+            key: str = self._convert_path_to_regex(path)
+            route_info: Dict[str, Any] = {
                 "original_path": path,
                 "param_types": self._extract_param_types(path),
             }
         else:
-            self.routes[path] = {"handler": handler, "methods": methods}
+            table, key, route_info = self.routes, path, {}
+
+        # Several methods may be registered on one path, each with its handler
+        existing = table.get(key)
+        handlers: Dict[str, Callable[..., Any]] = dict(
+            existing["handlers"] if existing else {}
+        )
+        handlers.update((method, handler) for method in methods)
+        table[key] = {
+            **route_info,
+            "handler": handler,
+            "handlers": handlers,
+            "methods": list(handlers),
+            "priority": priority,
+            "max_concurrency": max_concurrency,
+        }
+
+    def resolve(self, path: str) -> Tuple[Optional[Dict[str, Any]], Dict[str, str]]:
+        """Find the route registered for path and its raw URL parameters"""
+        if path in self.routes:
+            return self.routes[path], {}
+
+        for pattern, route_info in self.regex_routes.items():
+            match: Optional[re.Match[str]] = re.match(pattern, path)
+            if match:
+                return route_info, match.groupdict()
+
+        return None, {}
 
     def _convert_path_to_regex(self, path: str) -> str:
         """Convert URL path with parameters to regex pattern"""
@@ -108,8 +145,9 @@ class UrlHandler:
 
         pattern = re.sub(r"<(int|float|str):(\w+)>", typed_replacer, path)
 
-        # Replace untyped parameters like <id> (default to str)
-        pattern = re.sub(r"<(\w+)>", r"(?P<\1>[^/]+)", pattern)
+        # Replace untyped parameters like <id> (default to str), leaving the
+        # group names produced above alone
+        pattern = re.sub(r"(?<!\?P)<(\w+)>", r"(?P<\1>[^/]+)", pattern)
 
         return f"^{pattern}$"
 
@@ -150,58 +188,92 @@ class UrlHandler:
                 converted[name] = value
         return converted
 
-    def get(self, path: str, handler: Callable):
+    def get(
+        self,
+        path: str,
+        handler: Callable,
+        priority: str = "normal",
+        max_concurrency: Optional[int] = None,
+    ):
         """Add GET route"""
-        self.add_route(path, handler, ["GET"])
+        self.add_route(path, handler, ["GET"], priority, max_concurrency)
 
-    def post(self, path: str, handler: Callable):
+    def post(
+        self,
+        path: str,
+        handler: Callable,
+        priority: str = "normal",
+        max_concurrency: Optional[int] = None,
+    ):
         """Add POST route"""
-        self.add_route(path, handler, ["POST"])
+        self.add_route(path, handler, ["POST"], priority, max_concurrency)
 
-    def put(self, path: str, handler: Callable):
+    def put(
+        self,
+        path: str,
+        handler: Callable,
+        priority: str = "normal",
+        max_concurrency: Optional[int] = None,
+    ):
         """Add PUT route"""
-        self.add_route(path, handler, ["PUT"])
+        self.add_route(path, handler, ["PUT"], priority, max_concurrency)
 
-    def patch(self, path: str, handler: Callable):
+    def patch(
+        self,
+        path: str,
+        handler: Callable,
+        priority: str = "normal",
+        max_concurrency: Optional[int] = None,
+    ):
         """Add PATCH route"""
-        self.add_route(path, handler, ["PATCH"])
+        self.add_route(path, handler, ["PATCH"], priority, max_concurrency)
 
-    def delete(self, path: str, handler: Callable):
+    def delete(
+        self,
+        path: str,
+        handler: Callable,
+        priority: str = "normal",
+        max_concurrency: Optional[int] = None,
+    ):
         """Add DELETE route"""
-        self.add_route(path, handler, ["DELETE"])
+        self.add_route(path, handler, ["DELETE"], priority, max_concurrency)
+
+    def websocket(self, path: str, handler: Type[Any], **options: Any):
+        """
+        Add WebSocket route.
+
+        handler is a WebSocketHandler subclass, instantiated per connection.
+        options (max_message_size, ping_interval, max_buffer) configure the
+        WebSocket. The route runs with high priority since the upgrade is quick
+        and the connection then leaves the worker pool.
+        """
+        from server.websocket import websocket_endpoint
+
+        self.add_route(path, websocket_endpoint(handler, **options), ["GET"], "high")
 
     def handle_request(
         self, path: str, request: Request, method: str = "GET"
     ) -> Response:
         try:
 
-            if path in self.routes:
-                route_info: Dict[str, Any] = self.routes[path]
-                if method in route_info["methods"]:
-                    result = route_info["handler"](request)
-                    return self._convert_to_response(result)
-                else:
-                    return self.method_not_allowed(request)
-
-            for pattern, route_info in self.regex_routes.items():
-                match: Optional[re.Match[str]] = re.match(pattern, path)
-                if match:
-                    if method in route_info["methods"]:
-
-                        url_params = match.groupdict()
+            route_info, url_params = self.resolve(path)
+            if route_info is None:
+                return self.not_found(request)
 
-                        if "param_types" in route_info:
-                            url_params = self._convert_param_types(
-                                url_params, route_info["param_types"]
-                            )
+            if method not in route_info["methods"]:
+                return self.method_not_allowed(request)
 
-                        request.url_params = url_params
-                        result = route_info["handler"](request, **url_params)
-                        return self._convert_to_response(result)
-                    else:
-                        return self.method_not_allowed(request)
+            handler = route_info["handlers"].get(method, route_info["handler"])
+            if "param_types" not in route_info:
+                result = handler(request)
+                return self._convert_to_response(result)
 
-            return self.not_found(request)
+            url_params = self._convert_param_types(
+                url_params, route_info["param_types"]
+            )
+            request.url_params = url_params
+            result = handler(request, **url_params)
+            return self._convert_to_response(result)
 
         except Exception as e:
             return self.server_error(request)
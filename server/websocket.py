@@ -0,0 +1,388 @@
+import base64
+import hashlib
+import socket
+import struct
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, Union
+
+from server.metrics import metrics
+from server.reactor import Channel, Reactor, UpgradeBody
+from server.request import Request
+from server.response import Response
+from server.timers import Timer, TimerWheel, timer_wheel
+
+
+GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+CLOSE_NORMAL = 1000
+CLOSE_GOING_AWAY = 1001
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_INVALID_DATA = 1007
+CLOSE_TOO_BIG = 1009
+CLOSE_INTERNAL_ERROR = 1011
+
+
+class ProtocolError(Exception):
+    """Raised when a peer violates RFC 6455; carries the close code to send"""
+
+    def __init__(self, code: int, reason: str) -> None:
+        super().__init__(reason)
+        self.code = code
+        self.reason = reason
+
+
+def accept_key(key: str) -> str:
+    """Sec-WebSocket-Accept value for a client's Sec-WebSocket-Key"""
+    digest = hashlib.sha1((key + GUID).encode("ascii")).digest()
+    return base64.b64encode(digest).decode("ascii")
+
+
+def apply_mask(payload: memoryview, mask: bytes) -> bytes:
+    """XOR payload with the 4-byte mask, as one big-integer operation"""
+    length = len(payload)
+    if not length:
+        return b""
+    key = (mask * (length // 4 + 1))[:length]
+    return (
+        int.from_bytes(payload, "big") ^ int.from_bytes(key, "big")
+    ).to_bytes(length, "big")
+
+
+def encode_frame(opcode: int, payload: bytes = b"", fin: bool = True) -> bytes:
+    """Encode an unmasked server-to-client frame"""
+    first = (0x80 if fin else 0) | opcode
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", first, length)
+    elif length < 65536:
+        header = struct.pack("!BBH", first, 126, length)
+    else:
+        header = struct.pack("!BBQ", first, 127, length)
+    return header + payload
+
+
+def parse_frame(
+    view: memoryview, offset: int, max_size: int
+) -> Optional[Tuple[bool, int, bytes, int]]:
+    """
+    Parse one client frame starting at offset.
+
+    Returns (fin, opcode, unmasked payload, offset after the frame), or None if
+    the frame is not complete yet. Raises ProtocolError on malformed frames.
+    """
+    available = len(view) - offset
+    if available < 2:
+        return None
+    first, second = view[offset], view[offset + 1]
+    if first & 0x70:
+        raise ProtocolError(CLOSE_PROTOCOL_ERROR, "reserved bits set")
+    if not second & 0x80:
+        raise ProtocolError(CLOSE_PROTOCOL_ERROR, "client frames must be masked")
+
+    position = offset + 2
+    length = second & 0x7F
+    if length == 126:
+        if available < 4:
+            return None
+        length = int.from_bytes(view[position : position + 2], "big")
+        position += 2
+    elif length == 127:
+        if available < 10:
+            return None
+        length = int.from_bytes(view[position : position + 8], "big")
+        position += 8
+    if length > max_size:
+        raise ProtocolError(CLOSE_TOO_BIG, "frame too large")
+
+    end = position + 4 + length
+    if len(view) < end:
+        return None
+    mask = bytes(view[position : position + 4])
+    payload = apply_mask(view[position + 4 : end], mask)
+    return bool(first & 0x80), first & 0x0F, payload, end
+
+
+class WebSocketHandler:
+    """
+    Base class for WebSocket endpoints, registered with url_handler.websocket().
+
+    One instance is created per connection. Callbacks run on the reactor thread
+    and must not block; use ws.send() to reply, it never waits for the client.
+
+    Methods:
+        on_open(ws):
+            Called once the upgrade has been sent.
+
+        on_message(ws, message):
+            Called with each complete text (str) or binary (bytes) message.
+
+        on_close(ws, code, reason):
+            Called once when the connection is gone.
+    """
+
+    def on_open(self, ws: "WebSocket") -> None:
+        pass
+
+    def on_message(self, ws: "WebSocket", message: Union[str, bytes]) -> None:
+        pass
+
+    def on_close(self, ws: "WebSocket", code: int, reason: str) -> None:
+        pass
+
+
+class WebSocket(Channel):
+    """
+    WebSocket is a server-side RFC 6455 connection running on the Reactor.
+
+    Frames are parsed in place from the receive buffer through memoryviews and
+    unmasked with a single integer XOR. A ping is sent every `ping_interval`
+    seconds from the shared TimerWheel; a client that has not answered by the
+    next one is disconnected. Outgoing messages are subject to the channel's
+    backpressure limits.
+
+    Attributes:
+        handler (WebSocketHandler): The endpoint instance for this connection.
+        request (Request): The upgrade request.
+        url_params (Dict[str, Any]): Parameters captured from the route path.
+        max_message_size (int): Largest accepted message in bytes.
+        ping_interval (float): Seconds between keep-alive pings (0 disables).
+        close_code (Optional[int]): Close code received from or sent to the client.
+
+    Methods:
+        send(message) -> bool:
+            Sends a text (str) or binary (bytes) message.
+
+        ping(payload=b""):
+            Sends a ping frame.
+
+        disconnect(code=1000, reason=""):
+            Starts the closing handshake.
+    """
+
+    def __init__(
+        self,
+        sock: socket.socket,
+        handler: WebSocketHandler,
+        request: Request,
+        url_params: Optional[Dict[str, Any]] = None,
+        max_message_size: int = 1024 * 1024,
+        ping_interval: float = 20.0,
+        max_buffer: int = 1024 * 1024,
+        loop: Optional[Reactor] = None,
+        wheel: Optional[TimerWheel] = None,
+    ) -> None:
+        super().__init__(sock, loop, max_buffer=max_buffer)
+        self.handler = handler
+        self.request = request
+        self.url_params = url_params or {}
+        self.max_message_size = max_message_size
+        self.ping_interval = ping_interval
+        self.close_code: Optional[int] = None
+        self.close_reason: str = ""
+        self.inbound = bytearray()
+        self._fragments: List[bytes] = []
+        self._fragment_opcode: Optional[int] = None
+        self._fragment_size = 0
+        self._close_sent = False
+        self._awaiting_pong = False
+        self._wheel = wheel or timer_wheel
+        self._timer: Optional[Timer] = None
+        self._buffered = b""
+
+    def start(self, buffered: bytes = b"") -> None:
+        """Hand the connection to the reactor; buffered holds bytes read past the upgrade"""
+        metrics.incr("websocket.opened")
+        self._buffered = buffered
+        self.reactor.register(self)
+
+    def on_register(self) -> None:
+        if self.ping_interval:
+            self._timer = self._wheel.schedule(self.ping_interval, self._keepalive)
+        self._call(self.handler.on_open, self)
+        if self._buffered and not self.closed:
+            buffered, self._buffered = self._buffered, b""
+            self.on_data(buffered)
+
+    def send(self, message: Union[str, bytes]) -> bool:
+        if isinstance(message, str):
+            return self.write(encode_frame(OP_TEXT, message.encode("utf-8")))
+        return self.write(encode_frame(OP_BINARY, bytes(message)))
+
+    def ping(self, payload: bytes = b"") -> None:
+        self.write(encode_frame(OP_PING, payload))
+
+    def disconnect(self, code: int = CLOSE_NORMAL, reason: str = "") -> None:
+        if not self._close_sent:
+            self._close_sent = True
+            if self.close_code is None:
+                self.close_code, self.close_reason = code, reason
+            self.write(encode_frame(OP_CLOSE, struct.pack("!H", code) + reason.encode()))
+        self.close(after_flush=True)
+
+    def shutdown(self) -> None:
+        self.disconnect(CLOSE_GOING_AWAY, "server shutting down")
+
+    def _keepalive(self) -> None:
+        if self.closed:
+            return
+        if self._awaiting_pong:
+            metrics.incr("websocket.ping_timeout")
+            self.close()
+            return
+        self._awaiting_pong = True
+        self.ping()
+        self._timer = self._wheel.schedule(self.ping_interval, self._keepalive)
+
+    def _call(self, callback: Callable[..., None], *args: Any) -> None:
+        try:
+            callback(*args)
+        except Exception as e:
+            print(f"Error in WebSocket handler: {e}")
+            self.disconnect(CLOSE_INTERNAL_ERROR, "handler error")
+
+    def on_data(self, data: bytes) -> None:
+        self.inbound += data
+        # Any traffic shows the client is alive
+        self._awaiting_pong = False
+        view = memoryview(self.inbound)
+        offset = 0
+        try:
+            while not self.closed:
+                frame = parse_frame(view, offset, self.max_message_size)
+                if frame is None:
+                    break
+                fin, opcode, payload, offset = frame
+                self._on_frame(fin, opcode, payload)
+        except ProtocolError as e:
+            metrics.incr("websocket.protocol_error")
+            self.disconnect(e.code, e.reason)
+        finally:
+            view.release()
+        del self.inbound[:offset]
+
+    def _on_frame(self, fin: bool, opcode: int, payload: bytes) -> None:
+        if opcode >= OP_CLOSE:
+            if not fin or len(payload) > 125:
+                raise ProtocolError(CLOSE_PROTOCOL_ERROR, "invalid control frame")
+            if opcode == OP_PING:
+                self.write(encode_frame(OP_PONG, payload))
+            elif opcode == OP_CLOSE:
+                code = struct.unpack("!H", payload[:2])[0] if len(payload) >= 2 else CLOSE_NORMAL
+                if self.close_code is None:
+                    self.close_code = code
+                    self.close_reason = payload[2:].decode("utf-8", errors="replace")
+                self.disconnect(code)
+            elif opcode != OP_PONG:
+                raise ProtocolError(CLOSE_PROTOCOL_ERROR, "unknown opcode")
+            return
+
+        if opcode == OP_CONTINUATION:
+            if self._fragment_opcode is None:
+                raise ProtocolError(CLOSE_PROTOCOL_ERROR, "unexpected continuation")
+        elif opcode in (OP_TEXT, OP_BINARY):
+            if self._fragment_opcode is not None:
+                raise ProtocolError(CLOSE_PROTOCOL_ERROR, "expected continuation")
+            if fin:
+                self._deliver(opcode, payload)
+                return
+            self._fragment_opcode = opcode
+        else:
+            raise ProtocolError(CLOSE_PROTOCOL_ERROR, "unknown opcode")
+
+        self._fragment_size += len(payload)
+        if self._fragment_size > self.max_message_size:
+            raise ProtocolError(CLOSE_TOO_BIG, "message too large")
+        self._fragments.append(payload)
+        if fin:
+            opcode, message = self._fragment_opcode, b"".join(self._fragments)
+            self._fragments, self._fragment_opcode, self._fragment_size = [], None, 0
+            self._deliver(opcode, message)
+
+    def _deliver(self, opcode: int, payload: bytes) -> None:
+        message: Union[str, bytes] = payload
+        if opcode == OP_TEXT:
+            try:
+                message = payload.decode("utf-8")
+            except UnicodeDecodeError:
+                raise ProtocolError(CLOSE_INVALID_DATA, "invalid UTF-8")
+        metrics.incr("websocket.messages_in")
+        self._call(self.handler.on_message, self, message)
+
+    def on_close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        metrics.incr("websocket.closed")
+        code = self.close_code if self.close_code is not None else 1006
+        try:
+            self.handler.on_close(self, code, self.close_reason)
+        except Exception as e:
+            print(f"Error in WebSocket handler: {e}")
+
+
+class WebSocketUpgrade:
+    """
+    Response switching a request to the WebSocket protocol.
+
+    Attributes:
+        headers (List[Tuple[str, str]]): Headers of the 101 response.
+        upgrade (Callable): Starts the WebSocket on the detached socket.
+
+    Methods:
+        to_wsgi_response(start_response):
+            Starts a 101 response whose body tells the server to hand the socket over.
+    """
+
+    def __init__(
+        self,
+        request: Request,
+        handler: Type[WebSocketHandler],
+        url_params: Dict[str, Any],
+        **options: Any,
+    ) -> None:
+        self.status = 101
+        self.headers: List[Tuple[str, str]] = [
+            ("Upgrade", "websocket"),
+            ("Connection", "Upgrade"),
+            ("Sec-WebSocket-Accept", accept_key(request.get_header("SEC_WEBSOCKET_KEY") or "")),
+        ]
+
+        def upgrade(sock: socket.socket, buffered: bytes) -> None:
+            WebSocket(sock, handler(), request, url_params, **options).start(buffered)
+
+        self.upgrade = upgrade
+
+    def to_wsgi_response(self, start_response: Callable) -> UpgradeBody:
+        start_response("101 Switching Protocols", self.headers)
+        return UpgradeBody(self.upgrade)
+
+
+def websocket_endpoint(
+    handler: Type[WebSocketHandler], **options: Any
+) -> Callable[..., Any]:
+    """Wrap a WebSocketHandler class into a route handler performing the upgrade"""
+
+    def endpoint(request: Request, **url_params: Any) -> Any:
+        upgrade = (request.get_header("UPGRADE") or "").lower()
+        version = request.get_header("SEC_WEBSOCKET_VERSION")
+        key = request.get_header("SEC_WEBSOCKET_KEY")
+        if upgrade != "websocket" or not key:
+            return Response(
+                body="<h1>426 Upgrade Required</h1><p>This endpoint only accepts WebSocket connections.</p>",
+                status=426,
+                headers=[("Content-Type", "text/html"), ("Upgrade", "websocket")],
+            )
+        if version != "13":
+            return Response(
+                body="Unsupported WebSocket version",
+                status=400,
+                headers=[("Content-Type", "text/plain"), ("Sec-WebSocket-Version", "13")],
+            )
+        return WebSocketUpgrade(request, handler, url_params, **options)
+
+    return endpoint
@@ -24,7 +24,8 @@ def app(
     """
 
     request: Request = environ.get("request", {})
-    path: str = request.path
+    # request.path keeps the query string for query_params; route on the path alone
+    path: str = environ.get("PATH_INFO", request.path)
     method: str = request.method.upper()
 
     response_obj = url_handler.handle_request(path, request, method)
@@ -37,8 +38,10 @@ def app(
     status_text: str = {
         200: "200 OK",
         201: "201 Created",
+        400: "400 Bad Request",
         404: "404 Not Found",
         405: "405 Method Not Allowed",
+        426: "426 Upgrade Required",
         500: "500 Internal Server Error",
     }.get(int(response_obj.status), f"{response_obj.status} UNKNOWN")
 